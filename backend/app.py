@@ -1,213 +1,263 @@
-from flask import Flask, request, jsonify
-from flask_cors import CORS
-import os
-import uuid
-from datetime import datetime
-from dotenv import load_dotenv
-from pharmacogenomics.vcf_parser import parse_vcf
-from pharmacogenomics.rules_engine import determine_phenotype, assess_risk
-from pharmacogenomics.cpic_mappings import DRUG_GENE_MAP
-from pharmacogenomics.llm_explainer import generate_explanation
-import tempfile
-
-# Load environment variables
-load_dotenv()
-
-app = Flask(__name__)
-CORS(app)
-
-SUPPORTED_DRUGS = ['CODEINE', 'WARFARIN', 'CLOPIDOGREL', 'SIMVASTATIN', 'AZATHIOPRINE', 'FLUOROURACIL']
-
-@app.route('/analyze', methods=['POST'])
-def analyze():
-    """Analyze VCF file and return pharmacogenomic risk assessment."""
-    try:
-        # Validate drug input
-        drugs_input = request.form.get('drugs', '').strip()
-        if not drugs_input:
-            return jsonify({'error': 'No drugs specified'}), 400
-        
-        drugs = [d.strip().upper() for d in drugs_input.split(',') if d.strip()]
-        
-        # Validate VCF file
-        vcf_file = request.files.get('vcf')
-        if not vcf_file:
-            return jsonify({'error': 'No VCF file uploaded'}), 400
-        
-        if not vcf_file.filename.endswith('.vcf'):
-            return jsonify({'error': 'Invalid file format. Expected .vcf file'}), 400
-        
-        # Save to temp file
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.vcf', mode='w', encoding='utf-8') as tmp:
-            content = vcf_file.stream.read().decode('utf-8')
-            tmp.write(content)
-            tmp_path = tmp.name
-        
-        # Parse VCF
-        try:
-            parse_result = parse_vcf(tmp_path)
-            variants = parse_result['variants']
-            vcf_version = parse_result['vcf_version']
-            missing_annotations = parse_result['missing_annotations']
-        except Exception as e:
-            os.unlink(tmp_path)
-            return jsonify({'error': f'VCF parsing failed: {str(e)}'}), 400
-        finally:
-            if os.path.exists(tmp_path):
-                os.unlink(tmp_path)
-        
-        if not variants:
-            return jsonify({
-                'error': 'No pharmacogenomic variants found in VCF',
-                'message': 'VCF must contain variants in genes: CYP2D6, CYP2C19, CYP2C9, SLCO1B1, TPMT, DPYD'
-            }), 400
-        
-        # Group variants by gene
-        gene_variants = {}
-        for v in variants:
-            gene = v['gene']
-            if gene not in gene_variants:
-                gene_variants[gene] = []
-            gene_variants[gene].append(v)
-        
-        # Process each drug
-        results = []
-        patient_id = f"PATIENT_{uuid.uuid4().hex[:8].upper()}"
-        
-        for drug in drugs:
-            # Validate drug support
-            if drug not in SUPPORTED_DRUGS:
-                results.append({
-                    'patient_id': patient_id,
-                    'drug': drug,
-                    'timestamp': datetime.utcnow().isoformat() + 'Z',
-                    'error': f'Unsupported drug. Supported drugs: {", ".join(SUPPORTED_DRUGS)}',
-                    'risk_assessment': {
-                        'risk_label': 'Unknown',
-                        'confidence_score': 0.0,
-                        'severity': 'unknown'
-                    }
-                })
-                continue
-            
-            # Get primary gene for drug
-            gene = DRUG_GENE_MAP[drug]
-            variants_for_gene = gene_variants.get(gene, [])
-            
-            # Determine phenotype and risk
-            if not variants_for_gene:
-                phenotype = 'Unknown'
-                diplotype = 'Unknown'
-                risk_label, severity, recommendation, alternatives = assess_risk(drug, phenotype)
-                confidence = 0.5
-                detected = []
-                # Use empty list for explanation when no variants
-                explanation_variants = []
-            else:
-                # Extract star alleles
-                star_alleles = [v['star_allele'] for v in variants_for_gene if v['star_allele']]
-                
-                # Determine diplotype
-                if len(star_alleles) >= 2:
-                    diplotype = f"{star_alleles[0]}/{star_alleles[1]}"
-                elif len(star_alleles) == 1:
-                    diplotype = f"{star_alleles[0]}/*1"  # Assume wild-type for missing allele
-                else:
-                    diplotype = 'Unknown'
-                
-                # Determine phenotype
-                phenotype = determine_phenotype(gene, star_alleles)
-                
-                # Assess risk
-                risk_label, severity, recommendation, alternatives = assess_risk(drug, phenotype)
-                
-                # Calculate confidence based on variant quality
-                avg_quality = sum([v['quality'] for v in variants_for_gene]) / len(variants_for_gene)
-                confidence = min(0.95, 0.7 + (avg_quality / 100) * 0.25)
-                
-                # Build detected variants list
-                detected = [{
-                    'rsid': v['rsid'],
-                    'gene': v['gene'],
-                    'allele': v['star_allele']
-                } for v in variants_for_gene]
-                
-                # Use variants for explanation
-                explanation_variants = variants_for_gene
-            
-            # Generate LLM explanation
-            explanation = generate_explanation(patient_id, drug, risk_label, phenotype, explanation_variants, gene)
-            
-            # Build output JSON matching EXACT schema
-            result = {
-                'patient_id': patient_id,
-                'drug': drug,
-                'timestamp': datetime.utcnow().isoformat() + 'Z',
-                'risk_assessment': {
-                    'risk_label': risk_label,
-                    'confidence_score': round(confidence, 2),
-                    'severity': severity
-                },
-                'pharmacogenomic_profile': {
-                    'primary_gene': gene,
-                    'diplotype': diplotype,
-                    'phenotype': phenotype,
-                    'detected_variants': detected
-                },
-                'clinical_recommendation': {
-                    'guideline_source': 'CPIC',
-                    'recommendation': recommendation,
-                    'alternative_drugs': alternatives
-                },
-                'llm_generated_explanation': explanation,
-                'quality_metrics': {
-                    'vcf_parsing_success': True,
-                    'missing_annotations': missing_annotations,
-                    'confidence_level': 'high' if confidence > 0.8 else 'medium' if confidence > 0.5 else 'low'
-                }
-            }
-            results.append(result)
-        
-        # Return single object if one drug, array if multiple
-        return jsonify(results if len(results) > 1 else results[0]), 200
-    
-    except Exception as e:
-        return jsonify({'error': f'Internal server error: {str(e)}'}), 500
-
-@app.route('/', methods=['GET'])
-def index():
-    """API information endpoint."""
-    return jsonify({
-        'service': 'PharmaGuard API',
-        'version': '1.0.0',
-        'description': 'Pharmacogenomic Risk Prediction System',
-        'endpoints': {
-            'GET /': 'API information',
-            'GET /health': 'Health check',
-            'GET /drugs': 'List supported drugs',
-            'POST /analyze': 'Analyze VCF file (form-data: vcf, drugs)'
-        },
-        'supported_drugs': SUPPORTED_DRUGS,
-        'supported_genes': ['CYP2D6', 'CYP2C19', 'CYP2C9', 'SLCO1B1', 'TPMT', 'DPYD'],
-        'documentation': 'See README.md for full API documentation'
-    }), 200
-
-@app.route('/health', methods=['GET'])
-def health():
-    """Health check endpoint."""
-    return jsonify({
-        'status': 'ok',
-        'service': 'PharmaGuard API',
-        'version': '1.0.0'
-    }), 200
-
-@app.route('/drugs', methods=['GET'])
-def list_drugs():
-    """List supported drugs."""
-    return jsonify({
-        'supported_drugs': SUPPORTED_DRUGS,
-        'count': len(SUPPORTED_DRUGS)
-    }), 200
-
-if __name__ == '__main__':
+import os
+from flask import Flask, request, jsonify, make_response, stream_with_context, url_for
+from flask_cors import CORS
+from pharmacogenomics.analysis import SUPPORTED_DRUGS, encode_json
+from pharmacogenomics.forms import AnalysisRequestError, parse_analysis_form
+from pharmacogenomics.jobs import TERMINAL_EVENTS, JobManager, JobQueueFull, analysis_job
+from pharmacogenomics.llm_explainer import explanation_cache_stats, llm_client_stats
+from pharmacogenomics.metrics import REQUESTS, StageTimer, profiled, render_metrics
+from pharmacogenomics.result_cache import (RESULT_CACHE, RESULT_CACHE_TTL, cache_metrics, cached_analysis, restore_result,
+                                           result_cache_stats)
+
+app = Flask(__name__)
+CORS(app)
+
+# Background analyses for the /jobs endpoints
+JOBS = JobManager()
+SSE_KEEPALIVE = 15  # seconds between keep-alive comments on idle event streams
+
+# Manifests name files on the server, so they are only accepted under this directory
+COHORT_MANIFEST_ROOT = os.getenv('COHORT_MANIFEST_ROOT')
+
+# /analyze?profile=1 writes a cProfile dump only when this is enabled
+ALLOW_PROFILING = os.getenv('ALLOW_PROFILING', '').lower() in ('1', 'true', 'yes')
+
+def json_response(payload, status=200):
+    """Like jsonify, but splices in the pre-encoded decision-table blocks."""
+    return app.response_class(encode_json(payload) + '\n', status=status, mimetype='application/json')
+
+def cached_result_response(body, key, hit):
+    """JSON response for a cached or freshly cached analysis, with validators for revalidation.
+
+    The ETag is weak because patient_id and timestamp change on every
+    response while the analysis itself does not.
+    """
+    response = app.response_class(body + '\n', mimetype='application/json')
+    response.headers['ETag'] = f'W/"{key}"'
+    response.headers['Cache-Control'] = f'private, max-age={int(RESULT_CACHE_TTL)}'
+    response.headers['Content-Location'] = url_for('cached_result', key=key)
+    response.headers['X-Cache'] = 'HIT' if hit else 'MISS'
+    return response
+
+def parse_analysis_request(timer=None):
+    """Validate an analysis form upload and parse its VCF.
+    
+    Returns (parse_result, drugs, explain) or raises AnalysisRequestError.
+    An optional StageTimer receives the 'upload' (multipart decode, which
+    spools large files to a temp file) and 'parse' stages.
+    """
+    timer = timer or StageTimer()
+    with timer.stage('upload'):
+        form, files = request.form, request.files
+    return parse_analysis_form(form, files, timer)
+
+@app.route('/analyze', methods=['POST'])
+def analyze():
+    """Analyze VCF file and return pharmacogenomic risk assessment.
+    
+    With ?profile=1 (and ALLOW_PROFILING set) the request is run under
+    cProfile; the dump path is returned in the X-Profile header.
+    """
+    if request.args.get('profile') == '1' and ALLOW_PROFILING:
+        with profiled('analyze') as profile:
+            response = timed_analyze()
+        if 'path' in profile:
+            print(f"Profile of /analyze written to {profile['path']}\n{profile['summary']}")
+            response.headers['X-Profile'] = profile['path']
+        else:
+            print(f"Profile of /analyze\n{profile['summary']}")
+        return response
+    return timed_analyze()
+
+def timed_analyze():
+    """Run /analyze with per-stage timers, reported in Server-Timing and /metrics."""
+    timer = StageTimer()
+    try:
+        try:
+            parse_result, drugs, explain = parse_analysis_request(timer)
+        except AnalysisRequestError as e:
+            response = make_response(jsonify(e.payload), 400)
+        else:
+            response = cached_result_response(*cached_analysis(parse_result, drugs, explain, timer))
+    
+    except Exception as e:
+        response = make_response(jsonify({'error': f'Internal server error: {str(e)}'}), 500)
+    
+    timer.record()
+    REQUESTS.inc(endpoint='analyze', status=response.status_code)
+    response.headers['Server-Timing'] = timer.server_timing()
+    response.headers['Timing-Allow-Origin'] = '*'
+    return response
+
+@app.route('/results/<key>', methods=['GET'])
+def cached_result(key):
+    """Re-fetch a cached /analyze result by its ETag key; If-None-Match revalidates without a body.
+
+    Unknown or expired keys are 404 whatever the client sends, so a
+    validator (or ``*``) never vouches for a result that is gone.
+    """
+    entry = RESULT_CACHE.get(key)
+    if entry is None:
+        return jsonify({'error': 'Unknown or expired result'}), 404
+    if request.if_none_match.contains_weak(key):
+        response = app.response_class(status=304)
+        response.headers['ETag'] = f'W/"{key}"'
+        response.headers['Cache-Control'] = f'private, max-age={int(RESULT_CACHE_TTL)}'
+        return response
+    return cached_result_response(restore_result(entry), key, True)
+
+@app.route('/jobs', methods=['POST'])
+def submit_job():
+    """Queue an analysis (same form fields as /analyze) and return its job ID immediately."""
+    try:
+        try:
+            parse_result, drugs, explain = parse_analysis_request()
+        except AnalysisRequestError as e:
+            return jsonify(e.payload), 400
+        
+        try:
+            job = JOBS.submit(analysis_job, parse_result, drugs, explain)
+        except JobQueueFull as e:
+            response = jsonify({'error': 'Too many queued jobs, retry later'})
+            response.headers['Retry-After'] = str(e.retry_after)
+            return response, 503
+        response = jsonify({
+            'job_id': job.id,
+            'status': job.status,
+            'status_url': url_for('job_status', job_id=job.id),
+            'events_url': url_for('job_events', job_id=job.id)
+        })
+        response.headers['Location'] = url_for('job_status', job_id=job.id)
+        return response, 202
+    
+    except Exception as e:
+        return jsonify({'error': f'Internal server error: {str(e)}'}), 500
+
+@app.route('/cohort', methods=['POST'])
+def analyze_cohort():
+    """Analyze many VCFs from a tar/zip archive or a manifest of server paths, streaming NDJSON."""
+    # Imported on first use: the process-pool and archive modules are not needed to serve /analyze
+    from pharmacogenomics.cohort import COHORT_JOBS, archive_tasks, manifest_tasks, run_cohort
+    try:
+        drugs_input = request.form.get('drugs', '').strip()
+        if not drugs_input:
+            return jsonify({'error': 'No drugs specified'}), 400
+        drugs = [d.strip().upper() for d in drugs_input.split(',') if d.strip()]
+        
+        try:
+            jobs = min(max(1, int(request.form.get('jobs', COHORT_JOBS))), COHORT_JOBS)
+        except ValueError:
+            return jsonify({'error': 'jobs must be an integer'}), 400
+        use_llm = request.form.get('llm', '').lower() in ('1', 'true', 'yes')
+        
+        archive_file = request.files.get('archive')
+        manifest_file = request.files.get('manifest')
+        try:
+            if archive_file:
+                tasks = archive_tasks(archive_file.stream)
+            elif manifest_file:
+                if not COHORT_MANIFEST_ROOT:
+                    return jsonify({'error': 'Manifests are disabled; set COHORT_MANIFEST_ROOT to enable them'}), 400
+                tasks = manifest_tasks(manifest_file.stream, base_dir=COHORT_MANIFEST_ROOT, root=COHORT_MANIFEST_ROOT)
+            else:
+                return jsonify({'error': 'Upload an archive (tar/zip of VCFs) or a manifest of VCF paths'}), 400
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        # One line per file as it completes, then a summary line with files/sec
+        lines = (line + '\n' for line in run_cohort(tasks, drugs, jobs, use_llm))
+        return app.response_class(stream_with_context(lines), mimetype='application/x-ndjson')
+    
+    except Exception as e:
+        return jsonify({'error': f'Internal server error: {str(e)}'}), 500
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    """Poll a job; the result is included once it has completed."""
+    job = JOBS.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Unknown or expired job'}), 404
+    return json_response(job.summary())
+
+@app.route('/jobs/<job_id>/events', methods=['GET'])
+def job_events(job_id):
+    """Server-sent events for a job: 'result' per drug as soon as its rules
+    finish, 'explanation' as each LLM explanation arrives, then 'done' or 'error'."""
+    job = JOBS.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Unknown or expired job'}), 404
+    
+    # Resume after the last event a reconnecting client saw
+    try:
+        start = int(request.headers.get('Last-Event-ID', -1)) + 1
+    except ValueError:
+        start = 0
+    
+    def stream(start):
+        while True:
+            events = job.wait_events(start, timeout=SSE_KEEPALIVE)
+            if not events:
+                if job.closed:
+                    return
+                yield ': keep-alive\n\n'
+                continue
+            for event, data in events:
+                yield f'id: {start}\nevent: {event}\ndata: {data}\n\n'
+                start += 1
+                if event in TERMINAL_EVENTS:
+                    return
+    
+    return app.response_class(stream(start), mimetype='text/event-stream',
+                              headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/', methods=['GET'])
+def index():
+    """API information endpoint."""
+    return jsonify({
+        'service': 'PharmaGuard API',
+        'version': '1.0.0',
+        'description': 'Pharmacogenomic Risk Prediction System',
+        'endpoints': {
+            'GET /': 'API information',
+            'GET /health': 'Health check',
+            'GET /metrics': 'Prometheus metrics: per-stage and per-drug /analyze latency, cache hit ratios',
+            'GET /drugs': 'List supported drugs',
+            'POST /analyze': 'Analyze VCF file (form-data: vcf, drugs, optional index, assembly)',
+            'GET /results/<key>': 'Cached /analyze result by ETag key (supports If-None-Match)',
+            'POST /cohort': 'Analyze many VCFs (form-data: archive or manifest, drugs, optional jobs, llm), streams NDJSON',
+            'POST /jobs': 'Queue an analysis (same form-data as /analyze), returns job_id',
+            'GET /jobs/<job_id>': 'Job status and, once completed, its result',
+            'GET /jobs/<job_id>/events': 'Server-sent events: per-drug results, then explanations'
+        },
+        'supported_drugs': SUPPORTED_DRUGS,
+        'supported_genes': ['CYP2D6', 'CYP2C19', 'CYP2C9', 'SLCO1B1', 'TPMT', 'DPYD'],
+        'documentation': 'See README.md for full API documentation'
+    }), 200
+
+@app.route('/health', methods=['GET'])
+def health():
+    """Health check endpoint."""
+    return jsonify({
+        'status': 'ok',
+        'service': 'PharmaGuard API',
+        'version': '1.0.0',
+        'explanation_cache': explanation_cache_stats(),
+        'result_cache': result_cache_stats(),
+        'llm': llm_client_stats()
+    }), 200
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Prometheus metrics (text format) for this worker process."""
+    return app.response_class(render_metrics(cache_metrics()), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+@app.route('/drugs', methods=['GET'])
+def list_drugs():
+    """List supported drugs."""
+    return jsonify({
+        'supported_drugs': SUPPORTED_DRUGS,
+        'count': len(SUPPORTED_DRUGS)
+    }), 200
+
+if __name__ == '__main__':
     app.run(debug=True, port=5000)
\ No newline at end of file
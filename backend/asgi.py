@@ -0,0 +1,152 @@
+"""Async serving path: the analysis API on Starlette, for uvicorn or gunicorn's UvicornWorker.
+
+    uvicorn asgi:app --workers 2
+    gunicorn -k uvicorn.workers.UvicornWorker --workers 2 asgi:app
+
+Responses match the Flask app byte for byte. VCF parsing, rules and
+encoding run on a thread pool; LLM explanations are non-blocking requests
+on the event loop, so analyses waiting on the LLM hold no thread and one
+process can keep hundreds in flight.
+"""
+import asyncio
+import contextlib
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import Response
+from starlette.routing import Route
+
+from pharmacogenomics.analysis import SUPPORTED_DRUGS, encode_json
+from pharmacogenomics.forms import AnalysisRequestError, parse_analysis_form
+from pharmacogenomics.llm_explainer import LLM_CLIENT, explanation_cache_stats, llm_client_stats
+from pharmacogenomics.metrics import REQUESTS, StageTimer, render_metrics
+from pharmacogenomics.result_cache import (RESULT_CACHE, RESULT_CACHE_TTL, acached_analysis, cache_metrics,
+                                           restore_result, result_cache_stats)
+
+# Threads for the blocking parts of a request: VCF parsing, rules, cache I/O and encoding
+ANALYSIS_THREADS = int(os.getenv('ANALYSIS_THREADS', 8))
+
+executor = ThreadPoolExecutor(max_workers=ANALYSIS_THREADS, thread_name_prefix='analysis')
+
+
+def json_response(payload, status=200):
+    """Same encoding as Flask's production jsonify: sorted keys, compact, trailing newline."""
+    return Response(encode_json(payload) + '\n', status_code=status, media_type='application/json')
+
+
+def cached_result_response(request, body, key, hit):
+    """JSON response for a cached or freshly cached analysis, with validators for revalidation."""
+    return Response(body + '\n', media_type='application/json', headers={
+        'ETag': f'W/"{key}"',
+        'Cache-Control': f'private, max-age={int(RESULT_CACHE_TTL)}',
+        'Content-Location': str(request.app.url_path_for('cached_result', key=key)),
+        'X-Cache': 'HIT' if hit else 'MISS'
+    })
+
+
+def _etag_matches(header, key):
+    """Weak comparison of an If-None-Match header against the result key; ``*`` matches any key.
+
+    Only call this for a key that is in the cache.
+    """
+    for tag in header.split(','):
+        tag = tag.strip()
+        if tag == '*' or tag.replace('W/', '', 1).strip('"') == key:
+            return True
+    return False
+
+
+async def analyze(request):
+    """Analyze VCF file and return pharmacogenomic risk assessment."""
+    loop = asyncio.get_running_loop()
+    timer = StageTimer()
+    try:
+        with timer.stage('upload'):
+            form = await request.form()
+        try:
+            fields = {name: value for name, value in form.multi_items() if isinstance(value, str)}
+            files = {name: value for name, value in form.multi_items() if not isinstance(value, str)}
+            parse_result, drugs, explain = await loop.run_in_executor(
+                executor, parse_analysis_form, fields, files, timer)
+        except AnalysisRequestError as e:
+            response = json_response(e.payload, 400)
+        else:
+            response = cached_result_response(request, *await acached_analysis(
+                parse_result, drugs, explain, timer, executor))
+        finally:
+            await form.close()
+
+    except Exception as e:
+        response = json_response({'error': f'Internal server error: {str(e)}'}, 500)
+
+    timer.record()
+    REQUESTS.inc(endpoint='analyze', status=response.status_code)
+    response.headers['Server-Timing'] = timer.server_timing()
+    response.headers['Timing-Allow-Origin'] = '*'
+    return response
+
+
+async def cached_result(request):
+    """Re-fetch a cached /analyze result by its ETag key; If-None-Match revalidates without a body.
+
+    Unknown or expired keys are 404 whatever the client sends, so a
+    validator (or ``*``) never vouches for a result that is gone.
+    """
+    key = request.path_params['key']
+    entry = await asyncio.get_running_loop().run_in_executor(executor, RESULT_CACHE.get, key)
+    if entry is None:
+        return json_response({'error': 'Unknown or expired result'}, 404)
+    if _etag_matches(request.headers.get('if-none-match', ''), key):
+        return Response(status_code=304, headers={
+            'ETag': f'W/"{key}"',
+            'Cache-Control': f'private, max-age={int(RESULT_CACHE_TTL)}'
+        })
+    return cached_result_response(request, restore_result(entry), key, True)
+
+
+async def health(request):
+    """Health check endpoint."""
+    return json_response({
+        'status': 'ok',
+        'service': 'PharmaGuard API',
+        'version': '1.0.0',
+        'explanation_cache': explanation_cache_stats(),
+        'result_cache': result_cache_stats(),
+        'llm': llm_client_stats()
+    })
+
+
+async def metrics(request):
+    """Prometheus metrics (text format) for this worker process."""
+    return Response(render_metrics(cache_metrics()), media_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+async def list_drugs(request):
+    """List supported drugs."""
+    return json_response({
+        'supported_drugs': SUPPORTED_DRUGS,
+        'count': len(SUPPORTED_DRUGS)
+    })
+
+
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    """Close the pooled LLM connections on shutdown."""
+    yield
+    await LLM_CLIENT.aclose()
+
+
+app = Starlette(
+    routes=[
+        Route('/analyze', analyze, methods=['POST']),
+        Route('/results/{key}', cached_result, methods=['GET'], name='cached_result'),
+        Route('/health', health, methods=['GET']),
+        Route('/metrics', metrics, methods=['GET']),
+        Route('/drugs', list_drugs, methods=['GET'])
+    ],
+    middleware=[Middleware(CORSMiddleware, allow_origins=['*'], allow_methods=['*'], allow_headers=['*'])],
+    lifespan=lifespan
+)
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""Cold-start benchmark: import cost of ``app`` and time to the first responses.
+
+Each run starts a fresh interpreter, so timings include interpreter start,
+module imports and the first request through the Flask test client (no
+network). ``python -X importtime`` attributes the import cost to modules.
+Run from the backend directory:
+
+    python benchmarks/bench_startup.py [--runs 5] [--top 12]
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+SAMPLE_VCF = os.path.join(BACKEND_DIR, '..', 'sample_vcfs', 'sample1.vcf')
+
+# Modules that should stay unloaded until a request needs them
+LAZY_MODULES = ('openai', 'numpy', 'multiprocessing', 'tarfile', 'zipfile', 'pyarrow')
+
+# Runs in the child: one line per milestone, read and timestamped by the parent
+CHILD_SCRIPT = f"""
+import sys
+preloaded = set(sys.modules)
+import app
+print('import', flush=True)
+client = app.app.test_client()
+client.get('/health')
+print('health', flush=True)
+with open({SAMPLE_VCF!r}, 'rb') as f:
+    client.post('/analyze', data={{'drugs': 'CODEINE,WARFARIN', 'vcf': (f, 'sample1.vcf')}})
+print('analyze', flush=True)
+print(','.join(m for m in {LAZY_MODULES!r} if m in sys.modules and m not in preloaded), flush=True)
+"""
+
+
+def child_env():
+    # No API key, so the first /analyze uses the fallback explainer and
+    # never waits on the network; the disk caches are skipped for the same reason
+    return dict(os.environ, OPENAI_API_KEY='', EXPLANATION_CACHE_PATH='', RESULT_CACHE_PATH='')
+
+
+def time_to_first_response():
+    """Return (milestone -> seconds since process start, lazily imported modules that were loaded)."""
+    start = time.perf_counter()
+    proc = subprocess.Popen([sys.executable, '-c', CHILD_SCRIPT], cwd=BACKEND_DIR, env=child_env(),
+                            stdout=subprocess.PIPE, text=True)
+    milestones = {}
+    for name in ('import', 'health', 'analyze'):
+        line = proc.stdout.readline().strip()
+        if line != name:
+            proc.kill()
+            raise RuntimeError(f"startup probe failed before '{name}' (got {line!r})")
+        milestones[name] = time.perf_counter() - start
+    loaded = proc.stdout.readline().strip()
+    proc.wait()
+    return milestones, [m for m in loaded.split(',') if m]
+
+
+def import_profile():
+    """Parse ``python -X importtime -c 'import app'`` into (cumulative us, module, depth) rows.
+
+    Rows come in completion order, so a module's imports precede it.
+    """
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import app'], cwd=BACKEND_DIR,
+                            env=child_env(), stderr=subprocess.PIPE, stdout=subprocess.DEVNULL, text=True,
+                            check=True)
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line.split('|')
+        name = name[1:]  # drop the separator's padding; the rest is nesting indentation
+        depth = (len(name) - len(name.lstrip())) // 2
+        rows.append((int(cumulative), name.strip(), depth))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--top', type=int, default=12, help='modules to list from the import profile')
+    args = parser.parse_args()
+
+    rows = import_profile()
+    app_row = next(i for i, (_, name, depth) in enumerate(rows) if name == 'app' and depth == 0)
+    print(f"import app (-X importtime): {rows[app_row][0] / 1000:7.1f} ms")
+    print("largest direct imports:")
+    direct = []
+    for row in reversed(rows[:app_row]):
+        if row[2] == 0:
+            break
+        if row[2] == 1:
+            direct.append(row)
+    direct.sort(reverse=True)
+    for us, name, _ in direct[:args.top]:
+        print(f"  {us / 1000:7.1f} ms  {name}")
+
+    runs = [time_to_first_response() for _ in range(args.runs)]
+    print(f"\ntime to first response ({args.runs} fresh interpreters, median / min):")
+    for name, label in (('import', 'app imported'), ('health', 'GET /health'), ('analyze', 'POST /analyze')):
+        times = [milestones[name] * 1000 for milestones, _ in runs]
+        print(f"  {label:15s}: {statistics.median(times):7.1f} ms / {min(times):7.1f} ms")
+    loaded = runs[-1][1]
+    print(f"\nlazy modules loaded by the first /analyze: {', '.join(loaded) if loaded else 'none'}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,509 @@
+#!/usr/bin/env python3
+"""HTTP load generator for /analyze.
+
+Replays a seeded mix of /analyze requests built from ``sample_vcfs/`` and
+synthetic VCFs, either closed-loop (``--concurrency`` clients sending
+back to back) or open-loop (``--rps`` arrivals per second), and reports
+latency percentiles, throughput, error rate, result-cache hits and the
+RSS of every server worker. The LLM is always the local stub, so runs
+measure the server rather than OpenAI.
+
+Targets, from the backend directory:
+
+    # gunicorn started by the harness, one run per worker class
+    python benchmarks/loadtest.py --server gunicorn --worker-class gthread --workers 2 --threads 16 --concurrency 32
+    python benchmarks/loadtest.py --server gunicorn --worker-class sync --workers 4 --rps 40
+    python benchmarks/loadtest.py --server gunicorn --worker-class gevent --workers 2 --concurrency 64
+
+    # the ASGI app (asgi.py) under uvicorn
+    python benchmarks/loadtest.py --server uvicorn --workers 2 --concurrency 200
+
+    # threaded werkzeug server in this process (no gunicorn needed)
+    python benchmarks/loadtest.py --server inprocess --concurrency 8
+
+    # an already running server; pass its master PID to sample RSS
+    python benchmarks/loadtest.py --url http://127.0.0.1:5000 --pid 12345 --concurrency 16
+
+A server started by the harness gets the stub LLM and the cache settings
+in ``--env``; start an external server with ``OPENAI_API_BASE`` pointing at
+``stub_openai.py`` yourself. ``--unique`` sets the share of requests whose
+VCF is new each time and so always misses the result cache.
+"""
+
+import argparse
+import glob
+import http.client
+import json
+import os
+import random
+import signal
+import statistics
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from urllib.parse import urlsplit
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+SAMPLE_DIR = os.path.join(BACKEND_DIR, '..', 'sample_vcfs')
+sys.path.insert(0, BACKEND_DIR)
+
+from stub_openai import start_stub  # noqa: E402
+from synth_vcf import generate_vcf  # noqa: E402
+
+# Drug panels the request mix draws from
+DRUG_PANELS = (
+    'CODEINE',
+    'CODEINE,WARFARIN',
+    'CLOPIDOGREL,SIMVASTATIN,AZATHIOPRINE',
+    'CODEINE,WARFARIN,CLOPIDOGREL,SIMVASTATIN,AZATHIOPRINE,FLUOROURACIL'
+)
+
+# Synthetic VCFs in the mix: (records, samples, density)
+SYNTHETIC_SHAPES = ((1000, 0, 0.02), (20000, 0, 0.001), (200, 20, 0.2))
+
+
+def multipart_body(fields, files):
+    """Encode form fields and (name, filename, bytes) files as multipart/form-data."""
+    boundary = uuid.uuid4().hex
+    parts = []
+    for name, value in fields.items():
+        parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode())
+    for name, filename, data in files:
+        parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"; filename="{filename}"\r\n'
+                     f'Content-Type: application/octet-stream\r\n\r\n'.encode() + data + b'\r\n')
+    parts.append(f'--{boundary}--\r\n'.encode())
+    return b''.join(parts), f'multipart/form-data; boundary={boundary}'
+
+
+class Workload:
+    """Seeded request mix: shared VCFs (repeatable, so cacheable) plus a share of unique ones."""
+
+    def __init__(self, seed=0, unique=0.0):
+        self.rng = random.Random(seed)
+        self.unique = unique
+        self.lock = threading.Lock()
+        self.vcfs = []
+        for path in sorted(glob.glob(os.path.join(SAMPLE_DIR, '*.vcf'))):
+            with open(path, 'rb') as f:
+                self.vcfs.append((os.path.basename(path), f.read()))
+        for i, (records, samples, density) in enumerate(SYNTHETIC_SHAPES):
+            self.vcfs.append((f'synthetic{i}.vcf', generate_vcf(records, samples, density, seed=i).encode()))
+        self.bodies = [multipart_body({'drugs': drugs}, [('vcf', name, data)])
+                       for name, data in self.vcfs for drugs in DRUG_PANELS]
+
+    def next_request(self):
+        """Return (body, content type) for the next request."""
+        with self.lock:
+            fresh = self.rng.random() < self.unique
+            if not fresh:
+                return self.rng.choice(self.bodies)
+            seed = self.rng.getrandbits(32)
+            drugs = self.rng.choice(DRUG_PANELS)
+        records, samples, density = SYNTHETIC_SHAPES[0]
+        data = generate_vcf(records, samples, density, seed=seed).encode()
+        return multipart_body({'drugs': drugs}, [('vcf', f'unique{seed}.vcf', data)])
+
+
+class Recorder:
+    """Thread-safe collection of (latency, status, cache) samples."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = []
+        self.statuses = {}
+        self.cache = {}
+        self.errors = 0
+
+    def add(self, latency, status, cache=None):
+        with self.lock:
+            self.latencies.append(latency)
+            self.statuses[status] = self.statuses.get(status, 0) + 1
+            if cache:
+                self.cache[cache] = self.cache.get(cache, 0) + 1
+            if not isinstance(status, int) or status >= 400:
+                self.errors += 1
+
+
+class Client:
+    """One keep-alive connection to the target."""
+
+    def __init__(self, url, timeout):
+        parts = urlsplit(url)
+        self.host, self.port = parts.hostname, parts.port or 80
+        self.path = (parts.path.rstrip('/') or '') + '/analyze'
+        self.timeout = timeout
+        self.conn = None
+
+    def post(self, body, content_type):
+        """Return (status, X-Cache); connection errors are returned as the exception name."""
+        try:
+            if self.conn is None:
+                self.conn = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+            self.conn.request('POST', self.path, body, {'Content-Type': content_type})
+            response = self.conn.getresponse()
+            response.read()
+            if response.getheader('Connection', '').lower() == 'close':
+                self.close()
+            return response.status, response.getheader('X-Cache')
+        except (OSError, http.client.HTTPException) as e:
+            self.close()
+            return type(e).__name__, None
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+
+def run_closed_loop(url, workload, recorder, concurrency, duration, timeout):
+    """``concurrency`` clients each send the next request as soon as the previous one completes."""
+    deadline = time.perf_counter() + duration
+
+    def client_loop():
+        client = Client(url, timeout)
+        while time.perf_counter() < deadline:
+            body, content_type = workload.next_request()
+            start = time.perf_counter()
+            status, cache = client.post(body, content_type)
+            recorder.add(time.perf_counter() - start, status, cache)
+        client.close()
+
+    threads = [threading.Thread(target=client_loop, daemon=True) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+def run_open_loop(url, workload, recorder, rps, duration, timeout, max_in_flight):
+    """Send requests on a fixed schedule of ``rps`` per second, whatever the server's speed.
+
+    Latency is measured from each request's scheduled send time, so time
+    spent queued behind a slow server counts (no coordinated omission).
+    """
+    interval = 1.0 / rps
+    total = int(rps * duration)
+    start = time.perf_counter()
+    schedule = iter(range(total))
+    lock = threading.Lock()
+
+    def sender():
+        client = Client(url, timeout)
+        while True:
+            with lock:
+                i = next(schedule, None)
+            if i is None:
+                break
+            scheduled = start + i * interval
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            body, content_type = workload.next_request()
+            status, cache = client.post(body, content_type)
+            recorder.add(time.perf_counter() - scheduled, status, cache)
+        client.close()
+
+    threads = [threading.Thread(target=sender, daemon=True) for _ in range(max_in_flight)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+def _rss_kb(pid):
+    """Resident set size of ``pid`` in KiB, or None when it cannot be read."""
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    try:
+        out = subprocess.run(['ps', '-o', 'rss=', '-p', str(pid)], capture_output=True, text=True, timeout=5)
+        return int(out.stdout.strip()) if out.stdout.strip() else None
+    except (OSError, ValueError, subprocess.SubprocessError):
+        return None
+
+
+def _children(pid):
+    try:
+        with open(f'/proc/{pid}/task/{pid}/children') as f:
+            return [int(child) for child in f.read().split()]
+    except OSError:
+        pass
+    try:
+        out = subprocess.run(['pgrep', '-P', str(pid)], capture_output=True, text=True, timeout=5)
+        return [int(child) for child in out.stdout.split()]
+    except (OSError, ValueError, subprocess.SubprocessError):
+        return []
+
+
+class RSSSampler:
+    """Polls the RSS of a server's master process and its workers in the background."""
+
+    def __init__(self, pid, interval=0.5):
+        self.pid = pid
+        self.interval = interval
+        self.peak = {}
+        self.last = {}
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def sample(self):
+        for pid in [self.pid] + _children(self.pid):
+            rss = _rss_kb(pid)
+            if rss is not None:
+                self.last[pid] = rss
+                self.peak[pid] = max(self.peak.get(pid, 0), rss)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.sample()
+
+    def start(self):
+        self.sample()
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self.sample()
+
+    def report(self):
+        # A server without worker processes (in-process, or gunicorn --workers 0) is reported as 'server'
+        master = 'master' if len(self.peak) > 1 else 'server'
+        return [{'pid': pid, 'role': master if pid == self.pid else 'worker',
+                 'rss_mb': round(self.last.get(pid, 0) / 1024, 1), 'peak_rss_mb': round(self.peak[pid] / 1024, 1)}
+                for pid in sorted(self.peak, key=lambda pid: (pid != self.pid, pid))]
+
+
+def server_env(llm_url, overrides):
+    # The stub has no quota, so the client-side rate limiter is off, and results stay in
+    # memory so runs do not warm each other; --env can turn either back on
+    env = dict(os.environ, OPENAI_API_KEY='sk-loadtest-stub', OPENAI_API_BASE=llm_url, LLM_RPM='0', LLM_TPM='0',
+               RESULT_CACHE_PATH='')
+    for item in overrides:
+        name, _, value = item.partition('=')
+        env[name] = value
+    return env
+
+
+def _wait_for_server(url, proc=None, timeout=30):
+    parts = urlsplit(url)
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if proc is not None and proc.poll() is not None:
+            raise RuntimeError(f"Server exited with status {proc.returncode}")
+        try:
+            conn = http.client.HTTPConnection(parts.hostname, parts.port, timeout=2)
+            conn.request('GET', '/health')
+            conn.getresponse().read()
+            conn.close()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f"Server at {url} did not come up within {timeout}s")
+
+
+def start_gunicorn(args, env):
+    """Start gunicorn on a local port; returns (process, URL)."""
+    url = f'http://127.0.0.1:{args.port}'
+    command = [sys.executable, '-m', 'gunicorn', '--bind', f'127.0.0.1:{args.port}',
+               '--worker-class', args.worker_class, '--workers', str(args.workers), '--log-level', 'warning']
+    if args.worker_class == 'gthread':
+        command += ['--threads', str(args.threads)]
+    elif args.worker_class in ('gevent', 'eventlet'):
+        command += ['--worker-connections', str(args.worker_connections)]
+    command.append('app:app')
+    proc = subprocess.Popen(command, cwd=BACKEND_DIR, env=env)
+    try:
+        _wait_for_server(url, proc)
+    except RuntimeError:
+        proc.kill()
+        raise
+    return proc, url
+
+
+def start_uvicorn(args, env):
+    """Start the ASGI app under uvicorn on a local port; returns (process, URL)."""
+    url = f'http://127.0.0.1:{args.port}'
+    command = [sys.executable, '-m', 'uvicorn', 'asgi:app', '--host', '127.0.0.1', '--port', str(args.port),
+               '--workers', str(args.workers), '--log-level', 'warning', '--no-access-log']
+    proc = subprocess.Popen(command, cwd=BACKEND_DIR, env=env)
+    try:
+        _wait_for_server(url, proc)
+    except RuntimeError:
+        proc.kill()
+        raise
+    return proc, url
+
+
+def start_inprocess(args, env):
+    """Serve the app from a threaded werkzeug server in this process; returns (server, URL)."""
+    os.environ.update(env)
+    import logging
+    from werkzeug.serving import make_server
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+    from app import app
+    server = make_server('127.0.0.1', args.port, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f'http://127.0.0.1:{server.server_port}'
+    _wait_for_server(url)
+    return server, url
+
+
+def percentile(sorted_values, q):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, -(-len(sorted_values) * q // 100))
+    return sorted_values[int(rank) - 1]
+
+
+def summarize(recorder, wall_time):
+    latencies = sorted(recorder.latencies)
+    count = len(latencies)
+    lookups = sum(recorder.cache.values())
+    return {
+        'requests': count,
+        'duration_s': round(wall_time, 3),
+        'throughput_rps': round(count / wall_time, 2) if wall_time else 0.0,
+        'error_rate': round(recorder.errors / count, 4) if count else 0.0,
+        'statuses': {str(status): n for status, n in sorted(recorder.statuses.items(), key=lambda s: str(s[0]))},
+        'cache_hit_ratio': round(recorder.cache.get('HIT', 0) / lookups, 4) if lookups else None,
+        'latency_ms': {
+            'p50': round(percentile(latencies, 50) * 1000, 2),
+            'p95': round(percentile(latencies, 95) * 1000, 2),
+            'p99': round(percentile(latencies, 99) * 1000, 2),
+            'max': round(latencies[-1] * 1000, 2) if latencies else 0.0,
+            'mean': round(statistics.mean(latencies) * 1000, 2) if latencies else 0.0
+        }
+    }
+
+
+def print_report(report):
+    summary = report['summary']
+    latency = summary['latency_ms']
+    print(f"\n{report['config']['target']}  ({report['config']['mode']})")
+    print(f"  requests     {summary['requests']} in {summary['duration_s']}s "
+          f"= {summary['throughput_rps']} req/s")
+    print(f"  errors       {summary['error_rate']:.2%}  {summary['statuses']}")
+    if summary['cache_hit_ratio'] is not None:
+        print(f"  cache hits   {summary['cache_hit_ratio']:.2%}")
+    print(f"  latency ms   p50 {latency['p50']}  p95 {latency['p95']}  p99 {latency['p99']}  max {latency['max']}")
+    for process in report['rss']:
+        print(f"  {process['role']:6} {process['pid']:>7}  rss {process['rss_mb']} MB  peak {process['peak_rss_mb']} MB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    target = parser.add_argument_group('target')
+    target.add_argument('--server', choices=('gunicorn', 'uvicorn', 'inprocess'), default='inprocess',
+                        help='server to start when --url is not given (default: inprocess)')
+    target.add_argument('--url', help='load an already running server instead of starting one')
+    target.add_argument('--pid', type=int, help='master PID of the --url server, to sample worker RSS')
+    target.add_argument('--port', type=int, default=0, help='port for a started server (default: any free port)')
+    target.add_argument('--worker-class', default='gthread', help='gunicorn worker class (default: gthread)')
+    target.add_argument('--workers', type=int, default=2, help='gunicorn/uvicorn workers (default: 2)')
+    target.add_argument('--threads', type=int, default=16, help='threads per gthread worker (default: 16)')
+    target.add_argument('--worker-connections', type=int, default=1000, help='gevent/eventlet connections')
+    target.add_argument('--env', action='append', default=[], metavar='NAME=VALUE',
+                        help='extra environment for a started server, e.g. RESULT_CACHE_SIZE=0 (repeatable)')
+
+    load = parser.add_argument_group('load')
+    mode = load.add_mutually_exclusive_group()
+    mode.add_argument('--concurrency', type=int, default=8, help='closed-loop clients (default: 8)')
+    mode.add_argument('--rps', type=float, help='open-loop arrival rate in requests per second')
+    load.add_argument('--max-in-flight', type=int, default=256, help='sender threads for --rps (default: 256)')
+    load.add_argument('--duration', type=float, default=30, help='seconds of measured load (default: 30)')
+    load.add_argument('--warmup', type=float, default=3, help='seconds of unmeasured load first (default: 3)')
+    load.add_argument('--unique', type=float, default=0.0,
+                      help='share of requests with a never-seen VCF, i.e. result-cache misses (default: 0)')
+    load.add_argument('--timeout', type=float, default=60, help='per-request timeout in seconds')
+    load.add_argument('--seed', type=int, default=0)
+
+    stub = parser.add_argument_group('stub LLM')
+    stub.add_argument('--llm-latency', type=float, default=0.3, help='stub response delay in seconds (default: 0.3)')
+    stub.add_argument('--llm-jitter', type=float, default=0.1)
+    stub.add_argument('--llm-error-rate', type=float, default=0.0)
+    stub.add_argument('--llm-port', type=int, default=0, help='stub port (default: any free port)')
+
+    parser.add_argument('--json', metavar='PATH', help='also write the report as JSON')
+    args = parser.parse_args()
+
+    stub_server = None
+    if args.url is None:
+        stub_server, llm_url = start_stub(args.llm_port, latency=args.llm_latency, jitter=args.llm_jitter,
+                                          error_rate=args.llm_error_rate, seed=args.seed)
+        env = server_env(llm_url, args.env)
+
+    proc = server = None
+    if args.url:
+        url, pid, target_name = args.url.rstrip('/'), args.pid, args.url
+    elif args.server == 'gunicorn':
+        args.port = args.port or 8765
+        proc, url = start_gunicorn(args, env)
+        pid = proc.pid
+        target_name = f'gunicorn {args.worker_class} x{args.workers}'
+        if args.worker_class == 'gthread':
+            target_name += f' ({args.threads} threads)'
+    elif args.server == 'uvicorn':
+        args.port = args.port or 8765
+        proc, url = start_uvicorn(args, env)
+        pid, target_name = proc.pid, f'uvicorn asgi:app x{args.workers}'
+    else:
+        server, url = start_inprocess(args, env)
+        pid, target_name = os.getpid(), 'in-process werkzeug (threaded)'
+
+    workload = Workload(args.seed, args.unique)
+    mode_name = f'{args.rps} req/s open loop' if args.rps else f'{args.concurrency} concurrent clients'
+
+    def run(duration, recorder):
+        if args.rps:
+            run_open_loop(url, workload, recorder, args.rps, duration, args.timeout, args.max_in_flight)
+        else:
+            run_closed_loop(url, workload, recorder, args.concurrency, duration, args.timeout)
+
+    try:
+        if args.warmup > 0:
+            run(args.warmup, Recorder())
+        sampler = RSSSampler(pid).start() if pid else None
+        recorder = Recorder()
+        started = time.perf_counter()
+        run(args.duration, recorder)
+        wall_time = time.perf_counter() - started
+        if sampler:
+            sampler.stop()
+    finally:
+        if proc is not None:
+            proc.send_signal(signal.SIGTERM)
+            try:
+                proc.wait(10)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+        if server is not None:
+            server.shutdown()
+        if stub_server is not None:
+            stub_server.shutdown()
+
+    report = {
+        'config': {
+            'target': target_name, 'mode': mode_name, 'duration': args.duration, 'unique': args.unique,
+            'llm_latency': None if args.url else args.llm_latency, 'env': args.env, 'seed': args.seed
+        },
+        'summary': summarize(recorder, wall_time),
+        'rss': sampler.report() if sampler else []
+    }
+    print_report(report)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+            f.write('\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""Local stand-in for the OpenAI chat-completions endpoint.
+
+Answers ``POST /v1/chat/completions`` with well-formed explanation JSON
+after a configurable latency, and fails a configurable share of requests
+with 500 or 429, so LLM-bound code can be benchmarked without network
+access or API costs. Point the backend at it with
+``OPENAI_API_BASE=http://127.0.0.1:<port>/v1`` and any ``OPENAI_API_KEY``.
+
+    python benchmarks/stub_openai.py --port 8089 --latency 0.5 --jitter 0.2 --error-rate 0.05
+"""
+
+import argparse
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Batched prompts name their drugs in this sentence (see llm_explainer._explain_batch)
+BATCH_DRUGS = re.compile(r'keys are exactly the drug names \(([^)]*)\)')
+
+
+def explanation(drug='the drug'):
+    return {
+        'summary': f'Synthetic summary for {drug}.',
+        'mechanism': f'Synthetic mechanism for {drug}.',
+        'variant_impact': f'Synthetic variant impact for {drug}.'
+    }
+
+
+def completion_content(prompt):
+    """Explanation JSON for a prompt: one object per drug for batched prompts, else a single object."""
+    match = BATCH_DRUGS.search(prompt)
+    if match:
+        drugs = [drug.strip() for drug in match.group(1).split(',') if drug.strip()]
+        return json.dumps({drug: explanation(drug) for drug in drugs})
+    return json.dumps(explanation())
+
+
+class StubConfig:
+    def __init__(self, latency=0.0, jitter=0.0, error_rate=0.0, rate_limit_rate=0.0, seed=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.rng = random.Random(seed)
+        self.requests = 0
+        self.lock = threading.Lock()
+
+    def draw(self):
+        """Return (delay seconds, status) for the next request."""
+        with self.lock:
+            self.requests += 1
+            delay = max(0.0, self.latency + self.rng.uniform(-self.jitter, self.jitter))
+            roll = self.rng.random()
+        if roll < self.error_rate:
+            return delay, 500
+        if roll < self.error_rate + self.rate_limit_rate:
+            return delay, 429
+        return delay, 200
+
+
+def make_handler(config):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+            if not self.path.rstrip('/').endswith('/chat/completions'):
+                return self._send(404, {'error': {'message': 'not found', 'type': 'invalid_request_error'}})
+            try:
+                request = json.loads(body)
+                prompt = request['messages'][-1]['content']
+            except (ValueError, KeyError, IndexError):
+                return self._send(400, {'error': {'message': 'bad request', 'type': 'invalid_request_error'}})
+
+            delay, status = config.draw()
+            time.sleep(delay)
+            if status == 500:
+                return self._send(500, {'error': {'message': 'stub server error', 'type': 'server_error'}})
+            if status == 429:
+                return self._send(429, {'error': {'message': 'stub rate limit', 'type': 'rate_limit_error'}})
+            content = completion_content(prompt)
+            self._send(200, {
+                'id': f'chatcmpl-stub-{config.requests}',
+                'object': 'chat.completion',
+                'created': int(time.time()),
+                'model': request.get('model', 'stub'),
+                'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': content},
+                             'finish_reason': 'stop'}],
+                'usage': {'prompt_tokens': len(prompt) // 4, 'completion_tokens': len(content) // 4,
+                          'total_tokens': (len(prompt) + len(content)) // 4}
+            })
+
+        def _send(self, status, payload):
+            data = json.dumps(payload).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def start_stub(port=0, **config):
+    """Start the stub on a daemon thread; returns (server, base URL). Port 0 picks a free port."""
+    stub_config = StubConfig(**config)
+    server = ThreadingHTTPServer(('127.0.0.1', port), make_handler(stub_config))
+    server.daemon_threads = True
+    server.config = stub_config
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://127.0.0.1:{server.server_address[1]}/v1'
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--port', type=int, default=8089)
+    parser.add_argument('--latency', type=float, default=0.0, help='mean response delay in seconds')
+    parser.add_argument('--jitter', type=float, default=0.0, help='uniform +/- jitter in seconds')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='share of requests answered with 500')
+    parser.add_argument('--rate-limit-rate', type=float, default=0.0, help='share answered with 429')
+    parser.add_argument('--seed', type=int)
+    args = parser.parse_args()
+
+    server, url = start_stub(args.port, latency=args.latency, jitter=args.jitter, error_rate=args.error_rate,
+                             rate_limit_rate=args.rate_limit_rate, seed=args.seed)
+    print(f"stub OpenAI endpoint at {url} (Ctrl-C to stop)")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
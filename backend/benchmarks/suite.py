@@ -0,0 +1,345 @@
+#!/usr/bin/env python3
+"""Benchmark suite with JSON baselines.
+
+Times the parser, phenotype and risk lookups, explanation generation and
+end-to-end /analyze, in-process and without network access: VCFs come
+from ``synth_vcf`` and the OpenAI endpoint is replaced by the local
+``stub_openai`` server. Each case is run for several rounds of enough
+calls to fill ``--min-time``; per-call median, min, mean and stdev are
+reported. Run from the backend directory:
+
+    python benchmarks/suite.py                                   # run and print
+    python benchmarks/suite.py --save benchmarks/baselines/local.json
+    python benchmarks/suite.py --compare benchmarks/baselines/reference.json
+    python benchmarks/suite.py -k parse_vcf --rounds 3
+
+``--compare`` exits non-zero when a case's median is slower than the
+baseline by more than ``--threshold``. Baselines are only comparable on the
+same machine, so regenerate the reference when hardware changes.
+"""
+
+import argparse
+import fnmatch
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+SAMPLE_VCF = os.path.join(BACKEND_DIR, '..', 'sample_vcfs', 'comprehensive.vcf')
+sys.path.insert(0, BACKEND_DIR)
+
+CASES = []
+
+
+def case(name):
+    """Register a benchmark. The decorated function does the setup and returns the callable to time."""
+    def register(setup):
+        CASES.append((name, setup))
+        return setup
+    return register
+
+
+def configure_environment(llm_url):
+    """Point the explainer at the stub and keep caches in memory; must run before the package is imported."""
+    os.environ['OPENAI_API_KEY'] = 'sk-benchmark-stub'
+    os.environ['OPENAI_API_BASE'] = llm_url
+    os.environ['LLM_RPM'] = os.environ['LLM_TPM'] = '0'
+    os.environ['EXPLANATION_CACHE_PATH'] = ''
+    os.environ['RESULT_CACHE_PATH'] = ''
+
+
+def _clear_caches():
+    from pharmacogenomics.llm_explainer import EXPLANATION_CACHE
+    from pharmacogenomics.result_cache import RESULT_CACHE
+    EXPLANATION_CACHE.memory.clear()
+    RESULT_CACHE.memory.clear()
+
+
+# parse_vcf
+
+def _parse_case(data):
+    from pharmacogenomics.vcf_parser import parse_vcf
+    return lambda: parse_vcf(data, max_size=float('inf'), max_uncompressed_size=float('inf'))
+
+
+@case('parse_vcf.sample')
+def bench_parse_sample():
+    with open(SAMPLE_VCF, 'rb') as f:
+        return _parse_case(f.read())
+
+
+@case('parse_vcf.synthetic_100k')
+def bench_parse_synthetic():
+    from synth_vcf import generate_vcf
+    return _parse_case(generate_vcf(100000, density=0.001).encode())
+
+
+@case('parse_vcf.synthetic_100k_annotated')
+def bench_parse_annotated():
+    from synth_vcf import generate_vcf
+    return _parse_case(generate_vcf(100000, density=0.001, annotated=True).encode())
+
+
+@case('parse_vcf.multisample_2k_x_200')
+def bench_parse_multisample():
+    from synth_vcf import generate_vcf
+    return _parse_case(generate_vcf(2000, samples=200, density=0.05, phased=True).encode())
+
+
+# determine_phenotype
+
+def _diplotypes():
+    """Every (gene, [allele, allele]) pair in the knowledge base."""
+    from pharmacogenomics.knowledge_base import KB
+    return [(gene, [a, b]) for gene in KB.genes for a in KB.allele_codes[gene] for b in KB.allele_codes[gene]]
+
+
+@case('determine_phenotype.scalar_all_diplotypes')
+def bench_phenotype_scalar():
+    from pharmacogenomics.rules_engine import determine_phenotype
+    diplotypes = _diplotypes()
+
+    def run():
+        for gene, alleles in diplotypes:
+            determine_phenotype(gene, alleles)
+    return run
+
+
+@case('determine_phenotype.batch_10k_per_gene')
+def bench_phenotype_batch():
+    import numpy as np
+    from pharmacogenomics.knowledge_base import KB
+    from pharmacogenomics.rules_engine import determine_phenotypes_cohort
+    rng = np.random.default_rng(0)
+    codes = {gene: rng.integers(0, len(KB.allele_codes[gene]) + 1, size=(10000, 2), dtype=np.int16)
+             for gene in KB.genes}
+    return lambda: determine_phenotypes_cohort(codes)
+
+
+# assess_risk
+
+@case('assess_risk.all_drugs_x_phenotypes')
+def bench_assess_risk():
+    from pharmacogenomics.knowledge_base import KB, PHENOTYPES
+    from pharmacogenomics.rules_engine import assess_risk
+    pairs = [(drug, phenotype) for drug in KB.drugs for phenotype in PHENOTYPES]
+
+    def run():
+        for drug, phenotype in pairs:
+            assess_risk(drug, phenotype)
+    return run
+
+
+# generate_explanation
+
+def _explanation_args():
+    from pharmacogenomics.vcf_parser import parse_vcf
+    variants = [v for v in parse_vcf(SAMPLE_VCF)['variants'] if v['gene'] == 'CYP2D6']
+    return ('PATIENT_BENCH', 'CODEINE', 'Adjust Dosage', 'IM', variants, 'CYP2D6')
+
+
+@case('generate_explanation.stub_llm')
+def bench_explanation_llm():
+    from pharmacogenomics.llm_explainer import generate_explanation
+    args = _explanation_args()
+
+    def run():
+        _clear_caches()
+        generate_explanation(*args)
+    return run
+
+
+@case('generate_explanation.cached')
+def bench_explanation_cached():
+    from pharmacogenomics.llm_explainer import generate_explanation
+    args = _explanation_args()
+    generate_explanation(*args)
+    return lambda: generate_explanation(*args)
+
+
+@case('generate_explanation.fallback')
+def bench_explanation_fallback():
+    from pharmacogenomics.llm_explainer import generate_fallback_explanation
+    args = _explanation_args()
+    return lambda: generate_fallback_explanation(*args)
+
+
+# /analyze
+
+def _analyze_case(drugs, vcf_bytes, filename='sample.vcf', clear=True):
+    from app import app
+    client = app.test_client()
+
+    def run():
+        if clear:
+            _clear_caches()
+        response = client.post('/analyze', data={'drugs': drugs, 'vcf': (io.BytesIO(vcf_bytes), filename)})
+        if response.status_code != 200:
+            raise RuntimeError(f"/analyze returned {response.status_code}: {response.get_data(as_text=True)[:200]}")
+    return run
+
+
+def _sample_bytes():
+    with open(SAMPLE_VCF, 'rb') as f:
+        return f.read()
+
+
+@case('analyze.sample_one_drug')
+def bench_analyze_one_drug():
+    return _analyze_case('CODEINE', _sample_bytes())
+
+
+@case('analyze.sample_all_drugs')
+def bench_analyze_all_drugs():
+    from pharmacogenomics.analysis import SUPPORTED_DRUGS
+    return _analyze_case(','.join(SUPPORTED_DRUGS), _sample_bytes())
+
+
+@case('analyze.sample_all_drugs_cached')
+def bench_analyze_cached():
+    from pharmacogenomics.analysis import SUPPORTED_DRUGS
+    return _analyze_case(','.join(SUPPORTED_DRUGS), _sample_bytes(), clear=False)
+
+
+@case('analyze.multisample_500x50')
+def bench_analyze_multisample():
+    from synth_vcf import generate_vcf
+    from pharmacogenomics.analysis import SUPPORTED_DRUGS
+    return _analyze_case(','.join(SUPPORTED_DRUGS), generate_vcf(500, samples=50, density=0.2).encode())
+
+
+def measure(func, rounds, min_time):
+    """Return per-call timings: ``rounds`` samples, each averaged over enough calls to last ``min_time``."""
+    func()  # warm up: lazy imports, first-call caches
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time or number >= 1 << 20:
+            break
+        number *= 10 if elapsed < min_time / 10 else 2
+
+    samples = [elapsed / number]
+    for _ in range(rounds - 1):
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        samples.append((time.perf_counter() - start) / number)
+    return {
+        'median': statistics.median(samples),
+        'min': min(samples),
+        'mean': statistics.mean(samples),
+        'stdev': statistics.stdev(samples) if len(samples) > 1 else 0.0,
+        'rounds': rounds,
+        'number': number
+    }
+
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=BACKEND_DIR, capture_output=True,
+                              text=True, timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def _format_seconds(seconds):
+    for unit, scale in (('s', 1), ('ms', 1e-3), ('us', 1e-6)):
+        if seconds >= scale:
+            return f"{seconds / scale:8.2f} {unit}"
+    return f"{seconds / 1e-9:8.0f} ns"
+
+
+def compare(results, baseline, threshold):
+    """Print each case against the baseline; return the names slower than ``threshold`` x baseline median."""
+    regressions = []
+    print(f"\n{'case':45} {'baseline':>12} {'current':>12} {'ratio':>7}")
+    for name, result in results['benchmarks'].items():
+        base = baseline.get('benchmarks', {}).get(name)
+        if base is None:
+            print(f"{name:45} {'-':>12} {_format_seconds(result['median']):>12}     new")
+            continue
+        ratio = result['median'] / base['median'] if base['median'] else float('inf')
+        flag = ''
+        if ratio > threshold:
+            flag = '  REGRESSION'
+            regressions.append(name)
+        elif ratio < 1 / threshold:
+            flag = '  faster'
+        print(f"{name:45} {_format_seconds(base['median']):>12} {_format_seconds(result['median']):>12} "
+              f"{ratio:6.2f}x{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('-k', '--filter', action='append',
+                        help='only run cases matching this glob (repeatable), e.g. "analyze.*"')
+    parser.add_argument('--rounds', type=int, default=7, help='timing rounds per case (default: 7)')
+    parser.add_argument('--min-time', type=float, default=0.2, help='minimum seconds per round (default: 0.2)')
+    parser.add_argument('--llm-latency', type=float, default=0.0,
+                        help='stub LLM response delay in seconds (default: 0, measures client overhead only)')
+    parser.add_argument('--save', metavar='PATH', help='write results as a JSON baseline')
+    parser.add_argument('--compare', metavar='PATH', help='compare against a saved baseline')
+    parser.add_argument('--threshold', type=float, default=1.25,
+                        help='slowdown ratio that counts as a regression (default: 1.25)')
+    parser.add_argument('--list', action='store_true', help='list case names and exit')
+    args = parser.parse_args()
+
+    selected = [(name, setup) for name, setup in CASES
+                if not args.filter or any(fnmatch.fnmatch(name, pattern) or pattern in name
+                                          for pattern in args.filter)]
+    if args.list:
+        print('\n'.join(name for name, _ in selected))
+        return
+
+    from stub_openai import start_stub
+    stub, url = start_stub(latency=args.llm_latency, seed=0)
+    configure_environment(url)
+
+    results = {
+        'meta': {
+            'date': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'commit': _git_commit(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'machine': platform.machine(),
+            'cpu_count': os.cpu_count(),
+            'llm_latency': args.llm_latency
+        },
+        'benchmarks': {}
+    }
+    for name, setup in selected:
+        result = measure(setup(), args.rounds, args.min_time)
+        results['benchmarks'][name] = result
+        print(f"{name:45} {_format_seconds(result['median'])}  "
+              f"(min {_format_seconds(result['min']).strip()}, +/- {_format_seconds(result['stdev']).strip()}, "
+              f"{result['rounds']} x {result['number']})", flush=True)
+    stub.shutdown()
+
+    if args.save:
+        os.makedirs(os.path.dirname(os.path.abspath(args.save)), exist_ok=True)
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+            f.write('\n')
+        print(f"\nSaved baseline to {args.save}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} case(s) slower than {args.threshold}x baseline: {', '.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""Synthetic VCF generator for benchmarks.
+
+Writes a VCF with a configurable number of records, sample columns and
+pharmacogene density. Pharmacogene records are real star-allele defining
+variants (so they exercise the position matcher or, with --annotated, the
+GENE/STAR fast path); the rest are background SNVs on other chromosomes.
+Output is deterministic for a given seed. Run from the backend directory:
+
+    python benchmarks/synth_vcf.py -o /tmp/synth.vcf.gz --records 100000 --samples 50 --density 0.001
+"""
+
+import argparse
+import gzip
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from pharmacogenomics.allele_definitions import VARIANT_DEFINITIONS  # noqa: E402
+
+# Chromosomes without pharmacogene windows, for background records
+BACKGROUND_CHROMS = ('2', '3', '4', '5', '7', '8', '9', '11', '13', '14', '15', '16', '17', '18', '20', '21')
+BASES = 'ACGT'
+
+
+def _genotype(rng, phased, frequency):
+    alleles = [1 if rng.random() < frequency else 0 for _ in range(2)]
+    if phased:
+        return f'{alleles[0]}|{alleles[1]}:1'
+    return f'{alleles[0]}/{alleles[1]}'
+
+
+def generate_vcf(records=10000, samples=0, density=0.01, seed=0, annotated=False, phased=False,
+                 assembly='GRCh38', allele_frequency=0.2):
+    """Return synthetic VCF text.
+
+    ``density`` is the fraction of records that are pharmacogene defining
+    variants (at least one of each when density > 0). ``samples`` adds
+    that many genotype columns (GT, plus PS when ``phased``), otherwise the
+    file is sites-only.
+    """
+    rng = random.Random(seed)
+    position_index = 6 if assembly == 'GRCh37' else 7
+    lines = ['##fileformat=VCFv4.2', f'##reference={assembly}', '##source=PharmaGuardSynthetic']
+    if annotated:
+        lines.append('##INFO=<ID=GENE,Number=1,Type=String,Description="Gene name">')
+        lines.append('##INFO=<ID=STAR,Number=1,Type=String,Description="Star allele">')
+    if samples:
+        lines.append('##FORMAT=<ID=GT,Number=1,Type=String,Description="Genotype">')
+        if phased:
+            lines.append('##FORMAT=<ID=PS,Number=1,Type=Integer,Description="Phase set">')
+    header = '#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO'
+    if samples:
+        header += '\tFORMAT\t' + '\t'.join(f'S{i:05d}' for i in range(samples))
+    lines.append(header)
+
+    pharmacogene_records = max(1, int(records * density)) if density > 0 else 0
+    kinds = [True] * pharmacogene_records + [False] * (records - pharmacogene_records)
+    rng.shuffle(kinds)
+    format_column = 'GT:PS' if phased else 'GT'
+    background_pos = 1000000
+    for is_pharmacogene in kinds:
+        if is_pharmacogene:
+            definition = rng.choice(VARIANT_DEFINITIONS)
+            rsid, gene, star, chrom, ref, alt = definition[:6]
+            pos = definition[position_index]
+            info = f'GENE={gene};STAR={star};AF=0.2' if annotated else 'AF=0.2'
+        else:
+            background_pos += rng.randint(50, 500)
+            chrom, pos, rsid = rng.choice(BACKGROUND_CHROMS), background_pos, '.'
+            ref = rng.choice(BASES)
+            alt = rng.choice(BASES.replace(ref, ''))
+            info = 'AF=0.01'
+        fields = [chrom, str(pos), rsid, ref, alt, str(rng.randint(30, 99)), 'PASS', info]
+        if samples:
+            frequency = allele_frequency if is_pharmacogene else 0.01
+            fields.append(format_column)
+            fields.extend(_genotype(rng, phased, frequency) for _ in range(samples))
+        lines.append('\t'.join(fields))
+    return '\n'.join(lines) + '\n'
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('-o', '--output', required=True, help='output path; .gz compresses')
+    parser.add_argument('--records', type=int, default=10000)
+    parser.add_argument('--samples', type=int, default=0, help='genotype columns (default: sites-only)')
+    parser.add_argument('--density', type=float, default=0.01, help='fraction of pharmacogene records')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--annotated', action='store_true', help='add GENE/STAR INFO tags')
+    parser.add_argument('--phased', action='store_true', help='phased GT with a PS field')
+    parser.add_argument('--assembly', choices=('GRCh37', 'GRCh38'), default='GRCh38')
+    args = parser.parse_args()
+
+    text = generate_vcf(args.records, args.samples, args.density, args.seed, args.annotated, args.phased,
+                        args.assembly)
+    opener = gzip.open if args.output.endswith('.gz') else open
+    with opener(args.output, 'wt', encoding='utf-8') as f:
+        f.write(text)
+    print(f"wrote {args.records} records x {args.samples} samples to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
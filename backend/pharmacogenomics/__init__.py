@@ -1 +1 @@
-# Pharmacogenomics Module
+# Pharmacogenomics Module
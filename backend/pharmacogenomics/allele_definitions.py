@@ -0,0 +1,63 @@
+# Star-allele defining variants (PharmVar/CPIC core SNVs)
+#
+# Alleles are given on the forward genomic strand as they appear in VCF
+# records, so CYP2D6, TPMT and DPYD (reverse-strand genes) differ from the
+# cDNA notation used in the allele names.
+from .regions import normalize_chrom
+
+# (rsid, gene, star_allele, chrom, ref, alt, GRCh37 position, GRCh38 position)
+VARIANT_DEFINITIONS = [
+    ('rs16947', 'CYP2D6', '*2', '22', 'G', 'A', 42523943, 42127941),
+    ('rs3892097', 'CYP2D6', '*4', '22', 'C', 'T', 42524947, 42128945),
+    ('rs1065852', 'CYP2D6', '*10', '22', 'G', 'A', 42526694, 42130692),
+    ('rs28371706', 'CYP2D6', '*17', '22', 'G', 'A', 42525772, 42129770),
+    ('rs28371725', 'CYP2D6', '*41', '22', 'C', 'T', 42523805, 42127803),
+    ('rs4244285', 'CYP2C19', '*2', '10', 'G', 'A', 96541616, 94781859),
+    ('rs4986893', 'CYP2C19', '*3', '10', 'G', 'A', 96540410, 94780653),
+    ('rs12248560', 'CYP2C19', '*17', '10', 'C', 'T', 96521657, 94761900),
+    ('rs1799853', 'CYP2C9', '*2', '10', 'C', 'T', 96702047, 94942290),
+    ('rs1057910', 'CYP2C9', '*3', '10', 'A', 'C', 96741053, 94981296),
+    ('rs4149056', 'SLCO1B1', '*5', '12', 'T', 'C', 21331549, 21178615),
+    ('rs1800462', 'TPMT', '*2', '6', 'C', 'G', 18143955, 18143724),
+    ('rs1800460', 'TPMT', '*3B', '6', 'C', 'T', 18139228, 18138997),
+    ('rs1142345', 'TPMT', '*3C', '6', 'T', 'C', 18130918, 18130687),
+    ('rs3918290', 'DPYD', '*2A', '1', 'C', 'T', 97915614, 97450058),
+    ('rs55886062', 'DPYD', 'c.1679T>G', '1', 'A', 'C', 97981395, 97515839),
+    ('rs67376798', 'DPYD', 'c.2846A>T', '1', 'T', 'A', 97547947, 97082391)
+]
+
+# Star alleles defined by more than one variant: (gene, star allele, defining rsIDs).
+# The caller only reports these when all of their variants are on one haplotype.
+HAPLOTYPE_DEFINITIONS = [
+    ('TPMT', '*3A', ('rs1800460', 'rs1142345'))  # *3B + *3C in cis
+]
+
+# rsID -> (gene, star allele, alt)
+RSID_INDEX = {rsid: (gene, star, alt) for rsid, gene, star, _, _, alt, _, _ in VARIANT_DEFINITIONS}
+
+# assembly -> (chrom, pos) -> (rsid, gene, star allele, alt)
+POSITION_INDEX = {
+    'GRCh37': {(chrom, pos37): (rsid, gene, star, alt)
+               for rsid, gene, star, chrom, _, alt, pos37, _ in VARIANT_DEFINITIONS},
+    'GRCh38': {(chrom, pos38): (rsid, gene, star, alt)
+               for rsid, gene, star, chrom, _, alt, _, pos38 in VARIANT_DEFINITIONS}
+}
+
+
+def lookup_star_allele(assembly, chrom, pos, rsid, alts):
+    """Return (rsid, star allele, alt index) for a record matching a defining variant, else None.
+
+    Matches on position first and falls back to the rsID, and in both cases
+    requires the defining alt allele to be among the record's ALT alleles.
+    The alt index is that allele's GT index (1 for the first ALT).
+    """
+    match = POSITION_INDEX.get(assembly, {}).get((normalize_chrom(chrom), pos))
+    if match is not None:
+        def_rsid, _, star, alt = match
+        if alt in alts:
+            return def_rsid, star, alts.index(alt) + 1
+    if rsid in RSID_INDEX:
+        _, star, alt = RSID_INDEX[rsid]
+        if alt in alts:
+            return rsid, star, alts.index(alt) + 1
+    return None
@@ -0,0 +1,453 @@
+# Per-patient analysis pipeline shared by the API endpoints
+import asyncio
+import os
+import re
+import uuid
+import weakref
+from concurrent.futures import ThreadPoolExecutor, TimeoutError, as_completed, wait
+from datetime import datetime
+from functools import partial
+from itertools import groupby
+
+from .cpic_mappings import DRUG_GENE_MAP
+from .genotypes import sample_variants
+from .knowledge_base import KB
+from .llm_explainer import (agenerate_batch_explanations, agenerate_explanation, generate_batch_explanations,
+                            generate_explanation, generate_fallback_explanation)
+from .rules_engine import (ALLELE_CODES, ALLELE_PAD, FrozenBlock, determine_phenotype, determine_phenotypes_cohort,
+                           encode_compact, lookup_decision)
+from .star_caller import call_diplotype
+
+SUPPORTED_DRUGS = list(KB.drugs)
+
+# Explanation calls for one request run concurrently on a shared, bounded pool
+LLM_MAX_WORKERS = int(os.getenv('LLM_MAX_WORKERS', 8))
+LLM_DEADLINE = float(os.getenv('LLM_DEADLINE', 30))
+# Explain all of a patient's drugs with one completion request instead of one per drug
+LLM_BATCH_EXPLANATIONS = os.getenv('LLM_BATCH_EXPLANATIONS', 'true').lower() in ('1', 'true', 'yes')
+
+_explanation_pool = ThreadPoolExecutor(max_workers=LLM_MAX_WORKERS, thread_name_prefix='explain')
+
+# Completion requests one event loop keeps in flight at once (async serving path)
+LLM_MAX_CONCURRENT = int(os.getenv('LLM_MAX_CONCURRENT', 256))
+_explanation_limits = weakref.WeakKeyDictionary()
+
+
+def new_patient_id():
+    return f"PATIENT_{uuid.uuid4().hex[:8].upper()}"
+
+
+def group_by_gene(variants):
+    """Group variant dicts by their gene."""
+    gene_variants = {}
+    for v in variants:
+        gene = v['gene']
+        if gene not in gene_variants:
+            gene_variants[gene] = []
+        gene_variants[gene].append(v)
+    return gene_variants
+
+
+def sample_diplotypes(variants):
+    """Call gene -> (allele, allele) for every gene with star-allele-annotated variants."""
+    called = {}
+    for v in variants:
+        if v['star_allele']:
+            called.setdefault(v['gene'], []).append(v)
+    return {gene: call_diplotype(gene, gene_variants) for gene, gene_variants in called.items()}
+
+
+def analyze_patient(patient_id, drugs, variants, missing_annotations, explain=generate_explanation,
+                    phenotypes=None, on_result=None, on_explanation=None, diplotypes=None):
+    """Return one result dict per drug for a single patient's variants.
+
+    ``explain`` is called with the same arguments as ``generate_explanation``
+    and lets callers swap in the fallback explainer for bulk runs.
+    ``phenotypes`` optionally maps gene -> phenotype precomputed by the
+    batch engine, skipping the scalar ``determine_phenotype`` call, and
+    ``diplotypes`` the matching gene -> (allele, allele) calls.
+    ``on_result`` is called with each drug's result as soon as its rules
+    part is ready (``llm_generated_explanation`` still None), and
+    ``on_explanation`` once its explanation has been filled in.
+    """
+    gene_variants = group_by_gene(variants)
+    if diplotypes is None:
+        diplotypes = sample_diplotypes(variants)
+    results = []
+    explained = []
+    explanation_args = []
+
+    for drug in drugs:
+        # Validate drug support
+        if drug not in SUPPORTED_DRUGS:
+            results.append({
+                'patient_id': patient_id,
+                'drug': drug,
+                'timestamp': datetime.utcnow().isoformat() + 'Z',
+                'error': f'Unsupported drug. Supported drugs: {", ".join(SUPPORTED_DRUGS)}',
+                'risk_assessment': {
+                    'risk_label': 'Unknown',
+                    'confidence_score': 0.0,
+                    'severity': 'unknown'
+                }
+            })
+            if on_result:
+                on_result(results[-1])
+            continue
+
+        # Get primary gene for drug
+        gene = DRUG_GENE_MAP[drug]
+        variants_for_gene = gene_variants.get(gene, [])
+
+        # Determine phenotype and risk
+        if not variants_for_gene:
+            phenotype = 'Unknown'
+            diplotype = 'Unknown'
+            decision = lookup_decision(drug, phenotype)
+            confidence = 0.5
+            detected = []
+            # Use empty list for explanation when no variants
+            explanation_variants = []
+        else:
+            # Diplotype called from the sample's haplotypes; the phenotype comes from the same allele pair
+            alleles = diplotypes.get(gene, ())
+            diplotype = '/'.join(alleles) if alleles else 'Unknown'
+
+            # Determine phenotype
+            if phenotypes and gene in phenotypes:
+                phenotype = phenotypes[gene]
+            else:
+                phenotype = determine_phenotype(gene, list(alleles))
+
+            # Assess risk
+            decision = lookup_decision(drug, phenotype)
+
+            # Calculate confidence based on variant quality
+            avg_quality = sum([v['quality'] for v in variants_for_gene]) / len(variants_for_gene)
+            confidence = min(0.95, 0.7 + (avg_quality / 100) * 0.25)
+
+            # Build detected variants list
+            detected = [{
+                'rsid': v['rsid'],
+                'gene': v['gene'],
+                'allele': v['star_allele']
+            } for v in variants_for_gene]
+
+            # Use variants for explanation
+            explanation_variants = variants_for_gene
+
+        # LLM explanation is generated below, concurrently for all drugs
+        explanation_args.append((patient_id, drug, decision.risk_label, phenotype, explanation_variants, gene))
+
+        # Build output JSON matching EXACT schema
+        result = {
+            'patient_id': patient_id,
+            'drug': drug,
+            'timestamp': datetime.utcnow().isoformat() + 'Z',
+            'risk_assessment': decision.risk_assessment(round(confidence, 2)),
+            'pharmacogenomic_profile': {
+                'primary_gene': gene,
+                'diplotype': diplotype,
+                'phenotype': phenotype,
+                'detected_variants': detected
+            },
+            'clinical_recommendation': decision.clinical_recommendation,
+            'llm_generated_explanation': None,
+            'quality_metrics': {
+                'vcf_parsing_success': True,
+                'missing_annotations': missing_annotations,
+                'confidence_level': 'high' if confidence > 0.8 else 'medium' if confidence > 0.5 else 'low'
+            }
+        }
+        results.append(result)
+        explained.append(result)
+        if on_result:
+            on_result(result)
+
+    for i, explanation in iter_explanations(explanation_args, explain):
+        explained[i]['llm_generated_explanation'] = explanation
+        if on_explanation:
+            on_explanation(explained[i])
+
+    return results
+
+
+def explain_concurrently(calls, explain=generate_explanation, deadline=None):
+    """Run ``explain`` for each argument tuple in parallel, returning results in order."""
+    explanations = [None] * len(calls)
+    for i, explanation in iter_explanations(calls, explain, deadline):
+        explanations[i] = explanation
+    return explanations
+
+
+def iter_explanations(calls, explain=generate_explanation, deadline=None):
+    """Run ``explain`` for each argument tuple in parallel, yielding (index, explanation) as each finishes.
+
+    Calls still running when ``deadline`` seconds have passed (or that raise)
+    are answered with ``generate_fallback_explanation`` instead, so the wall
+    time is bounded by roughly one LLM round-trip. Cheap explainers such as
+    the fallback itself run inline. With ``LLM_BATCH_EXPLANATIONS`` set,
+    ``generate_explanation`` calls are sent as one batched request instead.
+    """
+    if explain is generate_fallback_explanation or isinstance(explain, DeferredExplanations) or not calls:
+        for i, args in enumerate(calls):
+            yield i, explain(*args)
+        return
+
+    deadline = LLM_DEADLINE if deadline is None else deadline
+    if explain is generate_explanation and LLM_BATCH_EXPLANATIONS and len(calls) > 1:
+        yield from enumerate(explain_batched(calls, deadline))
+        return
+
+    pending = {_explanation_pool.submit(explain, *args): i for i, args in enumerate(calls)}
+    try:
+        for future in as_completed(list(pending), timeout=deadline):
+            i = pending.pop(future)
+            if future.exception() is not None:
+                print(f"Explanation failed for {calls[i][1]}: {future.exception()}")
+                yield i, generate_fallback_explanation(*calls[i])
+            else:
+                yield i, future.result()
+    except TimeoutError:
+        for future, i in pending.items():
+            if future.done() and future.exception() is None:
+                yield i, future.result()
+                continue
+            future.cancel()
+            print(f"Explanation for {calls[i][1]} missed the {deadline}s deadline; using fallback")
+            yield i, generate_fallback_explanation(*calls[i])
+
+
+def explain_batched(calls, deadline):
+    """Run ``generate_batch_explanations`` under ``deadline``, falling back for every call on timeout."""
+    future = _explanation_pool.submit(generate_batch_explanations, calls)
+    wait([future], timeout=deadline)
+    if not future.done():
+        future.cancel()
+        print(f"Batched explanation missed the {deadline}s deadline; using fallback")
+    elif future.exception() is not None:
+        print(f"Batched explanation failed: {future.exception()}")
+    else:
+        return future.result()
+    return [generate_fallback_explanation(*args) for args in calls]
+
+
+class DeferredExplanations:
+    """Explainer that records ``generate_explanation`` calls instead of making them.
+
+    Passed to ``run_analysis`` as ``explain`` (with ``record`` as its
+    ``on_explanation``), every result is built with
+    ``llm_generated_explanation`` None and ``entries`` holds one
+    (args, result) pair per explanation, in order.
+    """
+
+    def __init__(self):
+        self.calls = []
+        self.results = []
+
+    def __call__(self, *args):
+        self.calls.append(args)
+        return None
+
+    def record(self, result):
+        self.results.append(result)
+
+    @property
+    def entries(self):
+        return list(zip(self.calls, self.results))
+
+
+def _explanation_limit():
+    """Semaphore bounding completion requests on the running event loop."""
+    loop = asyncio.get_running_loop()
+    limit = _explanation_limits.get(loop)
+    if limit is None:
+        limit = _explanation_limits[loop] = asyncio.Semaphore(LLM_MAX_CONCURRENT)
+    return limit
+
+
+async def _limited(func, *args):
+    async with _explanation_limit():
+        return await func(*args)
+
+
+async def aexplain(calls, deadline=None):
+    """``explain_concurrently`` for asyncio callers, using non-blocking completion requests.
+
+    The same rules apply: with ``LLM_BATCH_EXPLANATIONS`` one patient's
+    calls go out as one batched request, and anything not answered within
+    ``deadline`` seconds (or that raised) gets the fallback explanation.
+    """
+    if not calls:
+        return []
+    deadline = LLM_DEADLINE if deadline is None else deadline
+    if LLM_BATCH_EXPLANATIONS and len(calls) > 1:
+        task = asyncio.ensure_future(_limited(agenerate_batch_explanations, calls))
+        await asyncio.wait([task], timeout=deadline)
+        if not task.done():
+            task.cancel()
+            print(f"Batched explanation missed the {deadline}s deadline; using fallback")
+        elif task.exception() is not None:
+            print(f"Batched explanation failed: {task.exception()}")
+        else:
+            return task.result()
+        return [generate_fallback_explanation(*args) for args in calls]
+
+    tasks = [asyncio.ensure_future(_limited(agenerate_explanation, *args)) for args in calls]
+    await asyncio.wait(tasks, timeout=deadline)
+    explanations = []
+    for task, args in zip(tasks, calls):
+        if not task.done():
+            task.cancel()
+            print(f"Explanation for {args[1]} missed the {deadline}s deadline; using fallback")
+        elif task.exception() is not None:
+            print(f"Explanation failed for {args[1]}: {task.exception()}")
+        else:
+            explanations.append(task.result())
+            continue
+        explanations.append(generate_fallback_explanation(*args))
+    return explanations
+
+
+def cohort_allele_codes(calls):
+    """Build per-gene (samples x 2) allele-code matrices from per-sample diplotype calls.
+
+    ``calls`` holds one gene -> (allele, allele) dict per sample; samples
+    without a call for a gene get padding rows (phenotype Unknown).
+    """
+    import numpy as np
+    codes_by_gene = {}
+    for j, sample_calls in enumerate(calls):
+        for gene, alleles in sample_calls.items():
+            codes = codes_by_gene.get(gene)
+            if codes is None:
+                codes = codes_by_gene[gene] = np.full((len(calls), 2), ALLELE_PAD, dtype=np.int16)
+            gene_codes = ALLELE_CODES.get(gene, {})
+            codes[j] = [gene_codes.get(allele, 0) for allele in alleles]
+    return codes_by_gene
+
+
+def analyze_samples(parse_result, drugs, explain=generate_explanation, on_result=None, on_explanation=None):
+    """Run the per-drug analysis for every sample column of a parsed VCF.
+
+    Returns a dict keyed by sample ID (from the ``#CHROM`` header line).
+    Each sample's carried variants are selected from the genotype matrix
+    and its diplotypes called from their GT/PS phasing; phenotypes for
+    every sample and gene are then looked up in one vectorized pass. The
+    sample ID is used as its ``patient_id``.
+    """
+    variants = parse_result['variants']
+    missing_annotations = parse_result['missing_annotations']
+    per_sample = [
+        sample_variants(variants, parse_result['genotypes'], j, parse_result['haplotypes'], parse_result['phase_sets'])
+        for j in range(len(parse_result['samples']))
+    ]
+    calls = [sample_diplotypes(carried) for carried in per_sample]
+    cohort_phenotypes = determine_phenotypes_cohort(cohort_allele_codes(calls))
+    return {
+        sample_id: analyze_patient(sample_id, drugs, per_sample[j], missing_annotations, explain,
+                                   {gene: labels[j] for gene, labels in cohort_phenotypes.items()},
+                                   on_result, on_explanation, calls[j])
+        for j, sample_id in enumerate(parse_result['samples'])
+    }
+
+
+def run_analysis(parse_result, drugs, explain=generate_explanation, on_result=None, on_explanation=None,
+                 patient_id=None):
+    """Analyze a parsed VCF and return the ``/analyze`` response payload.
+
+    Multi-sample VCFs give ``{'sample_count', 'samples'}`` keyed by sample
+    ID; otherwise one result (or a list for several drugs) for
+    ``patient_id`` or a new patient ID. A single genotyped sample keeps
+    only the variants it carries. The callbacks are passed through to
+    ``analyze_patient``.
+    """
+    samples = parse_result['samples']
+    if len(samples) > 1:
+        per_sample = analyze_samples(parse_result, drugs, explain, on_result, on_explanation)
+        return {
+            'sample_count': len(samples),
+            'samples': {
+                sample_id: results if len(results) > 1 else results[0]
+                for sample_id, results in per_sample.items()
+            }
+        }
+
+    variants = parse_result['variants']
+    if samples:
+        variants = sample_variants(variants, parse_result['genotypes'], 0, parse_result['haplotypes'],
+                                   parse_result['phase_sets'])
+    results = analyze_patient(patient_id or new_patient_id(), drugs, variants, parse_result['missing_annotations'], explain,
+                              on_result=on_result, on_explanation=on_explanation)
+    # Single object for one drug, array for several
+    return results if len(results) > 1 else results[0]
+
+
+async def arun_analysis(parse_result, drugs, explain=generate_explanation, on_result=None, on_explanation=None,
+                        patient_id=None, executor=None):
+    """``run_analysis`` for asyncio callers; the payload is identical.
+
+    Genotyping and rules run in ``executor`` (the loop's default when None)
+    so they never block the event loop. ``generate_explanation`` calls are
+    deferred and then made as non-blocking completion requests, every
+    patient at once, so an analysis waiting on the LLM holds no thread.
+    Other explainers (the fallback) run with the rules.
+    """
+    loop = asyncio.get_running_loop()
+    if explain is not generate_explanation:
+        return await loop.run_in_executor(executor, partial(
+            run_analysis, parse_result, drugs, explain, on_result, on_explanation, patient_id))
+
+    deferred = DeferredExplanations()
+    payload = await loop.run_in_executor(executor, partial(
+        run_analysis, parse_result, drugs, deferred, on_result, deferred.record, patient_id))
+
+    async def explain_patient(entries):
+        explanations = await aexplain([args for args, _ in entries])
+        for (_, result), explanation in zip(entries, explanations):
+            result['llm_generated_explanation'] = explanation
+            if on_explanation:
+                on_explanation(result)
+
+    # One group per patient (analyze_patient records its calls contiguously), as in the sync path
+    await asyncio.gather(*(explain_patient(list(entries))
+                           for _, entries in groupby(deferred.entries, key=lambda entry: entry[0][0])))
+    return payload
+
+
+# Placeholder for FrozenBlock values during encoding; the random nonce keeps
+# user-supplied strings from ever matching it
+_BLOCK_NONCE = uuid.uuid4().hex
+_BLOCK_PLACEHOLDER = re.compile(r'"\\u0000' + _BLOCK_NONCE + r':(\d+)"')
+
+
+def encode_json(payload):
+    """Serialize a response payload, splicing in pre-encoded ``FrozenBlock`` values.
+
+    Output matches Flask's production ``jsonify`` encoding (sorted keys,
+    compact separators), so switching encoders does not change responses.
+    Blocks are swapped for placeholder strings, the payload is encoded in a
+    single C-level ``json.dumps`` call, and the placeholders are then
+    replaced with the blocks' stored encodings in one pass.
+    """
+    fragments = []
+
+    def swap(obj):
+        if isinstance(obj, dict):
+            if any(isinstance(value, FrozenBlock) for value in obj.values()):
+                # A result dict: only its blocks need swapping
+                swapped = dict(obj)
+                for key, value in obj.items():
+                    if isinstance(value, FrozenBlock):
+                        fragments.append(value.encoded)
+                        swapped[key] = f'\x00{_BLOCK_NONCE}:{len(fragments) - 1}'
+                return swapped
+            return {key: swap(value) for key, value in obj.items()}
+        if isinstance(obj, list):
+            return [swap(item) for item in obj]
+        return obj
+
+    encoded = encode_compact(swap(payload))
+    if not fragments:
+        return encoded
+    return _BLOCK_PLACEHOLDER.sub(lambda m: fragments[int(m.group(1))], encoded)
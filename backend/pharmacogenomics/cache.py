@@ -0,0 +1,335 @@
+# Two-tier (in-process LRU + SQLite) cache for JSON-serializable values, and
+# coalescing of concurrent misses for the same key
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process locks
+    fcntl = None
+
+
+def canonical_key(*parts):
+    """Return a stable SHA-256 hex digest of JSON-serializable key parts."""
+    payload = json.dumps(parts, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def private_directory(directory):
+    """Create ``directory`` (and any parents) accessible only to this user.
+
+    An existing directory is tightened to 0700; one owned by another user
+    (e.g. planted in a shared temp dir) is refused with ``PermissionError``.
+    """
+    os.makedirs(directory, mode=0o700, exist_ok=True)
+    if hasattr(os, 'getuid'):
+        st = os.stat(directory)
+        if st.st_uid != os.getuid():
+            raise PermissionError(f"{directory} is owned by another user")
+        if st.st_mode & 0o077:
+            os.chmod(directory, 0o700)
+
+
+def private_file(path):
+    """Create ``path`` if needed, readable and writable only by this user."""
+    os.close(os.open(path, os.O_RDWR | os.O_CREAT, 0o600))
+    if hasattr(os, 'getuid') and os.stat(path).st_mode & 0o077:
+        os.chmod(path, 0o600)
+
+
+class LRUCache:
+    """Thread-safe in-memory LRU with a per-entry TTL."""
+
+    def __init__(self, max_entries=1024, ttl=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            value, expires = entry
+            if expires is not None and expires < time.time():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        expires = time.time() + self.ttl if self.ttl else None
+        with self._lock:
+            self._data[key] = (value, expires)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class SQLiteCache:
+    """Disk-backed cache with TTL and size-based (least recently used) eviction.
+
+    Safe to share between threads and between worker processes pointing at
+    the same file; each process opens its own connection lazily. The file
+    is created 0600 in a 0700 directory (SQLite gives its -wal and -shm
+    files the same mode).
+    """
+
+    EVICT_EVERY = 100  # writes between size checks
+
+    def __init__(self, path, max_entries=10000, ttl=None):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._conn = None
+        self._pid = None
+        self._writes = 0
+
+    def _connection(self):
+        if self._conn is None or self._pid != os.getpid():
+            directory = os.path.dirname(self.path)
+            if directory:
+                private_directory(directory)
+            private_file(self.path)
+            self._conn = sqlite3.connect(self.path, timeout=5, check_same_thread=False, isolation_level=None)
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS cache ('
+                'key TEXT PRIMARY KEY, value TEXT NOT NULL, expires REAL, accessed REAL NOT NULL)'
+            )
+            self._conn.execute('CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed)')
+            self._pid = os.getpid()
+        return self._conn
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            conn = self._connection()
+            row = conn.execute('SELECT value, expires FROM cache WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                return None
+            value, expires = row
+            if expires is not None and expires < now:
+                conn.execute('DELETE FROM cache WHERE key = ?', (key,))
+                return None
+            conn.execute('UPDATE cache SET accessed = ? WHERE key = ?', (now, key))
+        return json.loads(value)
+
+    def set(self, key, value):
+        now = time.time()
+        expires = now + self.ttl if self.ttl else None
+        with self._lock:
+            conn = self._connection()
+            conn.execute(
+                'INSERT OR REPLACE INTO cache (key, value, expires, accessed) VALUES (?, ?, ?, ?)',
+                (key, json.dumps(value), expires, now)
+            )
+            self._writes += 1
+            if self._writes % self.EVICT_EVERY == 0:
+                self._evict(conn, now)
+
+    def _evict(self, conn, now):
+        conn.execute('DELETE FROM cache WHERE expires IS NOT NULL AND expires < ?', (now,))
+        conn.execute(
+            'DELETE FROM cache WHERE key IN ('
+            'SELECT key FROM cache ORDER BY accessed DESC LIMIT -1 OFFSET ?)',
+            (self.max_entries,)
+        )
+
+    def clear(self):
+        with self._lock:
+            self._connection().execute('DELETE FROM cache')
+
+    def __len__(self):
+        with self._lock:
+            return self._connection().execute('SELECT COUNT(*) FROM cache').fetchone()[0]
+
+
+class TieredCache:
+    """In-process LRU in front of an optional SQLite store, with hit/miss counters."""
+
+    def __init__(self, memory, disk=None):
+        self.memory = memory
+        self.disk = disk
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        value = self.memory.get(key)
+        if value is not None:
+            self._count('memory_hits')
+            return value
+        if self.disk is not None:
+            try:
+                value = self.disk.get(key)
+            except (sqlite3.Error, OSError) as e:
+                print(f"Cache read failed: {e}")
+                value = None
+            if value is not None:
+                self.memory.set(key, value)
+                self._count('disk_hits')
+                return value
+        self._count('misses')
+        return None
+
+    def set(self, key, value):
+        self.memory.set(key, value)
+        if self.disk is not None:
+            try:
+                self.disk.set(key, value)
+            except (sqlite3.Error, OSError) as e:
+                print(f"Cache write failed: {e}")
+
+    def _count(self, name):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def stats(self):
+        hits = self.memory_hits + self.disk_hits
+        lookups = hits + self.misses
+        return {
+            'hits': hits,
+            'memory_hits': self.memory_hits,
+            'disk_hits': self.disk_hits,
+            'misses': self.misses,
+            'hit_ratio': round(hits / lookups, 4) if lookups else 0.0,
+            'memory_entries': len(self.memory)
+        }
+
+
+def tiered_cache_from_env(prefix, default_path, max_entries=1024, disk_max_entries=10000, ttl=7 * 24 * 3600):
+    """Build a ``TieredCache`` configured from ``<prefix>_*`` environment variables.
+
+    The disk tier is a SQLite file at ``<prefix>_PATH``, else ``default_path``;
+    an empty ``<prefix>_PATH`` or a None ``default_path`` with the variable
+    unset leaves the cache in memory only.
+    """
+    ttl = float(os.getenv(f'{prefix}_TTL', ttl)) or None
+    memory = LRUCache(int(os.getenv(f'{prefix}_SIZE', max_entries)), ttl)
+    path = os.getenv(f'{prefix}_PATH', default_path)
+    disk = SQLiteCache(path, int(os.getenv(f'{prefix}_MAX_ENTRIES', disk_max_entries)), ttl) if path else None
+    return TieredCache(memory, disk)
+
+
+class SingleFlight:
+    """Coalesces concurrent computations of the same key within a process.
+
+    The first caller to ``claim`` a key leads: it computes the value and
+    must ``resolve`` the key, even on failure. Later callers get the
+    leader's ``concurrent.futures.Future``; threads wait on it directly and
+    coroutines through ``asyncio.wrap_future``.
+    """
+
+    def __init__(self):
+        self._flights = {}
+        self._lock = threading.Lock()
+        self.coalesced = 0
+
+    def claim(self, key):
+        """Return None if the caller now leads ``key``, else the in-flight leader's future."""
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is None:
+                self._flights[key] = Future()
+                return None
+            self.coalesced += 1
+            return flight
+
+    def resolve(self, key, value):
+        """Hand ``value`` to every caller waiting on ``key`` and end its flight."""
+        with self._lock:
+            flight = self._flights.pop(key, None)
+        if flight is not None and not flight.done():
+            flight.set_result(value)
+
+    def __len__(self):
+        return len(self._flights)
+
+
+class FileLocks:
+    """Advisory per-key locks shared by worker processes, via ``flock`` on lock files.
+
+    Keys (hex digests) hash onto a fixed set of ``slots`` files, so the
+    directory never grows; unrelated keys sharing a slot just wait for each
+    other. Each lock is its own open file, so threads of one process
+    exclude each other too. The directory is private to this user, as for
+    ``SQLiteCache``. Unavailable where ``fcntl`` is (Windows).
+    """
+
+    supported = fcntl is not None
+    POLL_INTERVAL = 0.05
+
+    def __init__(self, directory, slots=256):
+        self.directory = directory
+        self.slots = slots
+        self._ready = False
+
+    def _path(self, slot):
+        return os.path.join(self.directory, f'{slot:03d}.lock')
+
+    def try_lock(self, keys):
+        """Lock the slots of ``keys`` that are free; return (handles, keys whose slot is held elsewhere)."""
+        if not self._ready:
+            private_directory(self.directory)
+            self._ready = True
+        handles = {}
+        busy_slots = set()
+        busy = []
+        for key in keys:
+            slot = int(key[:8], 16) % self.slots
+            if slot in handles:
+                continue
+            if slot not in busy_slots:
+                fd = os.open(self._path(slot), os.O_RDWR | os.O_CREAT, 0o600)
+                try:
+                    fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    os.close(fd)
+                    busy_slots.add(slot)
+                else:
+                    handles[slot] = fd
+                    continue
+            busy.append(key)
+        return list(handles.values()), busy
+
+    def lock(self, keys, timeout):
+        """Lock the slots of ``keys``, polling for up to ``timeout`` seconds; return the handles acquired."""
+        deadline = time.monotonic() + timeout
+        handles, busy = self.try_lock(keys)
+        while busy and time.monotonic() < deadline:
+            time.sleep(self.POLL_INTERVAL)
+            acquired, busy = self.try_lock(busy)
+            handles += acquired
+        return handles
+
+    async def alock(self, keys, timeout):
+        """``lock`` for asyncio callers; polls without blocking the event loop."""
+        deadline = time.monotonic() + timeout
+        handles, busy = self.try_lock(keys)
+        while busy and time.monotonic() < deadline:
+            await asyncio.sleep(self.POLL_INTERVAL)
+            acquired, busy = self.try_lock(busy)
+            handles += acquired
+        return handles
+
+    def release(self, handles):
+        for fd in handles:
+            os.close(fd)
@@ -0,0 +1,170 @@
+# `pharmaguard` command-line batch runner (no Flask required)
+import argparse
+import glob
+import json
+import os
+import sys
+
+from .analysis import SUPPORTED_DRUGS
+from .cohort import COHORT_JOBS, run_cohort
+
+# Rows buffered per Parquet row group
+PARQUET_BATCH_ROWS = 10000
+
+PARQUET_COLUMNS = [
+    ('file', 'string'),
+    ('patient_id', 'string'),
+    ('drug', 'string'),
+    ('error', 'string'),
+    ('risk_label', 'string'),
+    ('severity', 'string'),
+    ('confidence_score', 'float64'),
+    ('primary_gene', 'string'),
+    ('diplotype', 'string'),
+    ('phenotype', 'string'),
+    ('detected_variants', 'string'),
+    ('clinical_recommendation', 'string'),
+    ('summary', 'string'),
+    ('mechanism', 'string'),
+    ('variant_impact', 'string')
+]
+
+
+def expand_inputs(patterns):
+    """Expand paths and glob patterns (``**`` recurses) into a sorted, de-duplicated file list."""
+    paths = []
+    seen = set()
+    for pattern in patterns:
+        matches = sorted(glob.glob(pattern, recursive=True)) if glob.has_magic(pattern) else [pattern]
+        for path in matches:
+            if os.path.isdir(path) or path in seen:
+                continue
+            seen.add(path)
+            paths.append(path)
+    return paths
+
+
+def result_rows(record):
+    """Flatten one NDJSON record into one row per (patient, drug) for tabular output."""
+    name = record['file']
+    if 'error' in record:
+        return [{'file': name, 'error': record['error']}]
+
+    payload = record['result']
+    if isinstance(payload, dict) and 'samples' in payload:
+        results = []
+        for sample_results in payload['samples'].values():
+            results.extend(sample_results if isinstance(sample_results, list) else [sample_results])
+    else:
+        results = payload if isinstance(payload, list) else [payload]
+
+    rows = []
+    for result in results:
+        risk = result.get('risk_assessment', {})
+        profile = result.get('pharmacogenomic_profile', {})
+        explanation = result.get('llm_generated_explanation') or {}
+        rows.append({
+            'file': name,
+            'patient_id': result.get('patient_id'),
+            'drug': result.get('drug'),
+            'error': result.get('error'),
+            'risk_label': risk.get('risk_label'),
+            'severity': risk.get('severity'),
+            'confidence_score': risk.get('confidence_score'),
+            'primary_gene': profile.get('primary_gene'),
+            'diplotype': profile.get('diplotype'),
+            'phenotype': profile.get('phenotype'),
+            'detected_variants': json.dumps(profile['detected_variants']) if 'detected_variants' in profile else None,
+            'clinical_recommendation': json.dumps(result['clinical_recommendation'])
+            if 'clinical_recommendation' in result else None,
+            'summary': explanation.get('summary'),
+            'mechanism': explanation.get('mechanism'),
+            'variant_impact': explanation.get('variant_impact')
+        })
+    return rows
+
+
+def write_ndjson(lines, out):
+    for line in lines:
+        if not line.startswith('{"summary"'):
+            out.write(line + '\n')
+            out.flush()
+        yield line
+
+
+def write_parquet(lines, path):
+    """Write results to ``path`` as Parquet, one row group per ``PARQUET_BATCH_ROWS`` rows."""
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise SystemExit("Parquet output requires pyarrow (pip install pyarrow)")
+
+    schema = pa.schema([(name, getattr(pa, type_name)()) for name, type_name in PARQUET_COLUMNS])
+    rows = []
+    with pq.ParquetWriter(path, schema) as writer:
+        for line in lines:
+            if not line.startswith('{"summary"'):
+                rows.extend(result_rows(json.loads(line)))
+                if len(rows) >= PARQUET_BATCH_ROWS:
+                    writer.write_table(pa.Table.from_pylist(rows, schema=schema))
+                    rows = []
+            yield line
+        if rows:
+            writer.write_table(pa.Table.from_pylist(rows, schema=schema))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='pharmaguard',
+        description='Pharmacogenomic risk assessment for VCF files, without the HTTP server.'
+    )
+    parser.add_argument('inputs', nargs='+', metavar='VCF',
+                        help='VCF paths or glob patterns (quote them; ** matches subdirectories)')
+    parser.add_argument('--drugs', default=','.join(SUPPORTED_DRUGS),
+                        help='comma-separated drugs (default: all supported)')
+    parser.add_argument('-j', '--jobs', type=int, default=COHORT_JOBS,
+                        help='worker processes (default: CPU count)')
+    parser.add_argument('--no-llm', action='store_true',
+                        help='skip LLM explanations and use the rule-based text')
+    parser.add_argument('-f', '--format', choices=('ndjson', 'parquet'),
+                        help='output format (default: from the --output extension, else ndjson)')
+    parser.add_argument('-o', '--output', help='output file (default: stdout; required for parquet)')
+    parser.add_argument('-q', '--quiet', action='store_true', help='do not print the summary to stderr')
+    args = parser.parse_args(argv)
+
+    output_format = args.format or ('parquet' if args.output and args.output.endswith('.parquet') else 'ndjson')
+    if output_format == 'parquet' and not args.output:
+        parser.error('--output is required for parquet output')
+
+    paths = expand_inputs(args.inputs)
+    if not paths:
+        parser.error('no input files matched')
+    drugs = [d.strip().upper() for d in args.drugs.split(',') if d.strip()]
+
+    lines = run_cohort([(path, path) for path in paths], drugs, max(1, args.jobs), use_llm=not args.no_llm)
+    out = None
+    if output_format == 'parquet':
+        lines = write_parquet(lines, args.output)
+    else:
+        out = open(args.output, 'w', encoding='utf-8') if args.output else sys.stdout
+        lines = write_ndjson(lines, out)
+
+    summary = None
+    try:
+        for line in lines:
+            if line.startswith('{"summary"'):
+                summary = json.loads(line)['summary']
+    finally:
+        if out is not None and out is not sys.stdout:
+            out.close()
+
+    if not args.quiet:
+        print(f"{summary['files']} files ({summary['errors']} failed) in {summary['elapsed_seconds']}s, "
+              f"{summary['files_per_second']} files/sec", file=sys.stderr)
+    # Per-file errors are reported in the output; only fail when nothing could be analyzed
+    return 1 if summary['errors'] == summary['files'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,227 @@
+# Bulk analysis of many VCFs (tar/zip archives or path manifests) on a process pool
+import argparse
+import multiprocessing
+import os
+import sys
+import tarfile
+import time
+import zipfile
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, as_completed, wait
+
+from .analysis import SUPPORTED_DRUGS, encode_json, run_analysis
+from .llm_explainer import generate_explanation, generate_fallback_explanation
+from .vcf_parser import MAX_VCF_SIZE, VCF_EXTENSIONS, VCFSizeLimitError, parse_vcf
+
+COHORT_MAX_FILES = int(os.getenv('COHORT_MAX_FILES', 10000))
+COHORT_JOBS = int(os.getenv('COHORT_JOBS', os.cpu_count() or 1))
+
+# Submitted-but-unfinished files per worker; bounds memory for large archives
+IN_FLIGHT_PER_JOB = 4
+
+
+def _is_vcf_member(name):
+    base = os.path.basename(name)
+    return name.endswith(VCF_EXTENSIONS) and not base.startswith('._') and '__MACOSX/' not in name
+
+
+def _oversize(size):
+    if size > MAX_VCF_SIZE:
+        return VCFSizeLimitError(f"VCF file exceeds {MAX_VCF_SIZE // (1024 * 1024)}MB size limit")
+    return None
+
+
+def archive_tasks(fileobj, max_files=COHORT_MAX_FILES):
+    """Return an iterator of (name, data) for each VCF in a tar or zip archive.
+
+    ``fileobj`` must be seekable. The member list is read and validated
+    up front, so a bad archive raises ``ValueError`` before any file is
+    analyzed; member contents are then read lazily. Members over the
+    upload size limit yield an exception in place of their data.
+    """
+    if zipfile.is_zipfile(fileobj):
+        fileobj.seek(0)
+        archive = zipfile.ZipFile(fileobj)
+        members = [(info.filename, info.file_size, info) for info in archive.infolist()
+                   if not info.is_dir() and _is_vcf_member(info.filename)]
+        read = archive.read
+    else:
+        fileobj.seek(0)
+        try:
+            archive = tarfile.open(fileobj=fileobj, mode='r:*')
+        except tarfile.TarError:
+            raise ValueError("Unsupported archive. Expected a .tar, .tar.gz or .zip file")
+        members = [(member.name, member.size, member) for member in archive.getmembers()
+                   if member.isfile() and _is_vcf_member(member.name)]
+        read = lambda member: archive.extractfile(member).read()
+
+    if not members:
+        raise ValueError("Archive contains no .vcf or .vcf.gz files")
+    if len(members) > max_files:
+        raise ValueError(f"Archive contains {len(members)} VCF files; the limit is {max_files}")
+
+    def iterate():
+        for name, size, member in members:
+            yield name, _oversize(size) or read(member)
+    return iterate()
+
+
+def manifest_tasks(lines, base_dir='.', root=None):
+    """Return (name, path) for each path listed in a manifest, one per line.
+
+    Blank lines and ``#`` comments are skipped, and relative paths are
+    resolved against ``base_dir``. With ``root`` set, paths outside it
+    yield an exception instead of being read.
+    """
+    tasks = []
+    for line in lines:
+        if isinstance(line, bytes):
+            line = line.decode('utf-8')
+        name = line.strip()
+        if not name or name.startswith('#'):
+            continue
+        path = os.path.realpath(os.path.join(base_dir, name))
+        if root is not None and os.path.commonpath([path, os.path.realpath(root)]) != os.path.realpath(root):
+            tasks.append((name, ValueError("Path is outside the allowed manifest root")))
+        else:
+            tasks.append((name, path))
+    if not tasks:
+        raise ValueError("Manifest lists no VCF files")
+    if len(tasks) > COHORT_MAX_FILES:
+        raise ValueError(f"Manifest lists {len(tasks)} VCF files; the limit is {COHORT_MAX_FILES}")
+    return tasks
+
+
+def patient_id_for(name):
+    """Stable patient ID for a cohort file: its base name without the VCF extension."""
+    base = os.path.basename(name)
+    for ext in VCF_EXTENSIONS:
+        if base.endswith(ext):
+            return base[:-len(ext)]
+    return base
+
+
+def analyze_vcf_task(name, source, drugs, use_llm=False):
+    """Parse and analyze one VCF, returning (ok, NDJSON line).
+
+    Runs inside pool workers, so the result is encoded there rather than
+    pickled back as nested dicts.
+    """
+    try:
+        if isinstance(source, Exception):
+            raise source
+        parse_result = parse_vcf(source)
+    except Exception as e:
+        return False, encode_json({'file': name, 'error': f'VCF parsing failed: {str(e)}'})
+
+    if not parse_result['variants']:
+        return False, encode_json({'file': name, 'error': 'No pharmacogenomic variants found in VCF'})
+
+    try:
+        explain = generate_explanation if use_llm else generate_fallback_explanation
+        result = run_analysis(parse_result, drugs, explain, patient_id=patient_id_for(name))
+    except Exception as e:
+        return False, encode_json({'file': name, 'error': f'Internal server error: {str(e)}'})
+    return True, encode_json({'file': name, 'result': result})
+
+
+def _mp_context():
+    """Start workers from a forkserver where the platform has one, else spawn them.
+
+    Both are safe from a multi-threaded server process; the forkserver
+    also imports the analysis modules once instead of once per worker.
+    """
+    if 'forkserver' in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context('forkserver')
+        context.set_forkserver_preload([__package__ + '.analysis', __package__ + '.vcf_parser'])
+        return context
+    return multiprocessing.get_context('spawn')
+
+
+def run_cohort(tasks, drugs, jobs=COHORT_JOBS, use_llm=False):
+    """Analyze (name, source) tasks and yield one NDJSON line per file as each completes.
+
+    Files are spread over a ``ProcessPoolExecutor`` of ``jobs`` workers
+    (inline when ``jobs`` is 1); the last line is a ``summary`` record
+    with counts and throughput in files/sec.
+    """
+    start = time.perf_counter()
+    counts = {'files': 0, 'errors': 0}
+
+    def record(ok, line):
+        counts['files'] += 1
+        if not ok:
+            counts['errors'] += 1
+        return line
+
+    if jobs <= 1:
+        for name, source in tasks:
+            yield record(*analyze_vcf_task(name, source, drugs, use_llm))
+    else:
+        pool = ProcessPoolExecutor(max_workers=jobs, mp_context=_mp_context())
+        try:
+            pending = set()
+            for name, source in tasks:
+                if len(pending) >= jobs * IN_FLIGHT_PER_JOB:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        yield record(*future.result())
+                pending.add(pool.submit(analyze_vcf_task, name, source, drugs, use_llm))
+            for future in as_completed(pending):
+                yield record(*future.result())
+        finally:
+            pool.shutdown(wait=True, cancel_futures=True)
+
+    elapsed = time.perf_counter() - start
+    yield encode_json({'summary': {
+        'files': counts['files'],
+        'errors': counts['errors'],
+        'jobs': jobs,
+        'elapsed_seconds': round(elapsed, 3),
+        'files_per_second': round(counts['files'] / elapsed, 2) if elapsed else 0.0
+    }})
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m pharmacogenomics.cohort',
+        description='Analyze a cohort of VCFs from a tar/zip archive or a manifest of paths, writing NDJSON.'
+    )
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--archive', help='tar, tar.gz or zip archive of .vcf/.vcf.gz files')
+    source.add_argument('--manifest', help='text file listing one VCF path per line')
+    parser.add_argument('--drugs', default=','.join(SUPPORTED_DRUGS),
+                        help='comma-separated drugs (default: all supported)')
+    parser.add_argument('--jobs', type=int, default=COHORT_JOBS, help='worker processes (default: CPU count)')
+    parser.add_argument('--llm', action='store_true', help='generate LLM explanations (default: fallback text)')
+    parser.add_argument('-o', '--output', help='NDJSON output file (default: stdout)')
+    args = parser.parse_args(argv)
+
+    drugs = [d.strip().upper() for d in args.drugs.split(',') if d.strip()]
+    archive = None
+    try:
+        if args.archive:
+            archive = open(args.archive, 'rb')
+            tasks = archive_tasks(archive)
+        else:
+            with open(args.manifest, encoding='utf-8') as f:
+                tasks = manifest_tasks(f, base_dir=os.path.dirname(os.path.abspath(args.manifest)))
+    except (OSError, ValueError) as e:
+        parser.error(str(e))
+
+    out = open(args.output, 'w', encoding='utf-8') if args.output else sys.stdout
+    try:
+        for line in run_cohort(tasks, drugs, max(1, args.jobs), args.llm):
+            out.write(line + '\n')
+            out.flush()
+            if line.startswith('{"summary"'):
+                print(line, file=sys.stderr)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+        if archive is not None:
+            archive.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,72 @@
+# Validation of /analyze form uploads, shared by the Flask and ASGI apps
+from .llm_explainer import generate_explanation, generate_fallback_explanation
+from .metrics import StageTimer
+from .vcf_parser import VCF_EXTENSIONS, parse_indexed_vcf, parse_vcf
+
+INDEX_EXTENSIONS = ('.tbi', '.csi')
+
+
+class AnalysisRequestError(Exception):
+    """Invalid analysis upload; ``payload`` is the JSON error body."""
+
+    def __init__(self, payload):
+        super().__init__(payload['error'])
+        self.payload = payload
+
+
+def _upload_stream(upload):
+    """Binary stream of an uploaded file: Flask's ``FileStorage.stream`` or Starlette's ``UploadFile.file``."""
+    return upload.stream if hasattr(upload, 'stream') else upload.file
+
+
+def parse_analysis_form(form, files, timer=None):
+    """Validate an analysis form and parse its VCF.
+    
+    ``form`` maps field names to strings and ``files`` to uploaded files.
+    Returns (parse_result, drugs, explain) or raises AnalysisRequestError.
+    An optional StageTimer receives the 'parse' stage.
+    """
+    timer = timer or StageTimer()
+    
+    # Validate drug input
+    drugs_input = form.get('drugs', '').strip()
+    if not drugs_input:
+        raise AnalysisRequestError({'error': 'No drugs specified'})
+    
+    drugs = [d.strip().upper() for d in drugs_input.split(',') if d.strip()]
+    
+    # Validate VCF file
+    vcf_file = files.get('vcf')
+    if not vcf_file:
+        raise AnalysisRequestError({'error': 'No VCF file uploaded'})
+    
+    if not vcf_file.filename.endswith(VCF_EXTENSIONS):
+        raise AnalysisRequestError({'error': 'Invalid file format. Expected .vcf or .vcf.gz file'})
+    
+    # Optional tabix/CSI index for region-restricted reads of large BGZF VCFs
+    index_file = files.get('index')
+    if index_file and not index_file.filename.endswith(INDEX_EXTENSIONS):
+        raise AnalysisRequestError({'error': 'Invalid index format. Expected .tbi or .csi file'})
+    
+    # Parse VCF straight from the upload stream
+    try:
+        with timer.stage('parse'):
+            if index_file:
+                parse_result = parse_indexed_vcf(_upload_stream(vcf_file), _upload_stream(index_file),
+                                                 assembly=form.get('assembly') or None)
+            else:
+                parse_result = parse_vcf(_upload_stream(vcf_file))
+    except Exception as e:
+        raise AnalysisRequestError({'error': f'VCF parsing failed: {str(e)}'})
+    
+    if not parse_result['variants']:
+        raise AnalysisRequestError({
+            'error': 'No pharmacogenomic variants found in VCF',
+            'message': 'VCF must contain variants in genes: CYP2D6, CYP2C19, CYP2C9, SLCO1B1, TPMT, DPYD'
+        })
+    
+    # Multi-sample VCFs get LLM explanations only on request (llm=true),
+    # since they scale with cohort size
+    use_llm = form.get('llm', '').lower() in ('1', 'true', 'yes')
+    explain = generate_explanation if use_llm or len(parse_result['samples']) <= 1 else generate_fallback_explanation
+    return parse_result, drugs, explain
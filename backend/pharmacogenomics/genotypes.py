@@ -0,0 +1,154 @@
+# Columnar genotype decoding for multi-sample VCFs
+import re
+
+MISSING = -1
+
+ALLELE_SEPARATOR = re.compile(rb'[/|]')
+
+# Pre-decoded dosages for the common diploid/haploid GT strings
+_GT_DOSAGE = {
+    b'0/0': 0, b'0|0': 0,
+    b'0/1': 1, b'1/0': 1, b'0|1': 1, b'1|0': 1,
+    b'1/1': 2, b'1|1': 2,
+    b'0': 0, b'1': 1,
+    b'./.': MISSING, b'.|.': MISSING, b'.': MISSING, b'': MISSING
+}
+
+
+# Haplotype codes: bit 0/1 is set when the first/second GT allele is the
+# variant's ALT allele, and PHASED when the alleles are separated by '|'
+FIRST, SECOND, PHASED = 1, 2, 4
+
+_GT_HAPLOTYPES = {
+    b'0/0': 0, b'0|0': PHASED,
+    b'0/1': SECOND, b'1/0': FIRST, b'0|1': SECOND | PHASED, b'1|0': FIRST | PHASED,
+    b'1/1': FIRST | SECOND, b'1|1': FIRST | SECOND | PHASED,
+    b'0': 0, b'1': FIRST,
+    b'./.': MISSING, b'.|.': MISSING, b'.': MISSING, b'': MISSING
+}
+
+
+def _carries(alt_index):
+    """Predicate for GT allele indexes that count as carrying the variant."""
+    if alt_index is None:
+        return lambda allele: allele != b'0'
+    wanted = str(alt_index).encode()
+    return lambda allele: allele == wanted
+
+
+def gt_dosage(gt, alt_index=None):
+    """Return the number of ``alt_index`` alleles in a GT string, or MISSING.
+
+    With ``alt_index`` None every non-reference allele counts.
+    """
+    if alt_index is None or alt_index == 1:
+        dosage = _GT_DOSAGE.get(gt)
+        if dosage is not None:
+            return dosage
+    alleles = ALLELE_SEPARATOR.split(gt)
+    if b'.' in alleles:
+        return MISSING
+    carries = _carries(alt_index)
+    return sum(1 for allele in alleles if carries(allele))
+
+
+def gt_haplotypes(gt, alt_index=None):
+    """Return the haplotype code (FIRST/SECOND/PHASED bits) of a GT string, or MISSING.
+
+    A haplotype bit is set when that allele is ``alt_index`` (any
+    non-reference allele when None).
+    """
+    if alt_index is None or alt_index == 1:
+        code = _GT_HAPLOTYPES.get(gt)
+        if code is not None:
+            return code
+    alleles = ALLELE_SEPARATOR.split(gt)
+    if b'.' in alleles:
+        return MISSING
+    code = PHASED if b'|' in gt else 0
+    carries = _carries(alt_index)
+    for bit, allele in zip((FIRST, SECOND), alleles):
+        if carries(allele):
+            code |= bit
+    return code
+
+
+def _sample_gts(fields, gt_index):
+    if gt_index == 0:
+        return [sample.split(b':', 1)[0] for sample in fields]
+    gts = []
+    for sample in fields:
+        values = sample.split(b':')
+        gts.append(values[gt_index] if gt_index < len(values) else b'.')
+    return gts
+
+
+def _phase_set(value):
+    try:
+        return int(value)
+    except ValueError:
+        return 0  # '.', or a non-integer PS
+
+
+def genotype_matrix(genotype_columns, n_samples, alt_indexes=None):
+    """Decode GT for every sample into an int8 (variants x samples) dosage matrix.
+
+    ``genotype_columns`` holds, per variant, the raw ``FORMAT\\tSAMPLE...``
+    tail of the record (or None). Cells are 0/1/2 counts of the variant's
+    ALT allele, or ``MISSING`` when the call or the GT field is absent.
+    ``alt_indexes`` gives, per variant, the GT index of that allele; where
+    it (or the whole list) is None, any non-reference allele counts.
+    """
+    return decode_genotypes(genotype_columns, n_samples, alt_indexes)[0]
+
+
+def decode_genotypes(genotype_columns, n_samples, alt_indexes=None):
+    """Decode GT and PS for every sample in one pass.
+
+    Returns (dosages, haplotypes, phase_sets): the ``genotype_matrix``
+    dosages, an int8 matrix of haplotype codes (``MISSING`` where not
+    called) and an int64 matrix of PS values (0 where absent). Phased calls
+    without a PS field all share phase set 0, as the VCF spec allows.
+    ``alt_indexes`` is as for ``genotype_matrix``.
+    """
+    import numpy as np
+    dosages = np.full((len(genotype_columns), n_samples), MISSING, dtype=np.int8)
+    haplotypes = np.full((len(genotype_columns), n_samples), MISSING, dtype=np.int8)
+    phase_sets = np.zeros((len(genotype_columns), n_samples), dtype=np.int64)
+    if alt_indexes is None:
+        alt_indexes = [None] * len(genotype_columns)
+    for row, (columns, alt_index) in enumerate(zip(genotype_columns, alt_indexes)):
+        if not columns:
+            continue
+        fields = columns.rstrip().split(b'\t')
+        keys = fields[0].split(b':')
+        if b'GT' not in keys:
+            continue
+        gts = _sample_gts(fields[1:n_samples + 1], keys.index(b'GT'))
+        dosages[row, :len(gts)] = [gt_dosage(gt, alt_index) for gt in gts]
+        haplotypes[row, :len(gts)] = [gt_haplotypes(gt, alt_index) for gt in gts]
+        if b'PS' in keys:
+            phase_sets[row, :len(gts)] = [_phase_set(ps) for ps in _sample_gts(fields[1:n_samples + 1],
+                                                                                keys.index(b'PS'))]
+    return dosages, haplotypes, phase_sets
+
+
+def sample_variants(variants, matrix, sample_index, haplotypes=None, phase_sets=None):
+    """Return the variants carried by one sample, annotated with their dosage.
+
+    With ``haplotypes`` (and ``phase_sets``) from ``decode_genotypes``, each
+    variant also gets its ``haplotypes`` code and ``phase_set``.
+    """
+    carried = []
+    dosages = matrix[:, sample_index].tolist()
+    if haplotypes is None:
+        for variant, dosage in zip(variants, dosages):
+            if dosage > 0:
+                carried.append(dict(variant, dosage=dosage))
+        return carried
+    codes = haplotypes[:, sample_index].tolist()
+    sets = phase_sets[:, sample_index].tolist()
+    for variant, dosage, code, phase_set in zip(variants, dosages, codes, sets):
+        if dosage > 0:
+            carried.append(dict(variant, dosage=dosage, haplotypes=code, phase_set=phase_set))
+    return carried
@@ -0,0 +1,173 @@
+# In-process background jobs for long-running analyses
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from .analysis import encode_json, run_analysis
+
+JOB_MAX_WORKERS = int(os.getenv('JOB_MAX_WORKERS', 4))
+# Seconds a finished job stays available for polling
+JOB_TTL = float(os.getenv('JOB_TTL', 3600))
+# Queued plus running jobs; each holds its parsed VCF until it finishes
+JOB_MAX_PENDING = int(os.getenv('JOB_MAX_PENDING', 64))
+# Retry-After hint, in seconds, for submissions refused by a full queue
+JOB_RETRY_AFTER = 10
+
+TERMINAL_EVENTS = ('done', 'error')
+
+
+class JobQueueFull(Exception):
+    """Raised by ``JobManager.submit`` when ``max_pending`` jobs are already queued or running."""
+
+    def __init__(self, max_pending, retry_after=JOB_RETRY_AFTER):
+        super().__init__(f'{max_pending} jobs already queued or running')
+        self.retry_after = retry_after
+
+
+class Job:
+    """Status, result and append-only event log of one submitted analysis.
+
+    Event payloads are encoded when emitted, so later changes to the
+    emitted objects do not leak into events already sent to clients.
+    """
+
+    def __init__(self):
+        self.id = uuid.uuid4().hex
+        self.status = 'queued'
+        self.created = time.time()
+        self.finished = None
+        self.result = None
+        self.error = None
+        self.events = []
+        self.closed = False  # set once the terminal event has been emitted
+        self._cond = threading.Condition()
+
+    @property
+    def done(self):
+        return self.status in ('completed', 'failed')
+
+    def emit(self, event, data):
+        encoded = encode_json(data)
+        with self._cond:
+            self.events.append((event, encoded))
+            if event in TERMINAL_EVENTS:
+                self.closed = True
+            self._cond.notify_all()
+
+    def start(self):
+        self.status = 'running'
+        self.emit('status', {'job_id': self.id, 'status': self.status})
+
+    def complete(self, result):
+        self.result = result
+        self.finished = time.time()
+        self.status = 'completed'
+        self.emit('done', self.summary())
+
+    def fail(self, error):
+        self.error = error
+        self.finished = time.time()
+        self.status = 'failed'
+        self.emit('error', self.summary())
+
+    def wait_events(self, start, timeout=None):
+        """Return events from index ``start`` on, blocking up to ``timeout`` until there is one."""
+        with self._cond:
+            if len(self.events) <= start and not self.closed:
+                self._cond.wait(timeout)
+            return self.events[start:]
+
+    def summary(self):
+        summary = {
+            'job_id': self.id,
+            'status': self.status,
+            'created': self.created,
+            'finished': self.finished
+        }
+        if self.status == 'completed':
+            summary['result'] = self.result
+        elif self.status == 'failed':
+            summary['error'] = self.error
+        return summary
+
+
+class JobManager:
+    """Runs jobs on a bounded local thread pool and keeps them for ``ttl`` seconds after they finish.
+
+    At most ``max_pending`` jobs may be queued or running at once; further
+    submissions raise JobQueueFull rather than piling up parsed VCFs.
+
+    Jobs live in this process only, so polling and streaming requests must
+    reach the worker process that accepted the job.
+    """
+
+    def __init__(self, max_workers=JOB_MAX_WORKERS, ttl=JOB_TTL, max_pending=JOB_MAX_PENDING):
+        self.ttl = ttl
+        self.max_pending = max_pending
+        self._pending = 0
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='job')
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def submit(self, fn, *args):
+        """Queue ``fn(job, *args)`` and return the new job; its return value becomes the job result.
+
+        Raises JobQueueFull when ``max_pending`` jobs are already queued or running.
+        """
+        job = Job()
+        with self._lock:
+            if self._pending >= self.max_pending:
+                raise JobQueueFull(self.max_pending)
+            self._prune()
+            self._jobs[job.id] = job
+            self._pending += 1
+        try:
+            self._pool.submit(self._run, job, fn, args)
+        except BaseException:
+            with self._lock:
+                del self._jobs[job.id]
+            self._release()
+            raise
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def _run(self, job, fn, args):
+        # The slot is released before the terminal event, so a client that
+        # saw its job finish can submit the next one straight away
+        job.start()
+        try:
+            result = fn(job, *args)
+        except Exception as e:
+            print(f"Job {job.id} failed: {type(e).__name__}: {str(e)}")
+            self._release()
+            job.fail(f'Internal server error: {str(e)}')
+        else:
+            self._release()
+            job.complete(result)
+
+    def _release(self):
+        with self._lock:
+            self._pending -= 1
+
+    def _prune(self):
+        expired = time.time() - self.ttl
+        for job_id in [job_id for job_id, job in self._jobs.items() if job.done and job.finished < expired]:
+            del self._jobs[job_id]
+
+
+def analysis_job(job, parse_result, drugs, explain):
+    """Job body for ``run_analysis``: streams each drug's rules result, then its explanation."""
+    return run_analysis(
+        parse_result, drugs, explain,
+        on_result=lambda result: job.emit('result', result),
+        on_explanation=lambda result: job.emit('explanation', {
+            'patient_id': result['patient_id'],
+            'drug': result['drug'],
+            'llm_generated_explanation': result['llm_generated_explanation']
+        })
+    )
@@ -0,0 +1,429 @@
+# CPIC knowledge base: versioned data files compiled into read-only lookups
+#
+# The tables live in data/ (or the directory named by PHARMAGUARD_KB_DIR):
+# cpic.json names the version and the three tables, allele_functions.tsv
+# gives each allele's activity score, phenotype_thresholds.tsv maps
+# diplotype activity scores (the sum of both alleles) to phenotypes, and
+# recommendations.json holds the per-drug risk labels, recommendations and
+# alternatives. They are validated and compiled once per process; with
+# PHARMAGUARD_KB_CACHE set, the compiled form is also written to an
+# mmap-able binary cache so later workers skip parsing and validation.
+import hashlib
+import json
+import mmap
+import os
+import struct
+import sys
+import tempfile
+from array import array
+from types import MappingProxyType
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+MANIFEST = 'cpic.json'
+
+# Phenotype vocabulary of the output schema; index 0 means no alleles called
+PHENOTYPES = ('Unknown', 'PM', 'IM', 'NM', 'RM', 'UM')
+
+ALLELE_FUNCTIONS = ('No function', 'Decreased function', 'Normal function', 'Increased function',
+                    'Uncertain function')
+COMPARISONS = ('<', '<=', '*')
+
+# Binary cache layout: header, then a compact JSON block, then all score
+# tables as one contiguous float64 block (8-byte aligned)
+CACHE_MAGIC = b'PGKB'
+CACHE_FORMAT = 1
+_HEADER = struct.Struct('<4sHH32sQQQQ')  # magic, format, reserved, digest, meta offset/size, scores offset/count
+
+
+class KnowledgeBaseError(ValueError):
+    """Raised when a knowledge-base file is missing or fails validation."""
+
+
+class KnowledgeBase:
+    """Compiled, read-only CPIC tables.
+
+    ``allele_codes`` maps gene -> allele -> integer code (from 1, in file
+    order; 0 is an allele missing from the table) and ``score_tables`` maps
+    gene -> float64 buffer indexed by that code, with the default activity
+    score at index 0. ``phenotype_rules`` maps gene -> ((inclusive, bound,
+    phenotype code), ...) over diplotype scores, checked in order.
+    ``diplotypes`` maps gene -> sorted code pair -> (activity score,
+    phenotype), and ``diplotype_matrices`` holds the same phenotypes as
+    flat symmetric int8 matrices for vectorized lookups. All mappings are
+    read-only.
+    """
+
+    def __init__(self, name, version, digest, default_activity_score, genes, allele_codes, score_tables,
+                 phenotype_rules, default_rules, severity, drugs):
+        self.name = name
+        self.version = version
+        self.digest = digest
+        self.default_activity_score = default_activity_score
+        self.genes = tuple(genes)
+        self.allele_codes = _freeze({gene: _freeze(codes) for gene, codes in allele_codes.items()})
+        self.score_tables = _freeze(score_tables)
+        self.activity_scores = _freeze({
+            gene: _freeze({allele: score_tables[gene][code] for allele, code in codes.items()})
+            for gene, codes in allele_codes.items()
+        })
+        self.phenotype_rules = _freeze({gene: tuple(map(tuple, rules)) for gene, rules in phenotype_rules.items()})
+        self.default_rules = tuple(map(tuple, default_rules))
+        self.severity = _freeze(severity)
+        self.drugs = tuple(drugs)
+        self.drug_genes = _freeze({drug: entry['gene'] for drug, entry in drugs.items()})
+        self.alternatives = _freeze({drug: tuple(entry['alternatives']) for drug, entry in drugs.items()})
+        self.risk_matrix = _freeze({
+            drug: _freeze({phenotype: rec['risk'] for phenotype, rec in entry['phenotypes'].items()})
+            for drug, entry in drugs.items()
+        })
+        self.recommendations = _freeze({
+            drug: _freeze({phenotype: rec['recommendation'] for phenotype, rec in entry['phenotypes'].items()})
+            for drug, entry in drugs.items()
+        })
+        self._drugs = drugs
+
+        # Every unordered allele pair per gene, including code 0 (alleles
+        # missing from the table), so phenotype calls are table lookups
+        self.diplotypes = {}
+        self.diplotype_matrices = {}
+        for gene in self.genes:
+            self.diplotypes[gene], self.diplotype_matrices[gene] = self._compile_diplotypes(gene)
+        self.diplotypes = _freeze(self.diplotypes)
+        self.diplotype_matrices = _freeze(self.diplotype_matrices)
+
+    @property
+    def fingerprint(self):
+        """Version plus a content digest; changes whenever any table changes."""
+        return f"{self.version}+{self.digest[:12]}"
+
+    def rules_for(self, gene):
+        return self.phenotype_rules.get(gene, self.default_rules)
+
+    def phenotype_for_score(self, gene, score):
+        for inclusive, bound, code in self.rules_for(gene):
+            if score < bound or (inclusive and score == bound):
+                return PHENOTYPES[code]
+        return PHENOTYPES[self.rules_for(gene)[-1][2]]
+
+    def diplotype(self, gene, allele_a, allele_b):
+        """Return (activity score, phenotype) for a diplotype; allele order does not matter."""
+        codes = self.allele_codes.get(gene)
+        if codes is None:
+            score = 2 * self.default_activity_score
+            return score, self.phenotype_for_score(gene, score)
+        a, b = codes.get(allele_a, 0), codes.get(allele_b, 0)
+        return self.diplotypes[gene][(a, b) if a <= b else (b, a)]
+
+    def _compile_diplotypes(self, gene):
+        """Return ({(code a, code b) with a <= b: (score, phenotype)}, flat n x n phenotype-code matrix)."""
+        table = self.score_tables[gene]
+        size = len(table)
+        pairs = {}
+        matrix = array('b', bytes(size * size))
+        for a in range(size):
+            for b in range(a, size):
+                score = table[a] + table[b]
+                phenotype = self.phenotype_for_score(gene, score)
+                pairs[a, b] = (score, phenotype)
+                matrix[a * size + b] = matrix[b * size + a] = PHENOTYPES.index(phenotype)
+        return _freeze(pairs), matrix
+
+    def _meta(self):
+        """Everything except the score tables, as JSON-serializable data."""
+        return {
+            'name': self.name,
+            'version': self.version,
+            'default_activity_score': self.default_activity_score,
+            'genes': list(self.genes),
+            'allele_codes': {gene: dict(codes) for gene, codes in self.allele_codes.items()},
+            'phenotype_rules': {gene: [list(rule) for rule in rules] for gene, rules in self.phenotype_rules.items()},
+            'default_rules': [list(rule) for rule in self.default_rules],
+            'severity': dict(self.severity),
+            'drugs': self._drugs
+        }
+
+
+def _freeze(mapping):
+    return MappingProxyType(dict(mapping))
+
+
+def _read_tsv(path, columns):
+    """Yield (line number, row dict) for a TSV with a header row; '#' lines are comments."""
+    name = os.path.basename(path)
+    with open(path, encoding='utf-8') as f:
+        header = None
+        for number, line in enumerate(f, 1):
+            line = line.rstrip('\r\n')
+            if not line.strip() or line.startswith('#'):
+                continue
+            fields = line.split('\t')
+            if header is None:
+                header = fields
+                missing = [column for column in columns if column not in header]
+                if missing:
+                    raise KnowledgeBaseError(f"{name}: missing column(s) {', '.join(missing)}")
+                continue
+            if len(fields) != len(header):
+                raise KnowledgeBaseError(f"{name} line {number}: expected {len(header)} fields, got {len(fields)}")
+            yield number, dict(zip(header, fields))
+
+
+def _parse_allele_functions(path):
+    name = os.path.basename(path)
+    allele_scores = {}
+    for number, row in _read_tsv(path, ('gene', 'allele', 'activity_score', 'function')):
+        gene, allele = row['gene'], row['allele']
+        try:
+            score = float(row['activity_score'])
+        except ValueError:
+            raise KnowledgeBaseError(f"{name} line {number}: activity_score {row['activity_score']!r} is not a number")
+        if score < 0:
+            raise KnowledgeBaseError(f"{name} line {number}: activity_score must not be negative")
+        if row['function'] not in ALLELE_FUNCTIONS:
+            raise KnowledgeBaseError(f"{name} line {number}: unknown function {row['function']!r}")
+        scores = allele_scores.setdefault(gene, {})
+        if allele in scores:
+            raise KnowledgeBaseError(f"{name} line {number}: duplicate allele {gene} {allele}")
+        scores[allele] = score
+    if not allele_scores:
+        raise KnowledgeBaseError(f"{name}: no alleles defined")
+    return allele_scores
+
+
+def _parse_phenotype_thresholds(path):
+    name = os.path.basename(path)
+    rules = {}
+    for number, row in _read_tsv(path, ('gene', 'phenotype', 'comparison', 'score')):
+        phenotype, comparison = row['phenotype'], row['comparison']
+        if phenotype not in PHENOTYPES[1:]:
+            raise KnowledgeBaseError(f"{name} line {number}: unknown phenotype {phenotype!r}")
+        if comparison not in COMPARISONS:
+            raise KnowledgeBaseError(f"{name} line {number}: comparison must be one of {', '.join(COMPARISONS)}")
+        gene_rules = rules.setdefault(row['gene'], [])
+        if gene_rules and gene_rules[-1][1] == float('inf'):
+            raise KnowledgeBaseError(f"{name} line {number}: rule after the '*' catch-all for {row['gene']}")
+        if comparison == '*':
+            gene_rules.append((False, float('inf'), PHENOTYPES.index(phenotype)))
+            continue
+        try:
+            bound = float(row['score'])
+        except ValueError:
+            raise KnowledgeBaseError(f"{name} line {number}: score {row['score']!r} is not a number")
+        if gene_rules and bound < gene_rules[-1][1]:
+            raise KnowledgeBaseError(f"{name} line {number}: thresholds must not decrease")
+        gene_rules.append((comparison == '<=', bound, PHENOTYPES.index(phenotype)))
+    for gene, gene_rules in rules.items():
+        if gene_rules[-1][1] != float('inf'):
+            raise KnowledgeBaseError(f"{name}: rules for {gene} must end with a '*' catch-all")
+    if '*' not in rules:
+        raise KnowledgeBaseError(f"{name}: no default ('*') rules")
+    return rules
+
+
+def _parse_recommendations(path, genes):
+    name = os.path.basename(path)
+    with open(path, encoding='utf-8') as f:
+        try:
+            data = json.load(f)
+        except ValueError as e:
+            raise KnowledgeBaseError(f"{name}: invalid JSON: {e}")
+    severity = data.get('severity')
+    drugs = data.get('drugs')
+    if not isinstance(severity, dict) or not isinstance(drugs, dict) or not drugs:
+        raise KnowledgeBaseError(f"{name}: expected 'severity' and non-empty 'drugs' objects")
+    for drug, entry in drugs.items():
+        where = f"{name}: {drug}"
+        if drug != drug.upper():
+            raise KnowledgeBaseError(f"{where}: drug names must be upper case")
+        if entry.get('gene') not in genes:
+            raise KnowledgeBaseError(f"{where}: gene {entry.get('gene')!r} has no allele functions")
+        if not isinstance(entry.get('alternatives', []), list):
+            raise KnowledgeBaseError(f"{where}: alternatives must be a list")
+        phenotypes = entry.get('phenotypes', {})
+        missing = [phenotype for phenotype in PHENOTYPES if phenotype not in phenotypes]
+        if missing:
+            raise KnowledgeBaseError(f"{where}: missing phenotype(s) {', '.join(missing)}")
+        for phenotype, rec in phenotypes.items():
+            if phenotype not in PHENOTYPES:
+                raise KnowledgeBaseError(f"{where}: unknown phenotype {phenotype!r}")
+            if rec.get('risk') not in severity:
+                raise KnowledgeBaseError(f"{where} {phenotype}: risk {rec.get('risk')!r} has no severity")
+            if not rec.get('recommendation'):
+                raise KnowledgeBaseError(f"{where} {phenotype}: missing recommendation")
+        entry.setdefault('alternatives', [])
+    return severity, drugs
+
+
+def _source_paths(kb_dir):
+    manifest_path = os.path.join(kb_dir, MANIFEST)
+    try:
+        with open(manifest_path, encoding='utf-8') as f:
+            manifest = json.load(f)
+    except (OSError, ValueError) as e:
+        raise KnowledgeBaseError(f"Cannot read knowledge base manifest {manifest_path}: {e}")
+    for key in ('version', 'allele_functions', 'phenotype_thresholds', 'recommendations'):
+        if key not in manifest:
+            raise KnowledgeBaseError(f"{MANIFEST}: missing {key!r}")
+    paths = {key: os.path.join(kb_dir, manifest[key])
+             for key in ('allele_functions', 'phenotype_thresholds', 'recommendations')}
+    return manifest, manifest_path, paths
+
+
+def _digest(paths):
+    digest = hashlib.sha256()
+    for path in paths:
+        try:
+            with open(path, 'rb') as f:
+                digest.update(f.read())
+        except OSError as e:
+            raise KnowledgeBaseError(f"Cannot read knowledge base file {path}: {e}")
+    return digest.hexdigest()
+
+
+def compile_knowledge_base(kb_dir=DATA_DIR):
+    """Parse, validate and compile the tables in ``kb_dir``."""
+    manifest, manifest_path, paths = _source_paths(kb_dir)
+    digest = _digest([manifest_path] + list(paths.values()))
+    default_score = float(manifest.get('default_activity_score', 1))
+
+    allele_scores = _parse_allele_functions(paths['allele_functions'])
+    rules = _parse_phenotype_thresholds(paths['phenotype_thresholds'])
+    unknown = [gene for gene in rules if gene != '*' and gene not in allele_scores]
+    if unknown:
+        raise KnowledgeBaseError(f"phenotype thresholds for unknown gene(s) {', '.join(unknown)}")
+    severity, drugs = _parse_recommendations(paths['recommendations'], allele_scores)
+
+    allele_codes = {gene: {allele: code for code, allele in enumerate(scores, 1)}
+                    for gene, scores in allele_scores.items()}
+    score_tables = {gene: array('d', [default_score] + list(scores.values()))
+                    for gene, scores in allele_scores.items()}
+    default_rules = rules.pop('*')
+    return KnowledgeBase(manifest.get('name', ''), str(manifest['version']), digest, default_score,
+                         allele_scores, allele_codes, score_tables, rules, default_rules, severity, drugs)
+
+
+def write_cache(kb, path):
+    """Write ``kb`` in the binary cache format, atomically replacing ``path``."""
+    scores = array('d')
+    offsets = {}
+    for gene in kb.genes:
+        offsets[gene] = (len(scores), len(kb.score_tables[gene]))
+        scores.extend(kb.score_tables[gene])
+    meta = json.dumps({'offsets': offsets, 'kb': kb._meta()}, separators=(',', ':')).encode('utf-8')
+
+    meta_offset = _HEADER.size
+    scores_offset = (meta_offset + len(meta) + 7) // 8 * 8
+    header = _HEADER.pack(CACHE_MAGIC, CACHE_FORMAT, 0, bytes.fromhex(kb.digest), meta_offset, len(meta),
+                          scores_offset, len(scores))
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory or '.', prefix='.kb-')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(header)
+            f.write(meta)
+            f.write(b'\0' * (scores_offset - meta_offset - len(meta)))
+            f.write(scores.tobytes() if sys.byteorder == 'little' else _little_endian(scores))
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def _little_endian(scores):
+    swapped = array('d', scores)
+    swapped.byteswap()
+    return swapped.tobytes()
+
+
+def _map_cache(mapped, digest):
+    magic, version, _, file_digest, meta_offset, meta_size, scores_offset, count = _HEADER.unpack_from(mapped, 0)
+    if magic != CACHE_MAGIC or version != CACHE_FORMAT or file_digest.hex() != digest:
+        return None
+    if sys.byteorder != 'little' or scores_offset + count * 8 > len(mapped):
+        return None
+    meta = json.loads(mapped[meta_offset:meta_offset + meta_size].decode('utf-8'))
+    data = meta['kb']
+    scores = memoryview(mapped)[scores_offset:scores_offset + count * 8].cast('d')
+    score_tables = {gene: scores[start:start + size] for gene, (start, size) in meta['offsets'].items()}
+    return KnowledgeBase(data['name'], data['version'], digest, data['default_activity_score'],
+                         data['genes'], data['allele_codes'], score_tables, data['phenotype_rules'],
+                         data['default_rules'], data['severity'], data['drugs'])
+
+
+def read_cache(path, digest):
+    """Load a knowledge base from the binary cache, or None if it is missing, stale or damaged.
+
+    Score tables are zero-copy views into the memory-mapped file, which
+    stays open for the life of the returned object and is closed otherwise.
+    """
+    try:
+        with open(path, 'rb') as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):
+        return None
+    try:
+        kb = _map_cache(mapped, digest)
+    except (struct.error, ValueError, KeyError, TypeError) as e:
+        print(f"Ignoring unreadable knowledge base cache {path}: {e}")
+        kb = None
+    # Outside the except block, so the traceback no longer holds views into the mapping
+    if kb is None:
+        mapped.close()
+    return kb
+
+
+def load_knowledge_base(kb_dir=None, cache_dir=None):
+    """Return the compiled knowledge base, using the binary cache when it is current.
+
+    ``kb_dir`` defaults to ``PHARMAGUARD_KB_DIR`` or the bundled tables and
+    ``cache_dir`` to ``PHARMAGUARD_KB_CACHE``. Without a cache directory the
+    tables are compiled in memory and nothing is written.
+    """
+    kb_dir = kb_dir or os.getenv('PHARMAGUARD_KB_DIR') or DATA_DIR
+    if cache_dir is None:
+        cache_dir = os.getenv('PHARMAGUARD_KB_CACHE')
+    if not cache_dir:
+        return compile_knowledge_base(kb_dir)
+
+    _, manifest_path, paths = _source_paths(kb_dir)
+    digest = _digest([manifest_path] + list(paths.values()))
+    cache_path = os.path.join(cache_dir, f'cpic-{digest[:16]}.kb')
+    kb = read_cache(cache_path, digest)
+    if kb is not None:
+        return kb
+
+    kb = compile_knowledge_base(kb_dir)
+    try:
+        write_cache(kb, cache_path)
+    except OSError as e:
+        print(f"Knowledge base cache not written: {e}")
+    return kb
+
+
+# Loaded once per process
+KB = load_knowledge_base()
+
+
+def main(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(
+        prog='python -m pharmacogenomics.knowledge_base',
+        description='Validate a CPIC knowledge base directory and optionally write its binary cache.'
+    )
+    parser.add_argument('kb_dir', nargs='?', help='knowledge base directory (default: PHARMAGUARD_KB_DIR or bundled)')
+    parser.add_argument('--cache-dir', help='write the binary cache here (default: PHARMAGUARD_KB_CACHE, else none)')
+    args = parser.parse_args(argv)
+    try:
+        kb = load_knowledge_base(args.kb_dir, args.cache_dir)
+    except KnowledgeBaseError as e:
+        print(f"Invalid knowledge base: {e}", file=sys.stderr)
+        return 1
+    print(f"{kb.name} {kb.fingerprint}: {len(kb.genes)} genes, "
+          f"{sum(len(codes) for codes in kb.allele_codes.values())} alleles, {len(kb.drugs)} drugs")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
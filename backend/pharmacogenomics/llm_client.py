@@ -0,0 +1,310 @@
+# Pooled OpenAI client with client-side rate limiting, retries and a circuit breaker
+import asyncio
+import os
+import random
+import threading
+import time
+import weakref
+
+from .metrics import LLM_REQUESTS
+
+# Client-side quota per worker process (0 disables); divide the account quota by the worker count
+LLM_RPM = float(os.getenv('LLM_RPM', 3500))
+LLM_TPM = float(os.getenv('LLM_TPM', 90000))
+
+# Retries with jittered exponential backoff, all within one latency budget per completion
+LLM_RETRY_BUDGET = float(os.getenv('LLM_RETRY_BUDGET', 20))
+LLM_MAX_RETRIES = int(os.getenv('LLM_MAX_RETRIES', 4))
+LLM_BACKOFF_BASE = float(os.getenv('LLM_BACKOFF_BASE', 0.5))
+LLM_BACKOFF_MAX = float(os.getenv('LLM_BACKOFF_MAX', 8))
+
+# Consecutive failed completions that open the breaker, and how long it stays open
+LLM_BREAKER_FAILURES = int(os.getenv('LLM_BREAKER_FAILURES', 5))
+LLM_BREAKER_COOLDOWN = float(os.getenv('LLM_BREAKER_COOLDOWN', 30))
+
+# Keep-alive connections to the API, per worker process
+LLM_POOL_SIZE = int(os.getenv('LLM_POOL_SIZE', 32))
+
+
+class LLMUnavailable(Exception):
+    """The completion was not attempted: the breaker is open or the rate limit wait exceeds the budget."""
+
+
+class TokenBucket:
+    """Continuously refilled bucket of ``per_minute`` units, shared by threads and event loops.
+
+    ``reserve`` takes units up front and returns how long the caller must
+    wait before using them, so waiting callers are served in order.
+    """
+
+    def __init__(self, per_minute):
+        self.capacity = per_minute
+        self.rate = per_minute / 60.0
+        self.level = per_minute
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, amount, max_wait):
+        """Reserve ``amount`` units; return the wait in seconds, or None (nothing reserved) if over ``max_wait``."""
+        if not self.capacity:
+            return 0.0
+        amount = min(amount, self.capacity)
+        with self._lock:
+            now = time.monotonic()
+            self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+            self.updated = now
+            wait = max(0.0, (amount - self.level) / self.rate)
+            if wait > max_wait:
+                return None
+            self.level -= amount
+            return wait
+
+    def refund(self, amount):
+        if self.capacity:
+            with self._lock:
+                self.level = min(self.capacity, self.level + min(amount, self.capacity))
+
+
+class CircuitBreaker:
+    """Opens after ``failures`` consecutive failed completions and stays open for ``cooldown`` seconds.
+
+    After the cooldown one probe request is let through (half-open); its
+    success closes the breaker and its failure opens it again.
+    """
+
+    def __init__(self, failures, cooldown):
+        self.threshold = failures
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return 'closed'
+        return 'half-open' if time.monotonic() - self.opened_at >= self.cooldown else 'open'
+
+    def allow(self):
+        """Return 'closed' or 'probe' when a request may go ahead, None while the breaker is open."""
+        with self._lock:
+            if self.opened_at is None:
+                return 'closed'
+            if time.monotonic() - self.opened_at < self.cooldown or self.probing:
+                return None
+            self.probing = True
+            return 'probe'
+
+    def release(self):
+        """End a probe that finished without a verdict (throttled or cancelled), so another can run."""
+        with self._lock:
+            self.probing = False
+
+    def success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self.probing = False
+
+    def failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.probing or (self.threshold and self.failures >= self.threshold):
+                if self.opened_at is None or self.probing:
+                    print(f"LLM circuit breaker open for {self.cooldown}s after {self.failures} failed completions")
+                self.opened_at = time.monotonic()
+            self.probing = False
+
+
+class LLMClient:
+    """Chat completions over a persistent connection pool, within client-side RPM/TPM quotas.
+
+    Transient failures (429, 5xx, timeouts, connection errors) are retried
+    with full-jitter exponential backoff until ``LLM_RETRY_BUDGET`` is spent,
+    honouring Retry-After. A completion that still fails counts towards the
+    circuit breaker; while it is open, calls raise ``LLMUnavailable``
+    immediately so callers fall back instead of queueing behind timeouts.
+    """
+
+    def __init__(self, api_key, rpm=LLM_RPM, tpm=LLM_TPM, budget=LLM_RETRY_BUDGET, max_retries=LLM_MAX_RETRIES,
+                 pool_size=LLM_POOL_SIZE):
+        self.api_key = api_key
+        self.requests_bucket = TokenBucket(rpm)
+        self.tokens_bucket = TokenBucket(tpm)
+        self.breaker = CircuitBreaker(LLM_BREAKER_FAILURES, LLM_BREAKER_COOLDOWN)
+        self.budget = budget
+        self.max_retries = max_retries
+        self.pool_size = pool_size
+        self._openai = None
+        self._aiohttp_sessions = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+
+    @property
+    def openai(self):
+        """The openai module, imported on first use and pointed at this client's connection pool."""
+        if self._openai is None:
+            with self._lock:
+                if self._openai is None:
+                    import openai
+                    openai.api_key = self.api_key
+                    openai.requestssession = self._requests_session()
+                    self._openai = openai
+        return self._openai
+
+    def _requests_session(self):
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        class PooledSession(requests.Session):
+            # openai closes its per-thread session every few minutes; the shared pool outlives that
+            def close(self):
+                pass
+
+        session = PooledSession()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size, max_retries=2)
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        return session
+
+    def _aiohttp_session(self):
+        """One aiohttp session (and connection pool) per event loop."""
+        loop = asyncio.get_running_loop()
+        session = self._aiohttp_sessions.get(loop)
+        if session is None or session.closed:
+            import aiohttp
+            session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=0, keepalive_timeout=60))
+            self._aiohttp_sessions[loop] = session
+        return session
+
+    async def aclose(self):
+        """Close the running loop's aiohttp session."""
+        session = self._aiohttp_sessions.pop(asyncio.get_running_loop(), None)
+        if session is not None:
+            await session.close()
+
+    def stats(self):
+        return {
+            'breaker': self.breaker.state,
+            'consecutive_failures': self.breaker.failures,
+            'rpm_limit': self.requests_bucket.capacity,
+            'tpm_limit': self.tokens_bucket.capacity
+        }
+
+    def _estimate_tokens(self, request):
+        """Tokens the API charges against TPM for a request: the prompt (~4 chars/token) plus max_tokens."""
+        prompt = sum(len(message['content']) for message in request['messages'])
+        return prompt // 4 + request.get('max_tokens', 0)
+
+    def _admit(self, request, deadline):
+        """Reserve quota for a request the breaker allowed; return the seconds to wait before sending."""
+        remaining = deadline - time.monotonic()
+        tokens = self._estimate_tokens(request)
+        wait = self.requests_bucket.reserve(1, remaining)
+        if wait is not None:
+            token_wait = self.tokens_bucket.reserve(tokens, remaining)
+            if token_wait is None:
+                self.requests_bucket.refund(1)
+            wait = None if token_wait is None else max(wait, token_wait)
+        if wait is None:
+            LLM_REQUESTS.inc(outcome='throttled')
+            raise LLMUnavailable(f"LLM rate limit wait exceeds the {self.budget}s budget")
+        return wait
+
+    def _retry_delay(self, error, attempt, deadline):
+        """Seconds to sleep before retrying ``error``, or None when it should not (or cannot) be retried."""
+        errors = self.openai.error
+        if isinstance(error, errors.APIError):
+            retryable = error.http_status is None or error.http_status >= 500
+        else:
+            retryable = isinstance(error, (errors.RateLimitError, errors.Timeout, errors.APIConnectionError,
+                                           errors.ServiceUnavailableError, errors.TryAgain))
+        if not retryable or attempt >= self.max_retries:
+            return None
+        delay = random.uniform(0, min(LLM_BACKOFF_MAX, LLM_BACKOFF_BASE * 2 ** attempt))
+        retry_after = getattr(error, 'headers', None) and error.headers.get('retry-after')
+        if retry_after:
+            try:
+                delay = max(delay, float(retry_after))
+            except ValueError:
+                pass
+        if time.monotonic() + delay >= deadline:
+            return None
+        return delay
+
+    def _attempt_request(self, request, deadline):
+        remaining = deadline - time.monotonic()
+        return dict(request, request_timeout=min(request.get('request_timeout', remaining), remaining))
+
+    def _record(self, error):
+        errors = self.openai.error
+        if error is None:
+            self.breaker.success()
+            LLM_REQUESTS.inc(outcome='success')
+        elif isinstance(error, (errors.AuthenticationError, errors.PermissionError, errors.InvalidRequestError)):
+            # The request itself is wrong; the upstream is healthy
+            self.breaker.success()
+            LLM_REQUESTS.inc(outcome='error')
+        else:
+            self.breaker.failure()
+            LLM_REQUESTS.inc(outcome='error')
+
+    def _allow(self):
+        state = self.breaker.allow()
+        if state is None:
+            LLM_REQUESTS.inc(outcome='short_circuit')
+            raise LLMUnavailable("LLM circuit breaker is open")
+        return state
+
+    def complete(self, request):
+        """Run ``openai.ChatCompletion.create(**request)`` with quota, retries and the breaker."""
+        deadline = time.monotonic() + self.budget
+        state = self._allow()
+        try:
+            time.sleep(self._admit(request, deadline))
+            attempt = 0
+            while True:
+                try:
+                    response = self.openai.ChatCompletion.create(**self._attempt_request(request, deadline))
+                except Exception as e:
+                    delay = self._retry_delay(e, attempt, deadline)
+                    if delay is None:
+                        self._record(e)
+                        raise
+                    LLM_REQUESTS.inc(outcome='retry')
+                    time.sleep(delay)
+                    attempt += 1
+                    continue
+                self._record(None)
+                return response
+        finally:
+            if state == 'probe':
+                self.breaker.release()
+
+    async def acomplete(self, request):
+        """``complete`` for asyncio callers, over the event loop's pooled aiohttp session."""
+        deadline = time.monotonic() + self.budget
+        state = self._allow()
+        openai = self.openai
+        token = openai.aiosession.set(self._aiohttp_session())
+        try:
+            await asyncio.sleep(self._admit(request, deadline))
+            attempt = 0
+            while True:
+                try:
+                    response = await openai.ChatCompletion.acreate(**self._attempt_request(request, deadline))
+                except Exception as e:
+                    delay = self._retry_delay(e, attempt, deadline)
+                    if delay is None:
+                        self._record(e)
+                        raise
+                    LLM_REQUESTS.inc(outcome='retry')
+                    await asyncio.sleep(delay)
+                    attempt += 1
+                    continue
+                self._record(None)
+                return response
+        finally:
+            openai.aiosession.reset(token)
+            if state == 'probe':
+                self.breaker.release()
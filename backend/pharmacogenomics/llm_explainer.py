@@ -1,167 +1,636 @@
-import openai
-import os
-import json
-from dotenv import load_dotenv
-
-# Load environment variables
-load_dotenv()
-
-# Configure OpenAI with the best model
-openai.api_key = os.getenv('OPENAI_API_KEY')
-
-def generate_explanation(patient_id, drug, risk_label, phenotype, variants, gene):
-    """Generate LLM explanation using GPT-3.5-turbo with variant citations following exact schema."""
-    
-    # If no API key, return structured fallback
-    if not openai.api_key or openai.api_key == 'your_openai_api_key_here':
-        return generate_fallback_explanation(patient_id, drug, risk_label, phenotype, variants, gene)
-    
-    # Handle empty variants list
-    if not variants or len(variants) == 0:
-        return generate_fallback_explanation(patient_id, drug, risk_label, phenotype, [], gene)
-    
-    # Build detailed variant information
-    variant_details = []
-    for v in variants:
-        try:
-            variant_details.append(
-                f"- {v.get('rsid', 'unknown')} in {v.get('gene', gene)} (star allele: {v.get('star_allele', 'unknown')}, "
-                f"position: chr{v.get('chrom', '?')}:{v.get('pos', '?')}, quality: {v.get('quality', 'N/A')})"
-            )
-        except Exception as e:
-            print(f"Error processing variant: {e}")
-            continue
-    
-    if not variant_details:
-        return generate_fallback_explanation(patient_id, drug, risk_label, phenotype, variants, gene)
-    
-    variant_str = "\n".join(variant_details)
-    
-    # Create comprehensive prompt for GPT-4
-    prompt = f"""You are a board-certified clinical pharmacogenomics expert providing a detailed risk assessment.
-
-PATIENT INFORMATION:
-- Patient ID: {patient_id}
-- Drug Prescribed: {drug}
-- Risk Classification: {risk_label}
-- Primary Gene: {gene}
-- Metabolizer Phenotype: {phenotype}
-
-GENETIC VARIANTS DETECTED:
-{variant_str}
-
-TASK:
-Generate a comprehensive clinical explanation in JSON format with these exact keys:
-
-1. "summary": A clear 2-3 sentence summary explaining the overall risk assessment and what it means for this patient.
-
-2. "mechanism": A detailed explanation of the biological mechanism - how these specific genetic variants affect the {gene} enzyme's function and consequently alter {drug} metabolism and efficacy.
-
-3. "variant_impact": Specific analysis of how each detected variant (cite by rsID) contributes to the overall phenotype and risk profile.
-
-REQUIREMENTS:
-- Be scientifically accurate and cite specific variants by rsID
-- Explain in terms understandable to healthcare providers
-- Reference CPIC guidelines where applicable
-- Avoid speculation - only state what is supported by evidence
-- Return ONLY valid JSON, no markdown formatting
-
-Example format:
-{{
-  "summary": "Patient exhibits...",
-  "mechanism": "The {gene} gene encodes...",
-  "variant_impact": "The {v['rsid']} variant..."
-}}"""
-
-    try:
-        # Use GPT-3.5-turbo (more widely available) or GPT-4 if available
-        model = "gpt-3.5-turbo"  # Change to "gpt-4" if you have access
-        
-        response = openai.ChatCompletion.create(
-            model=model,
-            messages=[
-                {
-                    "role": "system", 
-                    "content": "You are a clinical pharmacogenomics expert. Provide accurate, evidence-based explanations. Always respond with valid JSON only, no markdown code blocks."
-                },
-                {
-                    "role": "user", 
-                    "content": prompt
-                }
-            ],
-            temperature=0.2,  # Lower temperature for more consistent, factual responses
-            max_tokens=800,
-            top_p=0.9
-        )
-        
-        content = response.choices[0].message.content.strip()
-        
-        # Clean up markdown formatting if present
-        if '```json' in content:
-            content = content.split('```json')[1].split('```')[0].strip()
-        elif '```' in content:
-            content = content.split('```')[1].split('```')[0].strip()
-        
-        # Parse JSON response
-        explanation = json.loads(content)
-        
-        # Validate and ensure all required keys exist
-        required_keys = ['summary', 'mechanism', 'variant_impact']
-        for key in required_keys:
-            if key not in explanation or not explanation[key]:
-                explanation[key] = generate_fallback_field(key, drug, gene, phenotype, risk_label, variants)
-        
-        return explanation
-        
-    except json.JSONDecodeError as e:
-        print(f"JSON decode error: {e}")
-        print(f"Content received: {content[:200] if 'content' in locals() else 'No content'}")
-        return generate_fallback_explanation(patient_id, drug, risk_label, phenotype, variants, gene)
-        
-    except openai.error.AuthenticationError:
-        print("OpenAI API authentication failed - check API key")
-        return generate_fallback_explanation(patient_id, drug, risk_label, phenotype, variants, gene)
-        
-    except openai.error.RateLimitError:
-        print("OpenAI API rate limit exceeded")
-        return generate_fallback_explanation(patient_id, drug, risk_label, phenotype, variants, gene)
-        
-    except Exception as e:
-        print(f"Error generating LLM explanation: {type(e).__name__}: {str(e)}")
-        return generate_fallback_explanation(patient_id, drug, risk_label, phenotype, variants, gene)
-
-
-def generate_fallback_field(field, drug, gene, phenotype, risk_label, variants):
-    """Generate a specific fallback field."""
-    variant_list = ', '.join([v['rsid'] for v in variants]) if variants else 'none'
-    
-    fallbacks = {
-        'summary': f"Patient has {phenotype} phenotype for {gene}, resulting in {risk_label} risk classification for {drug}. Genetic testing detected {len(variants)} variant(s) affecting drug metabolism.",
-        'mechanism': f"The {gene} gene encodes an enzyme critical for {drug} metabolism. The patient's {phenotype} phenotype indicates altered enzyme activity, which affects how the body processes this medication. This can lead to either reduced drug efficacy or increased risk of adverse effects.",
-        'variant_impact': f"Detected variants ({variant_list}) in {gene} contribute to the {phenotype} metabolizer status. These genetic variations alter enzyme function, directly impacting {drug} pharmacokinetics and clinical response."
-    }
-    
-    return fallbacks.get(field, f"Information about {field} not available.")
-
-
-def generate_fallback_explanation(patient_id, drug, risk_label, phenotype, variants, gene):
-    """Generate comprehensive fallback explanation when LLM is unavailable."""
-    variant_list = ', '.join([v['rsid'] for v in variants]) if variants else 'none detected'
-    
-    # Drug-specific mechanism information
-    drug_mechanisms = {
-        'CODEINE': f"{gene} converts codeine to morphine (active form). {phenotype} metabolizers may experience altered pain relief.",
-        'WARFARIN': f"{gene} metabolizes warfarin. {phenotype} status affects dosing requirements and bleeding risk.",
-        'CLOPIDOGREL': f"{gene} activates clopidogrel to its active form. {phenotype} metabolizers may have reduced antiplatelet effect.",
-        'SIMVASTATIN': f"{gene} transporter affects simvastatin uptake. {phenotype} status influences myopathy risk.",
-        'AZATHIOPRINE': f"{gene} metabolizes azathioprine. {phenotype} metabolizers have altered toxicity risk.",
-        'FLUOROURACIL': f"{gene} metabolizes fluorouracil. {phenotype} status significantly affects toxicity risk."
-    }
-    
-    mechanism = drug_mechanisms.get(drug, f"{gene} affects {drug} metabolism. {phenotype} status alters drug response.")
-    
-    return {
-        "summary": f"Genetic analysis reveals {phenotype} phenotype for {gene}, classifying {drug} risk as {risk_label}. This assessment is based on {len(variants)} detected variant(s) that affect drug metabolism and clinical response.",
-        "mechanism": mechanism,
-        "variant_impact": f"Variants identified: {variant_list}. These genetic variations in {gene} modify enzyme activity, leading to the {phenotype} metabolizer classification and corresponding {risk_label} risk profile for {drug} therapy."
+import asyncio
+import os
+import json
+import tempfile
+from concurrent.futures import TimeoutError
+from dotenv import load_dotenv
+
+from .cache import FileLocks, SingleFlight, canonical_key, tiered_cache_from_env
+from .llm_client import LLM_RETRY_BUDGET, LLMClient, LLMUnavailable
+from .metrics import LLM_REQUESTS
+
+# Load environment variables (the only load_dotenv call; every entry point
+# imports this module before reading its settings)
+load_dotenv()
+
+# Configure OpenAI with the best model. The openai package is slow to
+# import, so the client only loads it once an explanation actually needs it.
+OPENAI_API_KEY = os.getenv('OPENAI_API_KEY')
+LLM_CLIENT = LLMClient(OPENAI_API_KEY)
+
+# Use GPT-3.5-turbo (more widely available) or GPT-4 if available
+MODEL = "gpt-3.5-turbo"  # Change to "gpt-4" if you have access
+
+# Upper bound on a single completion request, in seconds
+LLM_REQUEST_TIMEOUT = float(os.getenv('LLM_REQUEST_TIMEOUT', 30))
+
+# Explanations depend only on the drug/genotype inputs, never on the patient,
+# so repeat genotypes across patients are served from this cache.
+EXPLANATION_CACHE = tiered_cache_from_env(
+    'EXPLANATION_CACHE',
+    os.path.join(tempfile.gettempdir(), 'pharmaguard', 'explanations.sqlite3')
+)
+
+# Concurrent requests for the same explanation share one completion: within
+# a worker through EXPLANATION_FLIGHTS, and across workers sharing the SQLite
+# store through lock files, the waiting worker reading the answer back from
+# the store. An empty EXPLANATION_LOCK_DIR turns the lock files off.
+EXPLANATION_FLIGHTS = SingleFlight()
+EXPLANATION_LOCK_DIR = os.getenv('EXPLANATION_LOCK_DIR',
+                                 os.path.join(tempfile.gettempdir(), 'pharmaguard', 'explanation-locks'))
+EXPLANATION_LOCKS = (FileLocks(EXPLANATION_LOCK_DIR)
+                     if EXPLANATION_LOCK_DIR and EXPLANATION_CACHE.disk is not None and FileLocks.supported else None)
+# How long a caller waits on another's completion: the other may first wait
+# out a completion in another worker, then spend its own retry budget
+EXPLANATION_WAIT = 2 * LLM_RETRY_BUDGET
+
+
+def explanation_cache_key(drug, risk_label, phenotype, variants, gene):
+    """Canonical cache key for an explanation; deliberately excludes patient_id.
+
+    Variants enter as (gene, rsid, star allele) only, the same fields the
+    prompt shows, so patients with the same alleles share an explanation
+    whatever their VCF's QUAL values or assembly.
+    """
+    variant_set = sorted(
+        (str(v.get('gene', gene)), str(v.get('rsid', '')), str(v.get('star_allele', '')))
+        for v in variants
+    )
+    return canonical_key(MODEL, drug, risk_label, phenotype, gene, variant_set)
+
+
+def explanation_cache_stats():
+    """Return hit/miss counters for the explanation cache, and how many misses shared an in-flight completion."""
+    return dict(EXPLANATION_CACHE.stats(), in_flight=len(EXPLANATION_FLIGHTS), coalesced=EXPLANATION_FLIGHTS.coalesced)
+
+
+def llm_client_stats():
+    """Return the LLM client's breaker state and configured quotas."""
+    return LLM_CLIENT.stats()
+
+REQUIRED_FIELDS = ('summary', 'mechanism', 'variant_impact')
+
+SYSTEM_PROMPT = "You are a clinical pharmacogenomics expert. Provide accurate, evidence-based explanations. Always respond with valid JSON only, no markdown code blocks."
+
+
+def _has_api_key():
+    return bool(OPENAI_API_KEY) and OPENAI_API_KEY != 'your_openai_api_key_here'
+
+
+def llm_enabled():
+    """True when an OpenAI API key is configured, so explanations can come from the LLM."""
+    return _has_api_key()
+
+
+def _load_openai():
+    """Import and configure the openai client on first use."""
+    return LLM_CLIENT.openai
+
+
+def _format_variant_details(variants, gene):
+    """Render one prompt line per variant."""
+    variant_details = []
+    for v in variants:
+        try:
+            variant_details.append(
+                f"- {v.get('rsid', 'unknown')} in {v.get('gene', gene)} (star allele: {v.get('star_allele', 'unknown')})"
+            )
+        except Exception as e:
+            print(f"Error processing variant: {e}")
+            continue
+    return variant_details
+
+
+def _completion_request(prompt, max_tokens):
+    """Keyword arguments for one chat completion request."""
+    return dict(
+        model=MODEL,
+        messages=[
+            {
+                "role": "system", 
+                "content": SYSTEM_PROMPT
+            },
+            {
+                "role": "user", 
+                "content": prompt
+            }
+        ],
+        temperature=0.2,  # Lower temperature for more consistent, factual responses
+        max_tokens=max_tokens,
+        top_p=0.9,
+        request_timeout=LLM_REQUEST_TIMEOUT
+    )
+
+
+def _completion_content(response):
+    """Return a completion's content with markdown fences stripped."""
+    content = response.choices[0].message.content.strip()
+    
+    # Clean up markdown formatting if present
+    if '```json' in content:
+        content = content.split('```json')[1].split('```')[0].strip()
+    elif '```' in content:
+        content = content.split('```')[1].split('```')[0].strip()
+    return content
+
+
+def _chat_completion(prompt, max_tokens):
+    """Send one chat completion and return its content with markdown fences stripped."""
+    return _completion_content(LLM_CLIENT.complete(_completion_request(prompt, max_tokens)))
+
+
+async def _achat_completion(prompt, max_tokens):
+    """``_chat_completion`` for asyncio callers; the request does not block the event loop."""
+    return _completion_content(await LLM_CLIENT.acomplete(_completion_request(prompt, max_tokens)))
+
+
+def _fill_missing_fields(explanation, drug, gene, phenotype, risk_label, variants):
+    """Replace missing or empty explanation fields with their fallback text."""
+    for key in REQUIRED_FIELDS:
+        if key not in explanation or not explanation[key]:
+            explanation[key] = generate_fallback_field(key, drug, gene, phenotype, risk_label, variants)
+    return explanation
+
+
+def _explanation_prompt(patient_id, drug, risk_label, phenotype, variants, gene):
+    """Return the completion prompt explaining one drug."""
+    
+    # Build detailed variant information
+    variant_str = "\n".join(_format_variant_details(variants, gene))
+    
+    # Create comprehensive prompt for GPT-4
+    prompt = f"""You are a board-certified clinical pharmacogenomics expert providing a detailed risk assessment.
+
+PATIENT INFORMATION:
+- Drug Prescribed: {drug}
+- Risk Classification: {risk_label}
+- Primary Gene: {gene}
+- Metabolizer Phenotype: {phenotype}
+
+GENETIC VARIANTS DETECTED:
+{variant_str}
+
+TASK:
+Generate a comprehensive clinical explanation in JSON format with these exact keys:
+
+1. "summary": A clear 2-3 sentence summary explaining the overall risk assessment and what it means for this patient.
+
+2. "mechanism": A detailed explanation of the biological mechanism - how these specific genetic variants affect the {gene} enzyme's function and consequently alter {drug} metabolism and efficacy.
+
+3. "variant_impact": Specific analysis of how each detected variant (cite by rsID) contributes to the overall phenotype and risk profile.
+
+REQUIREMENTS:
+- Be scientifically accurate and cite specific variants by rsID
+- Explain in terms understandable to healthcare providers
+- Reference CPIC guidelines where applicable
+- Avoid speculation - only state what is supported by evidence
+- Return ONLY valid JSON, no markdown formatting
+
+Example format:
+{{
+  "summary": "Patient exhibits...",
+  "mechanism": "The {gene} gene encodes...",
+  "variant_impact": "The {variants[-1].get('rsid', 'unknown')} variant..."
+}}"""
+    return prompt
+
+
+def _finish_explanation(content, cache_key, args):
+    """Parse a completion into an explanation, fill any missing fields and cache it."""
+    patient_id, drug, risk_label, phenotype, variants, gene = args
+    explanation = json.loads(content)
+    
+    # Validate and ensure all required keys exist
+    _fill_missing_fields(explanation, drug, gene, phenotype, risk_label, variants)
+    
+    EXPLANATION_CACHE.set(cache_key, explanation)
+    return dict(explanation)
+
+
+def _explanation_failed(error, content):
+    """Log why a completion could not be used."""
+    if isinstance(error, LLMUnavailable):
+        print(f"Skipping LLM explanation: {error}")
+        return
+    openai = _load_openai()
+    if isinstance(error, json.JSONDecodeError):
+        print(f"JSON decode error: {error}")
+        print(f"Content received: {content[:200]}")
+    elif isinstance(error, openai.error.AuthenticationError):
+        print("OpenAI API authentication failed - check API key")
+    elif isinstance(error, openai.error.RateLimitError):
+        print("OpenAI API rate limit exceeded")
+    else:
+        print(f"Error generating LLM explanation: {type(error).__name__}: {str(error)}")
+
+
+def _explain_one(args, cache_key):
+    """Return the explanation from one single-drug completion, or None if it failed."""
+    content = None
+    try:
+        content = _chat_completion(_explanation_prompt(*args), max_tokens=800)
+        return _finish_explanation(content, cache_key, args)
+    except Exception as e:
+        _explanation_failed(e, content)
+        return None
+
+
+async def _aexplain_one(args, cache_key):
+    """``_explain_one`` for asyncio callers."""
+    content = None
+    try:
+        content = await _achat_completion(_explanation_prompt(*args), max_tokens=800)
+        return _finish_explanation(content, cache_key, args)
+    except Exception as e:
+        _explanation_failed(e, content)
+        return None
+
+
+def generate_explanation(patient_id, drug, risk_label, phenotype, variants, gene):
+    """Generate LLM explanation using GPT-3.5-turbo with variant citations following exact schema."""
+    return generate_batch_explanations([(patient_id, drug, risk_label, phenotype, variants, gene)])[0]
+
+
+async def agenerate_explanation(patient_id, drug, risk_label, phenotype, variants, gene):
+    """``generate_explanation`` for asyncio callers: the completion request does not block the event loop."""
+    return (await agenerate_batch_explanations([(patient_id, drug, risk_label, phenotype, variants, gene)]))[0]
+
+
+# Completion budget per drug in a batched request, and the overall cap
+BATCH_TOKENS_PER_DRUG = 600
+BATCH_MAX_TOKENS = 3500
+
+
+def _plan_batch(calls):
+    """Return explanations ready without the LLM (None where still needed) and the (index, cache key) pending."""
+    explanations = [None] * len(calls)
+    pending = []
+    for i, (patient_id, drug, risk_label, phenotype, variants, gene) in enumerate(calls):
+        if not variants:
+            explanations[i] = generate_fallback_explanation(patient_id, drug, risk_label, phenotype, [], gene)
+            continue
+        cache_key = explanation_cache_key(drug, risk_label, phenotype, variants, gene)
+        cached = EXPLANATION_CACHE.get(cache_key)
+        if cached is not None:
+            explanations[i] = dict(cached)
+        elif not _format_variant_details(variants, gene):
+            explanations[i] = generate_fallback_explanation(patient_id, drug, risk_label, phenotype, variants, gene)
+        else:
+            pending.append((i, cache_key))
+    return explanations, pending
+
+
+def _claim(pending):
+    """Split (index, cache key) pairs into those this caller explains and (index, flight) pairs already in flight."""
+    owned, shared = [], []
+    for i, cache_key in pending:
+        flight = EXPLANATION_FLIGHTS.claim(cache_key)
+        if flight is None:
+            owned.append((i, cache_key))
+        else:
+            LLM_REQUESTS.inc(outcome='coalesced')
+            shared.append((i, flight))
+    return owned, shared
+
+
+def _resolve(owned, results):
+    for i, cache_key in owned:
+        EXPLANATION_FLIGHTS.resolve(cache_key, results.get(i))
+
+
+def _shared_answer(flight, args):
+    """Wait for another caller's in-flight explanation; None if it failed or stalled."""
+    try:
+        return flight.result(timeout=EXPLANATION_WAIT)
+    except TimeoutError:
+        print(f"Gave up waiting on the in-flight explanation for {args[1]}; using fallback")
+        return None
+
+
+async def _ashared_answer(flight, args):
+    """``_shared_answer`` for asyncio callers; cancelling the wait leaves the flight running."""
+    try:
+        return await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(flight)), EXPLANATION_WAIT)
+    except asyncio.TimeoutError:
+        print(f"Gave up waiting on the in-flight explanation for {args[1]}; using fallback")
+        return None
+
+
+def _store_batch_answers(pending, answers):
+    """Return {index: explanation} for a batched completion's answers."""
+    results = {}
+    for (i, cache_key), (explanation, answered) in zip(pending, answers):
+        # Only cache drugs the model actually answered
+        if answered:
+            EXPLANATION_CACHE.set(cache_key, explanation)
+        results[i] = explanation
+    return results
+
+
+def _complete(calls, pending):
+    """Explain the pending (index, cache key) pairs with one completion; return {index: explanation or None}."""
+    if not pending:
+        return {}
+    if len(pending) == 1:
+        i, cache_key = pending[0]
+        return {i: _explain_one(calls[i], cache_key)}
+    return _store_batch_answers(pending, _explain_batch([calls[i] for i, _ in pending]))
+
+
+async def _acomplete(calls, pending):
+    """``_complete`` for asyncio callers."""
+    if not pending:
+        return {}
+    if len(pending) == 1:
+        i, cache_key = pending[0]
+        return {i: await _aexplain_one(calls[i], cache_key)}
+    return _store_batch_answers(pending, await _aexplain_batch([calls[i] for i, _ in pending]))
+
+
+def _try_lock(keys):
+    """Lock explanation keys against other workers; return (handles, keys another worker holds)."""
+    if EXPLANATION_LOCKS is None or not keys:
+        return [], set()
+    try:
+        handles, busy = EXPLANATION_LOCKS.try_lock(keys)
+    except OSError as e:
+        print(f"Explanation lock files unavailable: {e}")
+        return [], set()
+    return handles, set(busy)
+
+
+def _unlock(handles):
+    if handles:
+        EXPLANATION_LOCKS.release(handles)
+
+
+def _read_back(waiting):
+    """Take what another caller cached for ``waiting`` pairs; return (results, pairs still missing)."""
+    results, missing = {}, []
+    for i, cache_key in waiting:
+        cached = EXPLANATION_CACHE.get(cache_key)
+        if cached is None:
+            missing.append((i, cache_key))
+        else:
+            LLM_REQUESTS.inc(outcome='coalesced')
+            results[i] = cached
+    return results, missing
+
+
+def _explain_owned(calls, owned):
+    """Explain the (index, cache key) pairs this process leads; return {index: explanation or None}.
+
+    Keys another worker is already explaining wait for its lock and read
+    its answer from the shared cache; only what it failed to answer is sent.
+    The cache is checked again first: a leader that finished between the
+    caller's lookup and its claim has already stored its answer.
+    """
+    results, owned = _read_back(owned)
+    handles, busy = _try_lock([cache_key for _, cache_key in owned])
+    try:
+        results.update(_complete(calls, [entry for entry in owned if entry[1] not in busy]))
+    finally:
+        _unlock(handles)
+    waiting = [entry for entry in owned if entry[1] in busy]
+    if waiting:
+        try:
+            handles = EXPLANATION_LOCKS.lock([cache_key for _, cache_key in waiting], LLM_RETRY_BUDGET)
+        except OSError as e:
+            print(f"Explanation lock files unavailable: {e}")
+            handles = []
+        try:
+            cached, missing = _read_back(waiting)
+            results.update(cached)
+            results.update(_complete(calls, missing))
+        finally:
+            _unlock(handles)
+    return results
+
+
+async def _aexplain_owned(calls, owned):
+    """``_explain_owned`` for asyncio callers."""
+    results, owned = _read_back(owned)
+    handles, busy = _try_lock([cache_key for _, cache_key in owned])
+    try:
+        results.update(await _acomplete(calls, [entry for entry in owned if entry[1] not in busy]))
+    finally:
+        _unlock(handles)
+    waiting = [entry for entry in owned if entry[1] in busy]
+    if waiting:
+        try:
+            handles = await EXPLANATION_LOCKS.alock([cache_key for _, cache_key in waiting], LLM_RETRY_BUDGET)
+        except OSError as e:
+            print(f"Explanation lock files unavailable: {e}")
+            handles = []
+        try:
+            cached, missing = _read_back(waiting)
+            results.update(cached)
+            results.update(await _acomplete(calls, missing))
+        finally:
+            _unlock(handles)
+    return results
+
+
+def _with_fallbacks(explanations, results, calls):
+    # Results may be shared with other callers or held by the cache, so each caller gets a copy
+    for i, explanation in results.items():
+        if explanation is not None:
+            explanations[i] = dict(explanation)
+    return [explanation if explanation is not None else generate_fallback_explanation(*args)
+            for explanation, args in zip(explanations, calls)]
+
+
+def generate_batch_explanations(calls):
+    """Explain several drugs for one patient with a single completion request.
+
+    ``calls`` holds ``generate_explanation`` argument tuples for one patient.
+    Cached explanations are reused and only the remaining drugs go into one
+    prompt that lists each gene's variants once and asks for a JSON object
+    keyed by drug. Each drug's fields are validated separately, so a partial
+    or malformed answer only falls back for the drugs it got wrong. A drug
+    another caller is already explaining waits for that answer instead of
+    being asked again. Returns explanations in the order of ``calls``.
+    """
+    if not _has_api_key():
+        return [generate_fallback_explanation(*args) for args in calls]
+
+    explanations, pending = _plan_batch(calls)
+    if not pending:
+        return explanations
+    owned, shared = _claim(pending)
+    results = {}
+    try:
+        results = _explain_owned(calls, owned)
+    finally:
+        _resolve(owned, results)
+    for i, flight in shared:
+        results[i] = _shared_answer(flight, calls[i])
+    return _with_fallbacks(explanations, results, calls)
+
+
+async def agenerate_batch_explanations(calls):
+    """``generate_batch_explanations`` for asyncio callers."""
+    if not _has_api_key():
+        return [generate_fallback_explanation(*args) for args in calls]
+
+    explanations, pending = _plan_batch(calls)
+    if not pending:
+        return explanations
+    owned, shared = _claim(pending)
+    results = {}
+    try:
+        results = await _aexplain_owned(calls, owned)
+    finally:
+        _resolve(owned, results)
+    for i, flight in shared:
+        results[i] = await _ashared_answer(flight, calls[i])
+    return _with_fallbacks(explanations, results, calls)
+
+
+def _batch_prompt(calls):
+    """Return (prompt, max_tokens) for one completion explaining every call."""
+    gene_variants = {}
+    for _, _, _, _, variants, gene in calls:
+        gene_variants.setdefault(gene, variants)
+    variant_str = "\n\n".join(
+        f"{gene}:\n" + "\n".join(_format_variant_details(variants, gene))
+        for gene, variants in gene_variants.items()
+    )
+    drug_str = "\n".join(
+        f"- {drug}: Primary Gene {gene}, Metabolizer Phenotype {phenotype}, Risk Classification {risk_label}"
+        for _, drug, risk_label, phenotype, _, gene in calls
+    )
+    drugs = [args[1] for args in calls]
+
+    prompt = f"""You are a board-certified clinical pharmacogenomics expert providing a detailed risk assessment.
+
+DRUGS PRESCRIBED:
+{drug_str}
+
+GENETIC VARIANTS DETECTED:
+{variant_str}
+
+TASK:
+Generate a comprehensive clinical explanation for EACH drug above. Return one JSON object whose keys are exactly the drug names ({", ".join(drugs)}); each value is an object with these exact keys:
+
+1. "summary": A clear 2-3 sentence summary explaining the overall risk assessment and what it means for this patient.
+
+2. "mechanism": A detailed explanation of the biological mechanism - how these specific genetic variants affect the gene's function and consequently alter the drug's metabolism and efficacy.
+
+3. "variant_impact": Specific analysis of how each detected variant (cite by rsID) contributes to the overall phenotype and risk profile.
+
+REQUIREMENTS:
+- Be scientifically accurate and cite specific variants by rsID
+- Explain in terms understandable to healthcare providers
+- Reference CPIC guidelines where applicable
+- Avoid speculation - only state what is supported by evidence
+- Return ONLY valid JSON, no markdown formatting
+
+Example format:
+{{
+  "{drugs[0]}": {{
+    "summary": "Patient exhibits...",
+    "mechanism": "The {calls[0][5]} gene encodes...",
+    "variant_impact": "The {calls[0][4][0].get('rsid', 'unknown')} variant..."
+  }}
+}}"""
+    return prompt, min(BATCH_MAX_TOKENS, BATCH_TOKENS_PER_DRUG * len(calls))
+
+
+def _parse_batch(content, calls):
+    """Split a batched completion into an (explanation, answered) pair per call."""
+    answer = json.loads(content)
+    if not isinstance(answer, dict):
+        raise ValueError(f"expected a JSON object keyed by drug, got {type(answer).__name__}")
+
+    # Models occasionally vary the key casing, so match drugs case-insensitively
+    by_drug = {str(key).upper(): value for key, value in answer.items()}
+    explanations = []
+    for _, drug, risk_label, phenotype, variants, gene in calls:
+        explanation = by_drug.get(drug.upper())
+        answered = isinstance(explanation, dict)
+        if not answered:
+            print(f"Batched explanation missing {drug}; using fallback fields")
+            explanation = {}
+        explanation = {key: explanation.get(key) for key in REQUIRED_FIELDS}
+        explanations.append((_fill_missing_fields(explanation, drug, gene, phenotype, risk_label, variants), answered))
+    return explanations
+
+
+def _batch_failed(error, content, calls):
+    """Log why a batched completion could not be used; every explanation is None."""
+    if isinstance(error, LLMUnavailable):
+        print(f"Skipping batched LLM explanation: {error}")
+        return [(None, False)] * len(calls)
+    openai = _load_openai()
+    if isinstance(error, json.JSONDecodeError):
+        print(f"JSON decode error in batched explanation: {error}")
+        print(f"Content received: {content[:200]}")
+    elif isinstance(error, openai.error.AuthenticationError):
+        print("OpenAI API authentication failed - check API key")
+    elif isinstance(error, openai.error.RateLimitError):
+        print("OpenAI API rate limit exceeded")
+    else:
+        print(f"Error generating batched LLM explanation: {type(error).__name__}: {str(error)}")
+    return [(None, False)] * len(calls)
+
+
+def _explain_batch(calls):
+    """Return an (explanation, answered) pair per call from one completion.
+
+    On a request or decode failure every explanation is None.
+    """
+    prompt, max_tokens = _batch_prompt(calls)
+    content = None
+    try:
+        content = _chat_completion(prompt, max_tokens=max_tokens)
+        return _parse_batch(content, calls)
+    except Exception as e:
+        return _batch_failed(e, content, calls)
+
+
+async def _aexplain_batch(calls):
+    """``_explain_batch`` for asyncio callers."""
+    prompt, max_tokens = _batch_prompt(calls)
+    content = None
+    try:
+        content = await _achat_completion(prompt, max_tokens=max_tokens)
+        return _parse_batch(content, calls)
+    except Exception as e:
+        return _batch_failed(e, content, calls)
+
+
+def generate_fallback_field(field, drug, gene, phenotype, risk_label, variants):
+    """Generate a specific fallback field."""
+    variant_list = ', '.join([v['rsid'] for v in variants]) if variants else 'none'
+    
+    fallbacks = {
+        'summary': f"Patient has {phenotype} phenotype for {gene}, resulting in {risk_label} risk classification for {drug}. Genetic testing detected {len(variants)} variant(s) affecting drug metabolism.",
+        'mechanism': f"The {gene} gene encodes an enzyme critical for {drug} metabolism. The patient's {phenotype} phenotype indicates altered enzyme activity, which affects how the body processes this medication. This can lead to either reduced drug efficacy or increased risk of adverse effects.",
+        'variant_impact': f"Detected variants ({variant_list}) in {gene} contribute to the {phenotype} metabolizer status. These genetic variations alter enzyme function, directly impacting {drug} pharmacokinetics and clinical response."
+    }
+    
+    return fallbacks.get(field, f"Information about {field} not available.")
+
+
+def generate_fallback_explanation(patient_id, drug, risk_label, phenotype, variants, gene):
+    """Generate comprehensive fallback explanation when LLM is unavailable."""
+    variant_list = ', '.join([v['rsid'] for v in variants]) if variants else 'none detected'
+    
+    # Drug-specific mechanism information
+    drug_mechanisms = {
+        'CODEINE': f"{gene} converts codeine to morphine (active form). {phenotype} metabolizers may experience altered pain relief.",
+        'WARFARIN': f"{gene} metabolizes warfarin. {phenotype} status affects dosing requirements and bleeding risk.",
+        'CLOPIDOGREL': f"{gene} activates clopidogrel to its active form. {phenotype} metabolizers may have reduced antiplatelet effect.",
+        'SIMVASTATIN': f"{gene} transporter affects simvastatin uptake. {phenotype} status influences myopathy risk.",
+        'AZATHIOPRINE': f"{gene} metabolizes azathioprine. {phenotype} metabolizers have altered toxicity risk.",
+        'FLUOROURACIL': f"{gene} metabolizes fluorouracil. {phenotype} status significantly affects toxicity risk."
+    }
+    
+    mechanism = drug_mechanisms.get(drug, f"{gene} affects {drug} metabolism. {phenotype} status alters drug response.")
+    
+    return {
+        "summary": f"Genetic analysis reveals {phenotype} phenotype for {gene}, classifying {drug} risk as {risk_label}. This assessment is based on {len(variants)} detected variant(s) that affect drug metabolism and clinical response.",
+        "mechanism": mechanism,
+        "variant_impact": f"Variants identified: {variant_list}. These genetic variations in {gene} modify enzyme activity, leading to the {phenotype} metabolizer classification and corresponding {risk_label} risk profile for {drug} therapy."
     }
\ No newline at end of file
@@ -0,0 +1,225 @@
+# Per-stage request timing, Prometheus text metrics and one-off request profiling
+import io
+import os
+import tempfile
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+from .cache import private_directory, private_file
+
+# Histogram bucket upper bounds, in seconds
+STAGE_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+# Profile dumps written by ?profile=1; only the newest are kept
+PROFILE_DIR = os.getenv('PROFILE_DIR', os.path.join(tempfile.gettempdir(), 'pharmaguard', 'profiles'))
+PROFILE_KEEP = int(os.getenv('PROFILE_KEEP', 20))
+
+
+def _label_text(names, values):
+    if not names:
+        return ''
+    pairs = []
+    for name, value in zip(names, values):
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        pairs.append(f'{name}="{value}"')
+    return ','.join(pairs)
+
+
+class Counter:
+    """Monotonic counter with optional labels."""
+
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels[name] for name in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} counter']
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                labels = _label_text(self.labels, key)
+                lines.append(f'{self.name}{{{labels}}} {value}' if labels else f'{self.name} {value}')
+        return lines
+
+
+class Histogram:
+    """Cumulative-bucket histogram with optional labels, rendered in Prometheus text format."""
+
+    def __init__(self, name, help_text, labels=(), buckets=STAGE_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self._series = {}  # label values -> [bucket counts..., count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels[name] for name in self.labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += 1
+            series[-1] += value
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            for key, series in sorted(self._series.items()):
+                labels = _label_text(self.labels, key)
+                prefix = labels + ',' if labels else ''
+                for bound, count in zip(self.buckets, series):
+                    lines.append(f'{self.name}_bucket{{{prefix}le="{bound}"}} {count}')
+                lines.append(f'{self.name}_bucket{{{prefix}le="+Inf"}} {series[-2]}')
+                suffix = f'{{{labels}}}' if labels else ''
+                lines.append(f'{self.name}_count{suffix} {series[-2]}')
+                lines.append(f'{self.name}_sum{suffix} {series[-1]:.6f}')
+        return lines
+
+
+REQUESTS = Counter('pharmaguard_requests_total', 'Analysis requests by endpoint and status', ('endpoint', 'status'))
+STAGE_SECONDS = Histogram('pharmaguard_stage_seconds', 'Time spent in each /analyze stage', ('stage',))
+DRUG_SECONDS = Histogram('pharmaguard_drug_seconds',
+                         'Per-drug rules time and explanation latency in /analyze', ('drug', 'stage'))
+LLM_REQUESTS = Counter('pharmaguard_llm_requests_total',
+                       'OpenAI completion attempts by outcome (success, retry, error, throttled, short_circuit, coalesced)',
+                       ('outcome',))
+METRICS = (REQUESTS, STAGE_SECONDS, DRUG_SECONDS, LLM_REQUESTS)
+
+
+def render_metrics(extra=()):
+    """Return all metrics in Prometheus text format.
+
+    ``extra`` adds (name, type, help, {label values: value}, label names)
+    entries computed at scrape time, such as cache counters and hit
+    ratios. Metrics are per process, so each server worker reports its own.
+    """
+    lines = []
+    for metric in METRICS:
+        lines.extend(metric.render())
+    for name, metric_type, help_text, values, label_names in extra:
+        lines.extend([f'# HELP {name} {help_text}', f'# TYPE {name} {metric_type}'])
+        for key, value in sorted(values.items()):
+            labels = _label_text(label_names, key)
+            lines.append(f'{name}{{{labels}}} {value}' if labels else f'{name} {value}')
+    return '\n'.join(lines) + '\n'
+
+
+class StageTimer:
+    """Accumulates named stage durations for one request.
+
+    ``stage()`` times a block; ``lap()`` charges the time since the previous
+    lap to a stage, for stages that are only visible through callbacks
+    (rules and explanations interleave per sample).
+    """
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.stages = {}
+        self.drugs = []  # (drug, stage, seconds)
+        self.notes = {}
+        self._mark = self.start
+        self._phase_start = self.start
+        self._phase = None
+
+    def add(self, name, seconds):
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._mark = time.perf_counter()
+            self.add(name, self._mark - start)
+
+    def lap(self, stage, drug=None):
+        """Charge the time since the last lap to ``stage``; per drug, rules are incremental while
+        explanations (which run concurrently) are measured from the start of their phase."""
+        now = time.perf_counter()
+        if stage != self._phase:
+            self._phase, self._phase_start = stage, self._mark
+        self.add(stage, now - self._mark)
+        if drug is not None:
+            self.drugs.append((drug, stage, now - (self._mark if stage == 'rules' else self._phase_start)))
+        self._mark = now
+
+    def total(self):
+        return time.perf_counter() - self.start
+
+    def server_timing(self):
+        """``Server-Timing`` header value: one entry per stage plus the total, in milliseconds.
+
+        ``notes`` adds a description to a stage, e.g. whether the cache hit.
+        """
+        entries = []
+        for name, seconds in self.stages.items():
+            note = self.notes.get(name)
+            entries.append(f'{name};dur={seconds * 1000:.2f}' + (f';desc="{note}"' if note else ''))
+        entries.append(f'total;dur={self.total() * 1000:.2f}')
+        return ', '.join(entries)
+
+    def record(self):
+        """Add this request's timings to the process-wide histograms."""
+        for name, seconds in self.stages.items():
+            STAGE_SECONDS.observe(seconds, stage=name)
+        STAGE_SECONDS.observe(self.total(), stage='total')
+        for drug, stage, seconds in self.drugs:
+            DRUG_SECONDS.observe(seconds, drug=drug, stage=stage)
+
+
+@contextmanager
+def profiled(name, top=30):
+    """Profile the block with cProfile and write a pstats dump under ``PROFILE_DIR``.
+
+    Yields a dict that receives ``path`` (the dump, loadable with
+    ``pstats.Stats``) and ``summary`` (the top functions by cumulative
+    time). Only the calling thread is profiled. Dumps are private to this
+    user; if one cannot be written the error is logged and ``path`` is
+    left unset.
+    """
+    import cProfile
+    import pstats
+    info = {}
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield info
+    finally:
+        profiler.disable()
+        out = io.StringIO()
+        pstats.Stats(profiler, stream=out).sort_stats('cumulative').print_stats(top)
+        info['summary'] = out.getvalue()
+        path = os.path.join(PROFILE_DIR, f"{name}-{time.strftime('%Y%m%dT%H%M%S')}-{uuid.uuid4().hex[:6]}.prof")
+        try:
+            private_directory(PROFILE_DIR)
+            private_file(path)
+            profiler.dump_stats(path)
+        except OSError as e:
+            print(f"Could not write profile dump to {PROFILE_DIR}: {e}")
+        else:
+            info['path'] = path
+            _prune_profiles()
+
+
+def _prune_profiles():
+    try:
+        dumps = sorted((entry for entry in os.scandir(PROFILE_DIR) if entry.name.endswith('.prof')),
+                       key=lambda entry: entry.stat().st_mtime)
+        for entry in dumps[:-PROFILE_KEEP]:
+            os.unlink(entry.path)
+    except OSError as e:
+        print(f"Could not prune profile dumps: {e}")
@@ -0,0 +1,95 @@
+# Pharmacogene coordinate windows
+#
+# 1-based, inclusive windows that cover each target gene plus its upstream
+# promoter region, so that index-driven readers only touch the loci the
+# rules engine actually uses.
+from bisect import bisect_right
+
+DEFAULT_ASSEMBLY = 'GRCh38'
+
+PHARMACOGENE_REGIONS = {
+    'GRCh37': {
+        'CYP2D6': ('22', 42515000, 42535000),
+        'CYP2C19': ('10', 96515000, 96620000),
+        'CYP2C9': ('10', 96695000, 96755000),
+        'SLCO1B1': ('12', 21278000, 21398000),
+        'TPMT': ('6', 18125000, 18160000),
+        'DPYD': ('1', 97540000, 98390000)
+    },
+    'GRCh38': {
+        'CYP2D6': ('22', 42120000, 42140000),
+        'CYP2C19': ('10', 94755000, 94860000),
+        'CYP2C9': ('10', 94935000, 94995000),
+        'SLCO1B1': ('12', 21125000, 21245000),
+        'TPMT': ('6', 18125000, 18160000),
+        'DPYD': ('1', 97075000, 97925000)
+    }
+}
+
+# Header values that identify each assembly in ##reference / ##contig lines
+ASSEMBLY_ALIASES = {
+    'GRCh37': ('grch37', 'hg19', 'b37', 'hs37d5'),
+    'GRCh38': ('grch38', 'hg38', 'b38', 'hs38')
+}
+
+
+def detect_assembly(header_lines, default=DEFAULT_ASSEMBLY):
+    """Guess the reference assembly from VCF meta-information lines."""
+    for line in header_lines:
+        if not (line.startswith('##reference') or line.startswith('##contig') or line.startswith('##assembly')):
+            continue
+        lowered = line.lower()
+        for assembly, aliases in ASSEMBLY_ALIASES.items():
+            if any(alias in lowered for alias in aliases):
+                return assembly
+    return default
+
+
+def get_regions(assembly=DEFAULT_ASSEMBLY):
+    """Return the (chrom, start, end) windows for an assembly, sorted by locus."""
+    if assembly not in PHARMACOGENE_REGIONS:
+        raise ValueError(f"Unsupported assembly: {assembly}. Expected one of: {', '.join(PHARMACOGENE_REGIONS)}")
+    return sorted(PHARMACOGENE_REGIONS[assembly].values())
+
+
+def normalize_chrom(chrom):
+    """Strip a leading 'chr' so '22' and 'chr22' compare equal."""
+    return chrom[3:] if chrom.startswith('chr') else chrom
+
+
+class GeneIntervalIndex:
+    """Sorted per-chromosome interval arrays mapping (chrom, pos) to a gene.
+
+    Lookups are a single ``bisect`` over the interval starts for that
+    chromosome, so rejecting a record costs O(log n) in the number of genes.
+    """
+
+    def __init__(self, regions):
+        self._starts = {}
+        self._ends = {}
+        self._genes = {}
+        for gene, (chrom, start, end) in sorted(regions.items(), key=lambda item: item[1]):
+            chrom = normalize_chrom(chrom)
+            self._starts.setdefault(chrom, []).append(start)
+            self._ends.setdefault(chrom, []).append(end)
+            self._genes.setdefault(chrom, []).append(gene)
+
+    @property
+    def chromosomes(self):
+        return frozenset(self._starts)
+
+    def lookup(self, chrom, pos):
+        """Return the gene whose window contains ``pos``, or None."""
+        starts = self._starts.get(chrom)
+        if starts is None:
+            starts = self._starts.get(normalize_chrom(chrom))
+            if starts is None:
+                return None
+            chrom = normalize_chrom(chrom)
+        i = bisect_right(starts, pos) - 1
+        if i >= 0 and pos <= self._ends[chrom][i]:
+            return self._genes[chrom][i]
+        return None
+
+
+INTERVAL_INDEXES = {assembly: GeneIntervalIndex(regions) for assembly, regions in PHARMACOGENE_REGIONS.items()}
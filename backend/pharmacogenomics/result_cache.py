@@ -0,0 +1,159 @@
+# Whole-analysis result cache keyed on the pharmacogene variant fingerprint
+import asyncio
+import os
+import re
+from datetime import datetime
+
+from .analysis import arun_analysis, encode_json, new_patient_id, run_analysis
+from .cache import canonical_key, tiered_cache_from_env
+from .knowledge_base import KB
+from .llm_explainer import MODEL, explanation_cache_stats, generate_explanation, generate_fallback_explanation, llm_enabled
+from .metrics import StageTimer
+
+# Seconds a cached analysis stays valid; also the Cache-Control max-age
+RESULT_CACHE_TTL = float(os.getenv('RESULT_CACHE_TTL', 24 * 3600))
+
+# Results depend only on the filtered variants, drugs and knowledge-base
+# version, so resubmitted VCFs skip rules and LLM calls. Only patient_id and
+# timestamp are regenerated on a hit. Results are patient data, so they are
+# kept in memory only unless RESULT_CACHE_PATH names a SQLite file.
+RESULT_CACHE = tiered_cache_from_env('RESULT_CACHE', None, max_entries=256, ttl=RESULT_CACHE_TTL)
+
+_TIMESTAMP = re.compile(r'"timestamp":"[^"]*"')
+
+
+def _explanation_mode(explain):
+    """Which explainer actually produces the text: the LLM (per model) or the rule-based fallback."""
+    if explain is generate_explanation and llm_enabled():
+        return f'llm:{MODEL}'
+    return 'fallback'
+
+
+def result_cache_key(parse_result, drugs, explain=generate_explanation):
+    """Canonical fingerprint of everything an ``/analyze`` result depends on, except patient_id and time."""
+    genotypes = None
+    if parse_result['samples']:
+        genotypes = [parse_result[name].tolist() for name in ('genotypes', 'haplotypes', 'phase_sets')]
+    return canonical_key(
+        'analysis', KB.fingerprint, _explanation_mode(explain), list(drugs),
+        [variant.as_dict() for variant in parse_result['variants']], parse_result['missing_annotations'],
+        parse_result['samples'], genotypes
+    )
+
+
+def _iter_results(payload):
+    if isinstance(payload, dict) and 'samples' in payload:
+        for results in payload['samples'].values():
+            yield from _iter_results(results)
+    elif isinstance(payload, list):
+        yield from payload
+    else:
+        yield payload
+
+
+def _used_fallback(payload):
+    """True when an LLM-mode result fell back to rule-based text (LLM error or deadline)."""
+    for result in _iter_results(payload):
+        explanation = result.get('llm_generated_explanation')
+        if explanation is None:
+            continue
+        profile = result['pharmacogenomic_profile']
+        # detected_variants has the rsIDs and count the fallback text is built from
+        fallback = generate_fallback_explanation(
+            result['patient_id'], result['drug'], result['risk_assessment']['risk_label'], profile['phenotype'],
+            profile['detected_variants'], profile['primary_gene']
+        )
+        if explanation == fallback:
+            return True
+    return False
+
+
+def restore_result(entry):
+    """Return a cached entry's JSON body with a new patient ID (single-sample results) and timestamp."""
+    body = entry['body']
+    if entry['patient_id']:
+        body = body.replace(encode_json({'patient_id': entry['patient_id']})[1:-1],
+                            encode_json({'patient_id': new_patient_id()})[1:-1])
+    timestamp = encode_json({'timestamp': datetime.utcnow().isoformat() + 'Z'})[1:-1]
+    return _TIMESTAMP.sub(lambda m: timestamp, body)
+
+
+def cached_analysis(parse_result, drugs, explain=generate_explanation, timer=None):
+    """Return (encoded ``/analyze`` body, cache key, hit) for a parsed VCF.
+
+    On a miss the analysis runs and is stored unless an LLM-mode result
+    had to fall back to rule-based text, so degraded answers are retried.
+    An optional ``StageTimer`` receives the cache, rules, llm and encode
+    stages.
+    """
+    timer = timer or StageTimer()
+    with timer.stage('cache'):
+        key = result_cache_key(parse_result, drugs, explain)
+        entry = RESULT_CACHE.get(key)
+    if entry is not None:
+        timer.notes['cache'] = 'hit'
+        with timer.stage('encode'):
+            return restore_result(entry), key, True
+    timer.notes['cache'] = 'miss'
+
+    patient_id = None if len(parse_result['samples']) > 1 else new_patient_id()
+    payload = run_analysis(parse_result, drugs, explain, patient_id=patient_id,
+                           on_result=lambda result: timer.lap('rules', result['drug']),
+                           on_explanation=lambda result: timer.lap('llm', result['drug']))
+    # Anything after the last callback (e.g. assembling multi-sample payloads) counts as rules
+    timer.lap('rules')
+    with timer.stage('encode'):
+        body = encode_json(payload)
+    if _explanation_mode(explain) == 'fallback' or not _used_fallback(payload):
+        RESULT_CACHE.set(key, {'body': body, 'patient_id': patient_id})
+    return body, key, False
+
+
+async def acached_analysis(parse_result, drugs, explain=generate_explanation, timer=None, executor=None):
+    """``cached_analysis`` for asyncio callers.
+
+    Cache lookups, rules and encoding run in ``executor`` and explanations
+    are non-blocking completion requests (see ``arun_analysis``).
+    """
+    loop = asyncio.get_running_loop()
+    timer = timer or StageTimer()
+    with timer.stage('cache'):
+        key = result_cache_key(parse_result, drugs, explain)
+        entry = await loop.run_in_executor(executor, RESULT_CACHE.get, key)
+    if entry is not None:
+        timer.notes['cache'] = 'hit'
+        with timer.stage('encode'):
+            return restore_result(entry), key, True
+    timer.notes['cache'] = 'miss'
+
+    patient_id = None if len(parse_result['samples']) > 1 else new_patient_id()
+    payload = await arun_analysis(parse_result, drugs, explain, patient_id=patient_id, executor=executor,
+                                  on_result=lambda result: timer.lap('rules', result['drug']),
+                                  on_explanation=lambda result: timer.lap('llm', result['drug']))
+    timer.lap('rules')
+    with timer.stage('encode'):
+        body = await loop.run_in_executor(executor, encode_json, payload)
+    if _explanation_mode(explain) == 'fallback' or not _used_fallback(payload):
+        await loop.run_in_executor(executor, RESULT_CACHE.set, key, {'body': body, 'patient_id': patient_id})
+    return body, key, False
+
+
+def result_cache_stats():
+    """Return hit/miss counters for the result cache."""
+    return RESULT_CACHE.stats()
+
+
+def cache_metrics():
+    """Scrape-time cache lookup counters and hit ratios, as ``render_metrics`` extra entries."""
+    caches = {'explanation': explanation_cache_stats(), 'result': result_cache_stats()}
+    lookups = {}
+    for name, stats in caches.items():
+        lookups[name, 'memory_hit'] = stats['memory_hits']
+        lookups[name, 'disk_hit'] = stats['disk_hits']
+        lookups[name, 'miss'] = stats['misses']
+    return [
+        ('pharmaguard_cache_lookups_total', 'counter', 'Cache lookups by cache and outcome',
+         lookups, ('cache', 'result')),
+        ('pharmaguard_cache_hit_ratio', 'gauge', 'Share of cache lookups that hit',
+         {(name,): stats['hit_ratio'] for name, stats in caches.items()}, ('cache',))
+    ]
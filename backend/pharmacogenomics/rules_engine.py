@@ -1,82 +1,198 @@
-from .cpic_mappings import DRUG_GENE_MAP, RISK_MATRIX, CLINICAL_RECOMMENDATIONS, ALTERNATIVE_DRUGS
-
-def determine_phenotype(gene, star_alleles):
-    """Return phenotype based on star alleles using CPIC activity scores."""
-    if not star_alleles:
-        return 'Unknown'
-    
-    # Activity score mapping (simplified CPIC approach)
-    # No function = 0, Decreased = 0.5, Normal = 1, Increased = 2
-    activity_scores = {
-        'CYP2D6': {
-            '*1': 1, '*2': 1, '*4': 0, '*5': 0, '*6': 0, '*10': 0.5, 
-            '*17': 0.5, '*41': 0.5, '*1xN': 2, '*2xN': 2
-        },
-        'CYP2C19': {
-            '*1': 1, '*2': 0, '*3': 0, '*17': 1.5
-        },
-        'CYP2C9': {
-            '*1': 1, '*2': 0.5, '*3': 0.5
-        },
-        'SLCO1B1': {
-            '*1': 1, '*5': 0.5, '*15': 0.5, '*17': 0.5
-        },
-        'TPMT': {
-            '*1': 1, '*2': 0, '*3A': 0, '*3B': 0, '*3C': 0
-        },
-        'DPYD': {
-            '*1': 1, '*2A': 0, 'c.1679T>G': 0.5, 'c.2846A>T': 0.5
-        }
-    }
-    
-    gene_scores = activity_scores.get(gene, {})
-    total_score = 0
-    count = 0
-    
-    for allele in star_alleles:
-        score = gene_scores.get(allele, 1)  # Default to normal if unknown
-        total_score += score
-        count += 1
-    
-    if count == 0:
-        return 'Unknown'
-    
-    avg_score = total_score / count
-    
-    # Map activity score to phenotype
-    if avg_score == 0:
-        return 'PM'  # Poor Metabolizer
-    elif avg_score < 1:
-        return 'IM'  # Intermediate Metabolizer
-    elif avg_score == 1:
-        return 'NM'  # Normal Metabolizer
-    elif avg_score < 2:
-        return 'RM'  # Rapid Metabolizer
-    else:
-        return 'UM'  # Ultrarapid Metabolizer
-
-def assess_risk(drug, phenotype):
-    """Return risk label, severity, and clinical recommendation."""
-    if drug not in RISK_MATRIX:
-        return 'Unknown', 'unknown', 'No guideline available for this drug.', []
-    
-    mapping = RISK_MATRIX[drug]
-    risk_label = mapping.get(phenotype, 'Unknown')
-    
-    # Map risk to severity
-    severity_map = {
-        'Safe': 'none',
-        'Adjust Dosage': 'moderate',
-        'Toxic': 'high',
-        'Ineffective': 'moderate',
-        'Unknown': 'low'
-    }
-    severity = severity_map.get(risk_label, 'low')
-    
-    # Get clinical recommendation
-    recommendation = CLINICAL_RECOMMENDATIONS.get(drug, {}).get(phenotype, 'Consult CPIC guidelines.')
-    
-    # Get alternative drugs
-    alternatives = ALTERNATIVE_DRUGS.get(drug, [])
-    
-    return risk_label, severity, recommendation, alternatives
\ No newline at end of file
+import json
+from collections import namedtuple
+
+from .cpic_mappings import DRUG_GENE_MAP, RISK_MATRIX, CLINICAL_RECOMMENDATIONS, ALTERNATIVE_DRUGS
+from .knowledge_base import KB, PHENOTYPES
+
+# Activity scores per gene and allele (simplified CPIC approach), from the
+# knowledge base: No function = 0, Decreased = 0.5, Normal = 1, Increased = 2
+ACTIVITY_SCORES = KB.activity_scores
+
+DEFAULT_ACTIVITY_SCORE = KB.default_activity_score  # Unknown alleles are treated as normal function
+
+# Integer allele codes per gene. Code 0 is reserved for alleles missing from
+# the table (scored as normal function) and -1 pads ragged allele lists.
+ALLELE_PAD = -1
+ALLELE_CODES = KB.allele_codes
+WILD_TYPE = '*1'  # assumed for the second haplotype when only one allele is called
+_DIPLOTYPE_MATRICES = None
+
+
+def _diplotype_matrices():
+    """Per-gene (n, n) phenotype-code matrices, as numpy views of the knowledge base tables."""
+    global _DIPLOTYPE_MATRICES
+    if _DIPLOTYPE_MATRICES is None:
+        import numpy as np
+        _DIPLOTYPE_MATRICES = {
+            gene: np.frombuffer(matrix, dtype=np.int8).reshape(len(KB.score_tables[gene]), -1)
+            for gene, matrix in KB.diplotype_matrices.items()
+        }
+    return _DIPLOTYPE_MATRICES
+
+
+def diplotype_alleles(star_alleles):
+    """Return the two alleles of the reported diplotype: the first two called, or one plus wild type."""
+    if len(star_alleles) >= 2:
+        return star_alleles[0], star_alleles[1]
+    return star_alleles[0], WILD_TYPE
+
+
+def lookup_diplotype(gene, allele_a, allele_b):
+    """Return (activity score, phenotype) for a diplotype from the precomputed table."""
+    return KB.diplotype(gene, allele_a, allele_b)
+
+
+def determine_phenotype(gene, star_alleles):
+    """Return phenotype based on star alleles using CPIC activity scores."""
+    if not star_alleles:
+        return 'Unknown'
+    return lookup_diplotype(gene, *diplotype_alleles(star_alleles))[1]
+
+
+def encode_alleles(gene, allele_lists, width=None):
+    """Encode per-patient star-allele lists as an (N, width) int16 code matrix."""
+    import numpy as np
+    codes = ALLELE_CODES.get(gene, {})
+    width = width if width is not None else max((len(a) for a in allele_lists), default=0)
+    matrix = np.full((len(allele_lists), width), ALLELE_PAD, dtype=np.int16)
+    for row, alleles in enumerate(allele_lists):
+        matrix[row, :len(alleles)] = [codes.get(allele, 0) for allele in alleles]
+    return matrix
+
+
+def determine_phenotypes_batch(gene, allele_codes):
+    """Vectorized ``determine_phenotype`` over an (N, k) allele-code matrix.
+
+    Returns an int8 array of indexes into ``PHENOTYPES``. Each row's first
+    two called codes (or one plus wild type) index the gene's diplotype
+    matrix, so results are identical to calling the scalar function on
+    each row.
+    """
+    import numpy as np
+    allele_codes = np.asarray(allele_codes)
+    if allele_codes.shape[1] < 2:
+        padding = np.full((allele_codes.shape[0], 2 - allele_codes.shape[1]), ALLELE_PAD, dtype=allele_codes.dtype)
+        allele_codes = np.concatenate([allele_codes, padding], axis=1)
+
+    called = allele_codes != ALLELE_PAD
+    count = called.sum(axis=1)
+    matrix = _diplotype_matrices().get(gene)
+    if matrix is None:
+        _, phenotype = lookup_diplotype(gene, WILD_TYPE, WILD_TYPE)
+        return np.where(count == 0, 0, PHENOTYPES.index(phenotype)).astype(np.int8)
+
+    # Stable sort moves called codes to the front without reordering them
+    first_two = np.take_along_axis(allele_codes, np.argsort(~called, axis=1, kind='stable')[:, :2], axis=1)
+    first = np.where(count >= 1, first_two[:, 0], 0)
+    second = np.where(count >= 2, first_two[:, 1], ALLELE_CODES[gene].get(WILD_TYPE, 0))
+    return np.where(count == 0, 0, matrix[first, second]).astype(np.int8)
+
+
+def determine_phenotypes_cohort(allele_codes_by_gene):
+    """Run ``determine_phenotypes_batch`` for every gene in one call.
+
+    ``allele_codes_by_gene`` maps gene -> (N, k) code matrix; the result maps
+    gene -> array of phenotype labels.
+    """
+    import numpy as np
+    labels = np.array(PHENOTYPES, dtype=object)
+    return {
+        gene: labels[determine_phenotypes_batch(gene, codes)]
+        for gene, codes in allele_codes_by_gene.items()
+    }
+
+# Map risk to severity
+SEVERITY_MAP = KB.severity
+
+
+def encode_compact(obj):
+    """Encode JSON the way Flask's jsonify does in production (sorted, compact)."""
+    return json.dumps(obj, sort_keys=True, separators=(',', ':'))
+
+
+def _frozen_block(items, encoded):
+    return FrozenBlock(items, encoded=encoded)
+
+
+class FrozenBlock(dict):
+    """Read-only dict that carries its own pre-encoded compact JSON.
+
+    It still serializes like a plain dict, but response encoders can splice
+    ``encoded`` in directly instead of re-serializing it.
+    """
+
+    __slots__ = ('encoded',)
+
+    def __init__(self, items, encoded=None):
+        super().__init__(items)
+        self.encoded = encoded if encoded is not None else encode_compact(items)
+
+    def _readonly(self, *args, **kwargs):
+        raise TypeError('FrozenBlock is read-only')
+
+    __setitem__ = __delitem__ = clear = pop = popitem = setdefault = update = _readonly
+
+    def __reduce__(self):
+        return _frozen_block, (dict(self), self.encoded)
+
+
+class RiskDecision(namedtuple('RiskDecision', [
+        'risk_label', 'severity', 'recommendation', 'alternatives', 'clinical_recommendation', 'risk_tail'])):
+    """Precompiled outcome for one (drug, phenotype) pair."""
+
+    __slots__ = ()
+
+    def risk_assessment(self, confidence_score):
+        """Return the ``risk_assessment`` block; only the confidence is encoded per call."""
+        return FrozenBlock(
+            {'risk_label': self.risk_label, 'confidence_score': confidence_score, 'severity': self.severity},
+            encoded='{"confidence_score":' + json.dumps(confidence_score) + self.risk_tail
+        )
+
+
+def _compile_decision(risk_label, severity, recommendation, alternatives):
+    alternatives = tuple(alternatives)
+    clinical_recommendation = FrozenBlock({
+        'guideline_source': 'CPIC',
+        'recommendation': recommendation,
+        'alternative_drugs': alternatives
+    })
+    # Everything after the confidence score in the sorted, compact encoding
+    risk_tail = encode_compact({'risk_label': risk_label, 'severity': severity}).replace('{', ',', 1)
+    return RiskDecision(risk_label, severity, recommendation, alternatives, clinical_recommendation, risk_tail)
+
+
+def _compile_decision_table():
+    table = {}
+    for drug, mapping in RISK_MATRIX.items():
+        recommendations = CLINICAL_RECOMMENDATIONS.get(drug, {})
+        alternatives = ALTERNATIVE_DRUGS.get(drug, [])
+        for phenotype in set(PHENOTYPES) | set(mapping) | set(recommendations):
+            risk_label = mapping.get(phenotype, 'Unknown')
+            table[drug, phenotype] = _compile_decision(
+                risk_label,
+                SEVERITY_MAP.get(risk_label, 'low'),
+                recommendations.get(phenotype, 'Consult CPIC guidelines.'),
+                alternatives
+            )
+    return table
+
+
+# (drug, phenotype) -> RiskDecision, compiled once at import time
+DECISION_TABLE = _compile_decision_table()
+NO_GUIDELINE = _compile_decision('Unknown', 'unknown', 'No guideline available for this drug.', ())
+
+
+def lookup_decision(drug, phenotype):
+    """Return the precompiled ``RiskDecision`` for a drug and phenotype."""
+    decision = DECISION_TABLE.get((drug, phenotype))
+    if decision is not None:
+        return decision
+    if drug not in RISK_MATRIX:
+        return NO_GUIDELINE
+    return _compile_decision('Unknown', 'low', 'Consult CPIC guidelines.', ALTERNATIVE_DRUGS.get(drug, []))
+
+
+def assess_risk(drug, phenotype):
+    """Return risk label, severity, and clinical recommendation."""
+    return lookup_decision(drug, phenotype)[:4]
@@ -0,0 +1,152 @@
+# Phasing-aware star-allele calling from per-sample GT/PS
+#
+# Each gene's defining variants are numbered, so a haplotype is an integer
+# bitmask of the variants it carries and an allele definition is the mask
+# of the variants it needs: a definition matches when ``hap & mask == mask``.
+# Variants are identified by the single-variant allele they define (their
+# STAR annotation), which works for both pre-annotated and position-matched
+# files.
+from itertools import product
+
+from .allele_definitions import HAPLOTYPE_DEFINITIONS, RSID_INDEX, VARIANT_DEFINITIONS
+from .genotypes import FIRST, PHASED, SECOND
+from .knowledge_base import KB
+
+REFERENCE = '*1'
+
+# Unphased heterozygous blocks beyond this are not enumerated; they stay in
+# file order on the first haplotype's side, as without phasing
+MAX_PHASE_BLOCKS = 10
+
+
+class GeneDefinitions:
+    """Star-allele definitions of one gene as bitmasks over its defining variants.
+
+    ``activity`` maps alleles to their activity scores, used to prefer the
+    lower-function allele when two calls explain the variants equally well.
+    """
+
+    def __init__(self, single_alleles, haplotype_alleles, activity=None, default_activity=1.0):
+        self.activity = activity or {}
+        self.default_activity = default_activity
+        self.bits = {}
+        for star in single_alleles:
+            self.bits.setdefault(star, 1 << len(self.bits))
+        definitions = [(star, self.bits[star]) for star in self.bits if star != REFERENCE]
+        for star, variant_stars in haplotype_alleles:
+            mask = 0
+            for variant_star in variant_stars:
+                mask |= self.bits.setdefault(variant_star, 1 << len(self.bits))
+            definitions.append((star, mask))
+        # Most defining variants first, so the first contained definition is the most specific;
+        # among equally specific ones, the lowest activity (no function before normal)
+        self.definitions = sorted(definitions, key=lambda definition: (-bin(definition[1]).count('1'),
+                                                                       self.activity_of(definition[0])))
+
+    def activity_of(self, star):
+        return self.activity.get(star, self.default_activity)
+
+    def match(self, mask):
+        """Return (star allele, matched bits) for a haplotype mask; *1 when nothing matches."""
+        for star, definition in self.definitions:
+            if mask & definition == definition:
+                return star, definition
+        return REFERENCE, 0
+
+
+def _gene_definitions():
+    singles = {}
+    for _, gene, star, *_ in VARIANT_DEFINITIONS:
+        singles.setdefault(gene, []).append(star)
+    multi = {}
+    for gene, star, rsids in HAPLOTYPE_DEFINITIONS:
+        multi.setdefault(gene, []).append((star, tuple(RSID_INDEX[rsid][1] for rsid in rsids)))
+    multi_stars = {star for gene, star, _ in HAPLOTYPE_DEFINITIONS}
+    definitions = {}
+    for gene in set(singles) | set(multi) | set(KB.genes):
+        # Alleles scored in the knowledge base but without a variant
+        # definition here (e.g. CNVs) can still arrive as STAR annotations
+        codes = KB.allele_codes.get(gene, {})
+        extra = [star for star in codes if star not in multi_stars]
+        activity = {star: KB.score_tables[gene][code] for star, code in codes.items()}
+        definitions[gene] = GeneDefinitions(singles.get(gene, []) + extra, multi.get(gene, []), activity,
+                                            KB.default_activity_score)
+    return definitions
+
+
+GENE_DEFINITIONS = _gene_definitions()
+
+
+def _haplotype_masks(definitions, variants):
+    """Split a sample's variants into (fixed masks, phase blocks, unknown alleles).
+
+    Homozygous variants go on both haplotypes. Heterozygous variants with
+    a phased GT are grouped per phase set as [first, second] masks; each
+    unphased one is a block of its own. Alleles with no definition get
+    bits past the gene's own so they can still be reported.
+    """
+    fixed = [0, 0]
+    blocks = {}
+    unknown = {}
+    for v in variants:
+        star = v['star_allele']
+        bit = definitions.bits.get(star)
+        if bit is None:
+            bit = unknown.setdefault(star, 1 << (len(definitions.bits) + len(unknown)))
+        code = v.get('haplotypes')
+        if code is None or code < 0:
+            # No GT (sites-only VCF): a single unphased heterozygous call per record
+            code = FIRST | SECOND if v.get('dosage', 1) >= 2 else FIRST
+        if code & FIRST and code & SECOND:
+            fixed[0] |= bit
+            fixed[1] |= bit
+        elif code & PHASED:
+            block = blocks.setdefault(('ps', v.get('phase_set', 0)), [0, 0])
+            block[0 if code & FIRST else 1] |= bit
+        elif code & (FIRST | SECOND):
+            blocks[('het', len(blocks))] = [bit, 0]
+    return fixed, list(blocks.values()), unknown
+
+
+def _call(definitions, mask, unknown):
+    star, bits = definitions.match(mask)
+    if not bits:
+        for unknown_star, bit in unknown.items():
+            if mask & bit:
+                return unknown_star, bit
+    return star, bits
+
+
+def call_diplotype(gene, variants):
+    """Return the (allele, allele) diplotype for one sample's variants in ``gene``.
+
+    Variant dicts need ``star_allele`` and may carry ``haplotypes`` and
+    ``phase_set`` from ``sample_variants``; without them each record is an
+    unphased heterozygous call (or homozygous when ``dosage`` is 2). When
+    phase is unknown, every orientation of the phase blocks is tried and
+    the one whose calls explain the most variants wins, preferring fewer
+    non-reference haplotypes (so unphased *3B and *3C give *3A/*1) and then
+    the lower total activity score, so an orientation that hides a
+    no-function or decreased-function allele never wins a tie.
+    """
+    definitions = GENE_DEFINITIONS.get(gene) or GeneDefinitions([], [])
+    fixed, blocks, unknown = _haplotype_masks(definitions, variants)
+
+    best = None
+    orientations = product((False, True), repeat=max(len(blocks) - 1, 0)) \
+        if len(blocks) <= MAX_PHASE_BLOCKS else [(False,) * (len(blocks) - 1)]
+    for flips in orientations:
+        haplotypes = list(fixed)
+        for block, flip in zip(blocks, (False,) + tuple(flips)):
+            haplotypes[0] |= block[1] if flip else block[0]
+            haplotypes[1] |= block[0] if flip else block[1]
+        calls = [_call(definitions, mask, unknown) for mask in haplotypes]
+        score = (sum(bin(bits).count('1') for _, bits in calls), -sum(1 for _, bits in calls if bits),
+                 -sum(definitions.activity_of(star) for star, _ in calls))
+        if best is None or score > best[0]:
+            best = (score, calls)
+
+    first, second = (star for star, _ in best[1])
+    if first == REFERENCE and second != REFERENCE:
+        first, second = second, first
+    return first, second
@@ -0,0 +1,344 @@
+# BGZF random access and tabix/CSI index queries
+#
+# Minimal pure-Python implementation of the parts of the SAM/BAM/VCF
+# "hts" specification needed to fetch records for a handful of regions:
+# BGZF block decoding, .tbi and .csi index parsing, and bin/chunk lookup.
+import os
+import struct
+import zlib
+
+BGZF_HEADER = struct.Struct('<4BI2BH')
+BGZF_MAX_BLOCK = 64 * 1024  # the spec caps each block's uncompressed data (ISIZE)
+TBI_MAGIC = b'TBI\x01'
+CSI_MAGIC = b'CSI\x01'
+
+# Tabix indexes use a fixed binning scheme
+TBI_MIN_SHIFT = 14
+TBI_DEPTH = 5
+
+
+class VCFSizeLimitError(ValueError):
+    """Raised when a VCF stream grows past the configured size limit."""
+
+
+def check_size(total, max_size, label):
+    """Raise ``VCFSizeLimitError`` once ``total`` bytes exceed ``max_size`` (None for no limit)."""
+    if max_size is not None and total > max_size:
+        raise VCFSizeLimitError(f"{label} exceeds {max_size // (1024 * 1024)}MB size limit")
+
+
+def _open_binary(source):
+    """Return (file object, owned) for a path or an already open binary file."""
+    if isinstance(source, (str, os.PathLike)):
+        return open(source, 'rb'), True
+    return source, False
+
+
+class BgzfReader:
+    """Sequential line reader over a BGZF file that supports virtual-offset seeks.
+
+    ``max_size`` caps the compressed bytes read and ``max_uncompressed_size``
+    the bytes decompressed, counted over every block loaded (None for no limit).
+    """
+
+    def __init__(self, source, max_size=None, max_uncompressed_size=None):
+        self._file, self._owned = _open_binary(source)
+        self.max_size = max_size
+        self.max_uncompressed_size = max_uncompressed_size
+        self.bytes_read = 0
+        self.bytes_decompressed = 0
+        self._block_offset = 0
+        self._next_block_offset = 0
+        self._block = b''
+        self._within = 0
+
+    def close(self):
+        if self._owned:
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _load_block(self, offset):
+        self._file.seek(offset)
+        header = self._file.read(BGZF_HEADER.size)
+        if not header:
+            self._block_offset = self._next_block_offset = offset
+            self._block = b''
+            return False
+        if len(header) < BGZF_HEADER.size or header[:2] != b'\x1f\x8b':
+            raise ValueError("Invalid BGZF block header")
+        xlen = BGZF_HEADER.unpack(header)[-1]
+        extra = self._file.read(xlen)
+
+        # Locate the 'BC' subfield holding the total block size
+        block_size = None
+        pos = 0
+        while pos + 4 <= len(extra):
+            si1, si2, slen = extra[pos], extra[pos + 1], struct.unpack_from('<H', extra, pos + 2)[0]
+            if si1 == 66 and si2 == 67 and slen == 2:
+                block_size = struct.unpack_from('<H', extra, pos + 4)[0] + 1
+                break
+            pos += 4 + slen
+        if block_size is None:
+            raise ValueError("Not a BGZF file (missing BC extra field)")
+
+        cdata = self._file.read(block_size - BGZF_HEADER.size - xlen)
+        self.bytes_read += block_size
+        check_size(self.bytes_read, self.max_size, "VCF file")
+
+        # Inflate at most one block's worth, so a crafted block cannot expand without bound
+        block = zlib.decompressobj(-zlib.MAX_WBITS).decompress(cdata[:-8], BGZF_MAX_BLOCK + 1)
+        if len(block) > BGZF_MAX_BLOCK:
+            raise ValueError("Invalid BGZF block (more than 64KB uncompressed)")
+        self.bytes_decompressed += len(block)
+        check_size(self.bytes_decompressed, self.max_uncompressed_size, "Uncompressed VCF")
+        self._block = block
+        self._block_offset = offset
+        self._next_block_offset = offset + block_size
+        return True
+
+    def seek(self, virtual_offset):
+        """Seek to a virtual offset (compressed block offset << 16 | offset in block)."""
+        block_offset, within = virtual_offset >> 16, virtual_offset & 0xFFFF
+        if block_offset != self._block_offset or not self._block:
+            self._load_block(block_offset)
+        self._within = within
+
+    def tell(self):
+        """Return the current virtual offset."""
+        if self._within >= len(self._block) and self._block:
+            return self._next_block_offset << 16
+        return (self._block_offset << 16) | self._within
+
+    def readline(self):
+        """Return the next line as bytes (without the newline), or None at EOF."""
+        parts = []
+        while True:
+            if self._within >= len(self._block):
+                if not self._load_block(self._next_block_offset):
+                    return b''.join(parts) if parts else None
+                self._within = 0
+                if not self._block:
+                    # Empty EOF marker block
+                    continue
+            end = self._block.find(b'\n', self._within)
+            if end >= 0:
+                parts.append(self._block[self._within:end])
+                self._within = end + 1
+                return b''.join(parts)
+            parts.append(self._block[self._within:])
+            self._within = len(self._block)
+
+
+def reg2bins(beg, end, min_shift, depth):
+    """Return all bins overlapping the 0-based half-open interval [beg, end)."""
+    bins = []
+    end -= 1
+    shift = min_shift + depth * 3
+    offset = 0
+    for level in range(depth + 1):
+        bins.extend(range(offset + (beg >> shift), offset + (end >> shift) + 1))
+        shift -= 3
+        offset += 1 << (level * 3)
+    return bins
+
+
+def _read_bytes(source, max_size=None):
+    f, owned = _open_binary(source)
+    try:
+        data = f.read() if max_size is None else f.read(max_size + 1)
+    finally:
+        if owned:
+            f.close()
+    check_size(len(data), max_size, "Index file")
+    return data
+
+
+def _gunzip_members(data, max_size=None):
+    """Decompress a (possibly multi-member) gzip payload such as a BGZF index."""
+    out = []
+    total = 0
+    while data:
+        d = zlib.decompressobj(zlib.MAX_WBITS | 16)
+        # max_length 0 means unlimited; otherwise stop one byte past the cap
+        chunk = d.decompress(data, 0 if max_size is None else max_size + 1 - total)
+        total += len(chunk)
+        check_size(total, max_size, "Uncompressed index")
+        out.append(chunk)
+        data = d.unused_data
+    return b''.join(out)
+
+
+class TabixIndex:
+    """Parsed .tbi or .csi index, queryable by (chrom, start, end)."""
+
+    def __init__(self, min_shift, depth, names, bins, linear, meta_char, col_seq, col_beg):
+        self.min_shift = min_shift
+        self.depth = depth
+        self.names = names
+        self.bins = bins
+        self.linear = linear
+        self.meta_char = meta_char
+        self.col_seq = col_seq
+        self.col_beg = col_beg
+        self._ref_ids = {name: i for i, name in enumerate(names)}
+
+    @classmethod
+    def load(cls, source, max_size=None, max_uncompressed_size=None):
+        """Parse an index from a path or binary file, optionally capping its compressed and inflated size."""
+        data = _gunzip_members(_read_bytes(source, max_size), max_uncompressed_size)
+        if data[:4] == TBI_MAGIC:
+            return cls._parse_tbi(data)
+        if data[:4] == CSI_MAGIC:
+            return cls._parse_csi(data)
+        raise ValueError("Unrecognised index format (expected .tbi or .csi)")
+
+    @staticmethod
+    def _parse_names(data, pos):
+        fmt, col_seq, col_beg, col_end, meta, skip, l_nm = struct.unpack_from('<7i', data, pos)
+        pos += 28
+        names = [n.decode('utf-8') for n in data[pos:pos + l_nm].split(b'\x00') if n]
+        return names, chr(meta), col_seq, col_beg, pos + l_nm
+
+    @classmethod
+    def _parse_tbi(cls, data):
+        n_ref = struct.unpack_from('<i', data, 4)[0]
+        names, meta, col_seq, col_beg, pos = cls._parse_names(data, 8)
+        bins, linear = [], []
+        for _ in range(n_ref):
+            ref_bins = {}
+            n_bin = struct.unpack_from('<i', data, pos)[0]
+            pos += 4
+            for _ in range(n_bin):
+                bin_id, n_chunk = struct.unpack_from('<Ii', data, pos)
+                pos += 8
+                chunks = struct.unpack_from(f'<{2 * n_chunk}Q', data, pos)
+                pos += 16 * n_chunk
+                ref_bins[bin_id] = list(zip(chunks[::2], chunks[1::2]))
+            n_intv = struct.unpack_from('<i', data, pos)[0]
+            pos += 4
+            linear.append(struct.unpack_from(f'<{n_intv}Q', data, pos))
+            pos += 8 * n_intv
+            bins.append(ref_bins)
+        return cls(TBI_MIN_SHIFT, TBI_DEPTH, names, bins, linear, meta, col_seq, col_beg)
+
+    @classmethod
+    def _parse_csi(cls, data):
+        min_shift, depth, l_aux = struct.unpack_from('<3i', data, 4)
+        pos = 16
+        if l_aux >= 28:
+            names, meta, col_seq, col_beg, _ = cls._parse_names(data, pos)
+        else:
+            names, meta, col_seq, col_beg = [], '#', 1, 2
+        pos += l_aux
+        n_ref = struct.unpack_from('<i', data, pos)[0]
+        pos += 4
+        bins = []
+        for _ in range(n_ref):
+            ref_bins = {}
+            n_bin = struct.unpack_from('<i', data, pos)[0]
+            pos += 4
+            for _ in range(n_bin):
+                bin_id, _loffset, n_chunk = struct.unpack_from('<IQi', data, pos)
+                pos += 16
+                chunks = struct.unpack_from(f'<{2 * n_chunk}Q', data, pos)
+                pos += 16 * n_chunk
+                ref_bins[bin_id] = list(zip(chunks[::2], chunks[1::2]))
+            bins.append(ref_bins)
+        return cls(min_shift, depth, names, bins, [()] * n_ref, meta, col_seq, col_beg)
+
+    def set_names(self, names):
+        """Supply reference names for CSI indexes that do not embed them (bcftools)."""
+        self.names = list(names)
+        self._ref_ids = {name: i for i, name in enumerate(self.names)}
+
+    def resolve_name(self, chrom):
+        """Map a chromosome name to the spelling used in the index ('22' vs 'chr22')."""
+        for candidate in (chrom, f'chr{chrom}', chrom[3:] if chrom.startswith('chr') else None):
+            if candidate in self._ref_ids:
+                return candidate
+        return None
+
+    def chunks(self, chrom, start, end):
+        """Return merged (begin, end) virtual-offset chunks for a 1-based inclusive region."""
+        name = self.resolve_name(chrom)
+        if name is None:
+            return []
+        ref_id = self._ref_ids[name]
+        ref_bins = self.bins[ref_id]
+        beg0 = max(start - 1, 0)
+
+        # Linear index gives a lower bound on the file offset for .tbi files
+        linear = self.linear[ref_id]
+        window = beg0 >> TBI_MIN_SHIFT
+        min_offset = linear[min(window, len(linear) - 1)] if linear else 0
+
+        found = []
+        for bin_id in reg2bins(beg0, end, self.min_shift, self.depth):
+            for chunk_beg, chunk_end in ref_bins.get(bin_id, ()):
+                if chunk_end > min_offset:
+                    found.append((max(chunk_beg, min_offset), chunk_end))
+        found.sort()
+
+        merged = []
+        for chunk_beg, chunk_end in found:
+            if merged and chunk_beg <= merged[-1][1]:
+                if chunk_end > merged[-1][1]:
+                    merged[-1] = (merged[-1][0], chunk_end)
+            else:
+                merged.append((chunk_beg, chunk_end))
+        return merged
+
+
+def find_index(vcf_path):
+    """Return the path of a .tbi or .csi index sitting next to ``vcf_path``, if any."""
+    for suffix in ('.tbi', '.csi'):
+        candidate = f'{vcf_path}{suffix}'
+        if os.path.exists(candidate):
+            return candidate
+    return None
+
+
+def read_header(reader):
+    """Yield the '#'-prefixed header lines from the start of a BGZF VCF."""
+    reader.seek(0)
+    while True:
+        line = reader.readline()
+        if line is None or not line.startswith(b'#'):
+            return
+        yield line
+
+
+def fetch(reader, index, regions):
+    """Yield data lines overlapping any of the (chrom, start, end) regions.
+
+    Only the BGZF blocks referenced by the index chunks are decompressed.
+    Each record is yielded at most once even if regions overlap.
+    """
+    emitted = set()
+    col_seq, col_beg = index.col_seq - 1, index.col_beg - 1
+    for chrom, start, end in regions:
+        name = index.resolve_name(chrom)
+        for chunk_beg, chunk_end in index.chunks(chrom, start, end):
+            reader.seek(chunk_beg)
+            while reader.tell() < chunk_end:
+                offset = reader.tell()
+                line = reader.readline()
+                if line is None:
+                    break
+                if not line or line.startswith(b'#'):
+                    continue
+                fields = line.split(b'\t', col_beg + 1)
+                if fields[col_seq].decode('utf-8') != name:
+                    continue
+                pos = int(fields[col_beg])
+                if pos > end:
+                    break
+                if pos < start or offset in emitted:
+                    continue
+                emitted.add(offset)
+                yield line
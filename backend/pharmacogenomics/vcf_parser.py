@@ -1,81 +1,349 @@
-import os
-
-TARGET_GENES = ['CYP2D6', 'CYP2C19', 'CYP2C9', 'SLCO1B1', 'TPMT', 'DPYD']
-
-def parse_vcf(file_path):
-    """Parse VCF v4.2 and return list of relevant pharmacogenomic variants."""
-    if not os.path.exists(file_path):
-        raise FileNotFoundError(f"VCF file not found: {file_path}")
-    
-    file_size = os.path.getsize(file_path)
-    if file_size > 5 * 1024 * 1024:  # 5MB limit
-        raise ValueError("VCF file exceeds 5MB size limit")
-    
-    variants = []
-    vcf_version = None
-    missing_annotations = False
-    
-    try:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            for line_num, line in enumerate(f, 1):
-                line = line.strip()
-                
-                # Parse header
-                if line.startswith('##'):
-                    if line.startswith('##fileformat='):
-                        vcf_version = line.split('=')[1]
-                    continue
-                
-                if line.startswith('#CHROM'):
-                    continue
-                
-                if not line:
-                    continue
-                
-                # Parse variant records
-                parts = line.split('\t')
-                if len(parts) < 8:
-                    continue
-                
-                chrom, pos, rsid, ref, alt, qual, filt, info = parts[:8]
-                
-                # Parse INFO field
-                info_dict = {}
-                for item in info.split(';'):
-                    if '=' in item:
-                        key, value = item.split('=', 1)
-                        info_dict[key] = value
-                
-                gene = info_dict.get('GENE', '')
-                
-                # Filter for target pharmacogenomic genes
-                if gene in TARGET_GENES:
-                    star_allele = info_dict.get('STAR', '')
-                    
-                    if not star_allele:
-                        missing_annotations = True
-                    
-                    variant = {
-                        'chrom': chrom,
-                        'pos': int(pos),
-                        'rsid': rsid if rsid != '.' else f"chr{chrom}:{pos}",
-                        'ref': ref,
-                        'alt': alt,
-                        'gene': gene,
-                        'star_allele': star_allele,
-                        'quality': float(qual) if qual != '.' else 0,
-                        'filter': filt
-                    }
-                    variants.append(variant)
-        
-        return {
-            'variants': variants,
-            'vcf_version': vcf_version,
-            'missing_annotations': missing_annotations,
-            'total_variants': len(variants)
-        }
-    
-    except UnicodeDecodeError:
-        raise ValueError("Invalid VCF file encoding. Expected UTF-8.")
-    except Exception as e:
-        raise ValueError(f"Error parsing VCF file: {str(e)}")
\ No newline at end of file
+# Pharmacogenomics Module
+import os
+import re
+import zlib
+from itertools import chain
+
+from .allele_definitions import lookup_star_allele
+from .genotypes import decode_genotypes
+from .knowledge_base import KB
+from .regions import INTERVAL_INDEXES, detect_assembly, get_regions
+from .tabix import BgzfReader, TabixIndex, VCFSizeLimitError, check_size, fetch, find_index, read_header
+
+TARGET_GENES = list(KB.genes)
+
+VCF_EXTENSIONS = ('.vcf', '.vcf.gz', '.vcf.bgz')
+
+MAX_VCF_SIZE = 5 * 1024 * 1024  # 5MB limit on bytes received (compressed size for .vcf.gz)
+MAX_UNCOMPRESSED_VCF_SIZE = 50 * 1024 * 1024  # 50MB limit on decompressed VCF text
+CHUNK_SIZE = 64 * 1024
+
+GZIP_MAGIC = b'\x1f\x8b'
+
+CONTIG_ID = re.compile(r'^##contig=<ID=([^,>]+)')
+
+
+def _iter_chunks(source):
+    """Yield raw chunks from a path, a file-like object or an iterable."""
+    if isinstance(source, (str, os.PathLike)):
+        if not os.path.exists(source):
+            raise FileNotFoundError(f"VCF file not found: {source}")
+        with open(source, 'rb') as f:
+            yield from _iter_chunks(f)
+        return
+
+    if isinstance(source, (bytes, bytearray)):
+        yield bytes(source)
+        return
+
+    read = getattr(source, 'read', None)
+    if read is not None:
+        while True:
+            chunk = read(CHUNK_SIZE)
+            if not chunk:
+                break
+            yield chunk
+        return
+
+    yield from source
+
+
+def _limit_size(chunks, max_size, label):
+    """Pass chunks through, raising once more than ``max_size`` bytes are seen."""
+    total = 0
+    for chunk in chunks:
+        if isinstance(chunk, str):
+            chunk = chunk.encode('utf-8')
+        total += len(chunk)
+        check_size(total, max_size, label)
+        yield chunk
+
+
+def _gunzip_chunks(chunks):
+    """Incrementally decompress gzip data, including multi-member BGZF files.
+
+    Output is produced in pieces of at most ``CHUNK_SIZE`` bytes so a highly
+    compressible block never expands into memory all at once.
+    """
+    decompressor = zlib.decompressobj(zlib.MAX_WBITS | 16)
+    in_member = False
+    for data in chunks:
+        while data:
+            in_member = True
+            out = decompressor.decompress(data, CHUNK_SIZE)
+            if out:
+                yield out
+            if decompressor.eof:
+                # BGZF is a series of concatenated gzip members
+                data = decompressor.unused_data
+                decompressor = zlib.decompressobj(zlib.MAX_WBITS | 16)
+                in_member = False
+            else:
+                data = decompressor.unconsumed_tail
+
+    if in_member and not decompressor.eof:
+        raise ValueError("Truncated gzip stream")
+
+
+def _iter_lines(source, max_size=MAX_VCF_SIZE, max_uncompressed_size=MAX_UNCOMPRESSED_VCF_SIZE):
+    """Split a chunked source into raw byte lines, holding at most one chunk.
+
+    Gzip/BGZF input is detected from its magic bytes and decompressed on the
+    fly. ``max_size`` caps the bytes read from the source and
+    ``max_uncompressed_size`` caps the decompressed text.
+    """
+    chunks = _limit_size(_iter_chunks(source), max_size, "VCF file")
+
+    # Peek at the first bytes to detect compression
+    head = b''
+    for chunk in chunks:
+        head += chunk
+        if len(head) >= len(GZIP_MAGIC):
+            break
+    chunks = chain([head], chunks)
+    if head.startswith(GZIP_MAGIC):
+        chunks = _limit_size(_gunzip_chunks(chunks), max_uncompressed_size, "Uncompressed VCF")
+
+    pending = b''
+    for chunk in chunks:
+        lines = (pending + chunk).split(b'\n')
+        pending = lines.pop()
+        yield from lines
+
+    if pending:
+        yield pending
+
+
+# Fields a VariantRecord exposes as a read-only mapping, in output order
+VARIANT_FIELDS = ('chrom', 'pos', 'rsid', 'ref', 'alt', 'gene', 'star_allele', 'quality', 'filter')
+
+
+class VariantRecord:
+    """Compact pharmacogenomic variant emitted by the fast-path tokenizer.
+
+    Records read like the variant dicts used downstream (``record['gene']``,
+    ``record.get('rsid')``, ``dict(record, dosage=1)``), so they stay
+    objects until ``as_dict`` at a JSON boundary.
+    """
+
+    __slots__ = ('chrom', 'pos', 'rsid', 'ref', 'alt', 'gene', 'star_allele', 'quality', 'filter', 'genotypes',
+                 'alt_index')
+
+    def __init__(self, chrom, pos, rsid, ref, alt, gene, star_allele, quality, filter, genotypes=None,
+                 alt_index=None):
+        self.chrom = chrom
+        self.pos = pos
+        self.rsid = rsid
+        self.ref = ref
+        self.alt = alt
+        self.gene = gene
+        self.star_allele = star_allele
+        self.quality = quality
+        self.filter = filter
+        self.genotypes = genotypes  # raw FORMAT + sample columns, decoded on demand
+        self.alt_index = alt_index  # GT index of the defining ALT; None counts any non-reference allele
+
+    def keys(self):
+        return VARIANT_FIELDS
+
+    def __getitem__(self, key):
+        if key not in VARIANT_FIELDS:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def get(self, key, default=None):
+        return getattr(self, key) if key in VARIANT_FIELDS else default
+
+    def __eq__(self, other):
+        if not isinstance(other, VariantRecord):
+            return NotImplemented
+        return all(getattr(self, name) == getattr(other, name) for name in self.__slots__)
+
+    __hash__ = None
+
+    def __repr__(self):
+        return f"VariantRecord({self.as_dict()!r})"
+
+    def as_dict(self):
+        return {field: getattr(self, field) for field in VARIANT_FIELDS}
+
+
+def _info_value(info, key):
+    """Return the value for ``key`` (e.g. b'GENE=') in an INFO column without splitting it."""
+    start = 0
+    while True:
+        i = info.find(key, start)
+        if i < 0:
+            return b''
+        if i == 0 or info[i - 1] == 59:  # preceded by ';'
+            end = info.find(b';', i)
+            return info[i + len(key):end if end >= 0 else len(info)]
+        start = i + 1
+
+
+def _quality(qual):
+    return float(qual) if qual != b'.' else 0
+
+
+def iter_variant_records(lines, assembly=None, header=None):
+    """Yield ``VariantRecord`` objects from an iterable of raw VCF byte lines.
+
+    Records carrying a ``GENE`` INFO tag for a target gene are read from
+    their ``GENE``/``STAR`` tags, whether or not the header declares them;
+    in files that do declare ``GENE``, untagged records are skipped. Anything
+    else is annotated by position: the CHROM column is checked against the
+    pharmacogene chromosomes, the position against the interval index, and
+    only then is the record split and matched against the star-allele
+    definition table. Only kept records are decoded to ``str``.
+
+    ``header`` may be a dict that receives ``vcf_version``,
+    ``missing_annotations`` and the ``samples`` IDs as they are discovered.
+    """
+    if header is None:
+        header = {}
+    header.setdefault('vcf_version', None)
+    header.setdefault('missing_annotations', False)
+    header.setdefault('samples', [])
+    meta_lines = []
+    gene_tagged = False
+    target_genes = frozenset(gene.encode() for gene in TARGET_GENES)
+    intervals = None
+    chromosomes = None
+
+    for line in lines:
+        # Parse header
+        if line[:1] == b'#':
+            line = line.strip()
+            if line.startswith(b'##fileformat='):
+                header['vcf_version'] = line.split(b'=')[1].decode('utf-8')
+            elif line.startswith(b'##INFO=<ID=GENE,'):
+                gene_tagged = True
+            elif line.startswith(b'##'):
+                meta_lines.append(line.decode('utf-8'))
+            elif line.startswith(b'#CHROM'):
+                header['samples'] = [s.decode('utf-8') for s in line.split(b'\t')[9:]]
+            continue
+
+        if gene_tagged or b'GENE=' in line:
+            # Pre-annotated: read the record from its GENE/STAR tags
+            parts = line.rstrip().split(b'\t', 8)
+            if len(parts) < 8:
+                continue
+            gene = _info_value(parts[7], b'GENE=')
+            if gene in target_genes:
+                star_allele = _info_value(parts[7], b'STAR=').decode('utf-8')
+                if not star_allele:
+                    header['missing_annotations'] = True
+                chrom, pos, rsid = parts[0].decode('utf-8'), parts[1].decode('utf-8'), parts[2].decode('utf-8')
+                yield VariantRecord(chrom, int(pos), rsid if rsid != '.' else f"chr{chrom}:{pos}",
+                                    parts[3].decode('utf-8'), parts[4].decode('utf-8'), gene.decode('utf-8'),
+                                    star_allele, _quality(parts[5]), parts[6].decode('utf-8'),
+                                    parts[8] if len(parts) > 8 else None)
+                continue
+            if gene_tagged:
+                continue
+
+        if intervals is None:
+            assembly = assembly or detect_assembly(meta_lines)
+            intervals = INTERVAL_INDEXES[assembly]
+            chromosomes = frozenset(c.encode() for chrom in intervals.chromosomes for c in (chrom, f'chr{chrom}'))
+
+        # Reject records outside the pharmacogene windows up front
+        tab = line.find(b'\t')
+        if line[:tab] not in chromosomes:
+            continue
+        parts = line.split(b'\t', 8)
+        if len(parts) < 8:
+            continue
+        chrom = parts[0].decode('utf-8')
+        pos = int(parts[1])
+        gene = intervals.lookup(chrom, pos)
+        if gene is None:
+            continue
+
+        alt = parts[4].decode('utf-8')
+        match = lookup_star_allele(assembly, chrom, pos, parts[2].decode('utf-8'), alt.split(','))
+        if match is None:
+            continue
+        rsid, star_allele, alt_index = match
+        yield VariantRecord(chrom, pos, rsid, parts[3].decode('utf-8'), alt, gene, star_allele,
+                            _quality(parts[5]), parts[6].decode('utf-8'), parts[8] if len(parts) > 8 else None,
+                            alt_index)
+
+
+def parse_vcf(source, max_size=MAX_VCF_SIZE, max_uncompressed_size=MAX_UNCOMPRESSED_VCF_SIZE):
+    """Parse VCF v4.2 and return list of relevant pharmacogenomic variants.
+
+    ``source`` may be a file path, in-memory bytes, a binary or text stream
+    (such as an uploaded ``FileStorage.stream``) or any iterable of byte/str
+    chunks. Plain and gzip/BGZF-compressed input are both accepted. Records
+    are parsed incrementally as the data is read.
+    """
+    return _parse_lines(_iter_lines(source, max_size, max_uncompressed_size))
+
+
+def parse_indexed_vcf(source, index=None, assembly=None, max_size=MAX_VCF_SIZE,
+                      max_uncompressed_size=MAX_UNCOMPRESSED_VCF_SIZE):
+    """Parse only the pharmacogene regions of a BGZF-compressed, indexed VCF.
+
+    ``source`` is a path or seekable binary file and ``index`` the matching
+    .tbi/.csi path or file. When ``index`` is omitted it is looked up next to
+    ``source``. The assembly is detected from the header unless given, and
+    only the BGZF blocks overlapping the pharmacogene windows are decoded.
+    As with ``parse_vcf``, ``max_size`` caps the compressed bytes read (of
+    the VCF and, separately, the index) and ``max_uncompressed_size`` the
+    bytes they inflate to; pass None to lift a limit.
+    """
+    if index is None:
+        if not isinstance(source, (str, os.PathLike)):
+            raise ValueError("An index file is required when reading from a stream")
+        if not os.path.exists(source):
+            raise FileNotFoundError(f"VCF file not found: {source}")
+        index = find_index(source)
+        if index is None:
+            raise FileNotFoundError(f"No .tbi or .csi index found for: {source}")
+
+    tabix_index = TabixIndex.load(index, max_size, max_uncompressed_size)
+    with BgzfReader(source, max_size, max_uncompressed_size) as reader:
+        header = list(read_header(reader))
+        meta_lines = [line.decode('utf-8') for line in header]
+        if not tabix_index.names:
+            tabix_index.set_names(m.group(1) for m in map(CONTIG_ID.match, meta_lines) if m)
+
+        regions = get_regions(assembly or detect_assembly(meta_lines))
+        return _parse_lines(chain(header, fetch(reader, tabix_index, regions)), assembly)
+
+
+def _parse_lines(lines, assembly=None):
+    """Collect pharmacogenomic ``VariantRecord``s from an iterable of raw VCF lines.
+
+    When the file has sample columns, ``genotypes`` holds an int8
+    (variants x samples) matrix of non-reference allele dosages aligned with
+    ``variants`` and ``samples``, and ``haplotypes``/``phase_sets`` the
+    matching GT haplotype codes and PS values; otherwise they are None.
+    """
+    header = {}
+    try:
+        variants = list(iter_variant_records(lines, assembly, header))
+        samples = header['samples']
+        genotypes = haplotypes = phase_sets = None
+        if samples:
+            genotypes, haplotypes, phase_sets = decode_genotypes([r.genotypes for r in variants], len(samples),
+                                                                [r.alt_index for r in variants])
+        return {
+            'variants': variants,
+            'vcf_version': header['vcf_version'],
+            'missing_annotations': header['missing_annotations'],
+            'total_variants': len(variants),
+            'samples': samples,
+            'genotypes': genotypes,
+            'haplotypes': haplotypes,
+            'phase_sets': phase_sets
+        }
+
+    except (FileNotFoundError, VCFSizeLimitError):
+        raise
+    except UnicodeDecodeError:
+        raise ValueError("Invalid VCF file encoding. Expected UTF-8.")
+    except Exception as e:
+        raise ValueError(f"Error parsing VCF file: {str(e)}")
@@ -0,0 +1,78 @@
+# Writers for BGZF-compressed VCFs and their tabix indexes, for tests
+import gzip
+import struct
+import zlib
+
+BGZF_EOF = bytes.fromhex('1f8b08040000000000ff0600424302001b0003000000000000000000')
+
+
+def bgzf_block(data):
+    """One BGZF block (gzip member with the BC extra field) holding ``data``."""
+    deflate = zlib.compressobj(6, zlib.DEFLATED, -zlib.MAX_WBITS)
+    cdata = deflate.compress(data) + deflate.flush()
+    block_size = 18 + len(cdata) + 8
+    header = b'\x1f\x8b\x08\x04' + b'\x00' * 4 + b'\x00\xff' + struct.pack('<H', 6) + b'BC' + struct.pack('<HH', 2,
+                                                                                                          block_size - 1)
+    return header + cdata + struct.pack('<II', zlib.crc32(data), len(data))
+
+
+def bgzf_compress(lines, lines_per_block=16):
+    """Compress text lines into BGZF; return (bytes, virtual offset of each line, end virtual offset)."""
+    out = b''
+    offsets = []
+    for start in range(0, len(lines), lines_per_block):
+        data = b''
+        for line in lines[start:start + lines_per_block]:
+            offsets.append(len(out) << 16 | len(data))
+            data += line.encode('utf-8') + b'\n'
+        out += bgzf_block(data)
+    end = len(out) << 16
+    return out + BGZF_EOF, offsets, end
+
+
+def reg2bin(beg, end):
+    """Smallest tabix bin holding the 0-based half-open interval [beg, end)."""
+    end -= 1
+    for shift, offset in ((14, 4681), (17, 585), (20, 73), (23, 9), (26, 1)):
+        if beg >> shift == end >> shift:
+            return offset + (beg >> shift)
+    return 0
+
+
+def tabix_index(lines, offsets, end):
+    """Build a gzipped .tbi index for sorted VCF ``lines`` at the given virtual offsets."""
+    refs = {}
+    for i, line in enumerate(lines):
+        if line.startswith('#'):
+            continue
+        chrom, pos, _, ref = line.split('\t', 4)[:4]
+        beg = int(pos) - 1
+        chunk = (offsets[i], offsets[i + 1] if i + 1 < len(offsets) else end)
+        bins, linear = refs.setdefault(chrom, ({}, {}))
+        bins.setdefault(reg2bin(beg, beg + len(ref)), []).append(chunk)
+        for window in range(beg >> 14, (beg + len(ref) - 1 >> 14) + 1):
+            linear.setdefault(window, chunk[0])
+
+    names = b''.join(name.encode() + b'\x00' for name in refs)
+    data = b'TBI\x01' + struct.pack('<i', len(refs)) + struct.pack('<7i', 2, 1, 2, 0, ord('#'), 0, len(names)) + names
+    for bins, linear in refs.values():
+        data += struct.pack('<i', len(bins))
+        for bin_id, chunks in bins.items():
+            data += struct.pack('<Ii', bin_id, len(chunks))
+            data += b''.join(struct.pack('<QQ', beg, end) for beg, end in chunks)
+        windows = [linear.get(w, 0) for w in range(max(linear) + 1)]
+        # Empty windows take the next offset to their right
+        for w in range(len(windows) - 2, -1, -1):
+            if not windows[w]:
+                windows[w] = windows[w + 1]
+        data += struct.pack('<i', len(windows)) + b''.join(struct.pack('<Q', off) for off in windows)
+    return gzip.compress(data)
+
+
+def sorted_vcf_lines(text):
+    """Header lines followed by the records sorted by (chrom, pos), as tabix requires."""
+    lines = text.rstrip('\n').split('\n')
+    header = [line for line in lines if line.startswith('#')]
+    records = sorted((line for line in lines if not line.startswith('#')),
+                     key=lambda line: (line.split('\t', 1)[0], int(line.split('\t', 2)[1])))
+    return header + records
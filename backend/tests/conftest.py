@@ -0,0 +1,10 @@
+# Settings for the test run; must be applied before the package is imported
+import os
+
+# No API key (the empty value also keeps python-dotenv from loading one from
+# .env), and caches only in memory, so tests neither call OpenAI nor share
+# state through the temp directory
+os.environ['OPENAI_API_KEY'] = ''
+os.environ['EXPLANATION_CACHE_PATH'] = ''
+os.environ['RESULT_CACHE_PATH'] = ''
+os.environ['EXPLANATION_LOCK_DIR'] = ''
@@ -0,0 +1,215 @@
+import asyncio
+import os
+import stat
+import threading
+import time
+from concurrent.futures import Future
+from types import SimpleNamespace
+
+import pytest
+
+from pharmacogenomics import cache
+from pharmacogenomics.cache import FileLocks, LRUCache, SingleFlight, SQLiteCache, TieredCache, tiered_cache_from_env
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Controllable wall clock for the cache module's TTLs and access times."""
+    now = [1000000.0]
+
+    def tick(seconds=1):
+        now[0] += seconds
+
+    monkeypatch.setattr(cache, 'time', SimpleNamespace(time=lambda: now[0], monotonic=time.monotonic,
+                                                       sleep=time.sleep))
+    return tick
+
+
+@pytest.fixture
+def sqlite_cache(tmp_path):
+    def make(**kwargs):
+        store = SQLiteCache(str(tmp_path / 'store.sqlite3'), **kwargs)
+        store.EVICT_EVERY = 1
+        return store
+    return make
+
+
+def test_lru_evicts_least_recently_used(clock):
+    lru = LRUCache(max_entries=2)
+    lru.set('a', 1)
+    lru.set('b', 2)
+    assert lru.get('a') == 1  # b is now least recently used
+    lru.set('c', 3)
+
+    assert (lru.get('a'), lru.get('b'), lru.get('c')) == (1, None, 3)
+    assert len(lru) == 2
+
+
+def test_lru_entries_expire(clock):
+    lru = LRUCache(ttl=60)
+    lru.set('a', 1)
+    clock(59)
+    assert lru.get('a') == 1
+    clock(2)
+
+    assert lru.get('a') is None
+    assert len(lru) == 0
+
+
+def test_sqlite_evicts_least_recently_accessed(clock, sqlite_cache):
+    store = sqlite_cache(max_entries=2)
+    store.set('a', {'v': 1})
+    clock()
+    store.set('b', {'v': 2})
+    clock()
+    assert store.get('a') == {'v': 1}
+    clock()
+    store.set('c', {'v': 3})
+
+    assert (store.get('a'), store.get('b'), store.get('c')) == ({'v': 1}, None, {'v': 3})
+    assert len(store) == 2
+
+
+def test_sqlite_entries_expire_and_are_purged(clock, sqlite_cache):
+    store = sqlite_cache(ttl=60)
+    store.set('a', 1)
+    store.set('b', 2)
+    clock(61)
+
+    assert store.get('a') is None
+    store.set('c', 3)  # the eviction pass removes the other expired entry
+    assert len(store) == 1
+
+
+def test_sqlite_is_shared_between_instances(sqlite_cache):
+    sqlite_cache().set('a', [1, 2])
+
+    assert sqlite_cache().get('a') == [1, 2]
+
+
+def test_tiered_cache_promotes_disk_hits(sqlite_cache):
+    disk = sqlite_cache()
+    disk.set('a', 1)
+    tiered = TieredCache(LRUCache(), disk)
+
+    assert tiered.get('a') == 1
+    assert tiered.get('a') == 1
+    assert tiered.get('b') is None
+    assert tiered.stats() == {'hits': 2, 'memory_hits': 1, 'disk_hits': 1, 'misses': 1, 'hit_ratio': 0.6667,
+                              'memory_entries': 1}
+
+
+def test_single_flight_threads_share_the_leaders_value():
+    flights = SingleFlight()
+    computed = []
+    results = []
+    lock = threading.Lock()
+    started = threading.Barrier(8)
+
+    def caller():
+        started.wait()
+        flight = flights.claim('key')
+        if flight is None:
+            time.sleep(0.1)
+            computed.append(1)
+            flights.resolve('key', 'value')
+            value = 'value'
+        else:
+            value = flight.result(timeout=5)
+        with lock:
+            results.append(value)
+
+    threads = [threading.Thread(target=caller) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert computed == [1]
+    assert results == ['value'] * 8
+    assert flights.coalesced == 7
+    assert len(flights) == 0
+
+
+def test_single_flight_releases_the_key_on_resolve():
+    flights = SingleFlight()
+    assert flights.claim('key') is None
+    follower = flights.claim('key')
+    assert isinstance(follower, Future)
+    flights.resolve('key', None)
+
+    assert follower.result() is None
+    assert flights.claim('key') is None  # a new leader after release
+    flights.resolve('key', 1)
+
+
+def test_single_flight_coroutines_await_the_leader():
+    flights = SingleFlight()
+
+    async def caller():
+        flight = flights.claim('key')
+        if flight is None:
+            await asyncio.sleep(0.05)
+            flights.resolve('key', 42)
+            return 42
+        return await asyncio.wrap_future(flight)
+
+    async def run():
+        return await asyncio.gather(*(caller() for _ in range(5)))
+
+    assert asyncio.run(run()) == [42] * 5
+    assert flights.coalesced == 4
+
+
+def _mode(path):
+    return stat.S_IMODE(os.stat(path).st_mode)
+
+
+@pytest.mark.skipif(not hasattr(os, 'getuid'), reason='POSIX permissions')
+def test_sqlite_store_is_private(tmp_path):
+    directory = tmp_path / 'cache'
+    directory.mkdir(mode=0o755)
+    path = directory / 'store.sqlite3'
+    path.touch(mode=0o644)
+
+    SQLiteCache(str(path)).set('k', 1)
+
+    assert _mode(directory) == 0o700
+    assert {name: _mode(directory / name) for name in os.listdir(directory)} == {
+        'store.sqlite3': 0o600, 'store.sqlite3-wal': 0o600, 'store.sqlite3-shm': 0o600}
+
+
+@pytest.mark.skipif(not FileLocks.supported, reason='no flock')
+def test_lock_files_are_private(tmp_path):
+    locks = FileLocks(str(tmp_path / 'locks'))
+    handles, busy = locks.try_lock(['0123abcd'])
+    locks.release(handles)
+
+    assert busy == []
+    assert _mode(tmp_path / 'locks') == 0o700
+    assert [_mode(tmp_path / 'locks' / name) for name in os.listdir(tmp_path / 'locks')] == [0o600]
+
+
+@pytest.mark.skipif(not hasattr(os, 'getuid') or os.getuid() != 0, reason='needs root to chown')
+def test_directory_owned_by_another_user_is_refused(tmp_path, capsys):
+    directory = tmp_path / 'planted'
+    directory.mkdir(mode=0o777)
+    os.chown(directory, 65534, 65534)
+    cache = TieredCache(LRUCache(), SQLiteCache(str(directory / 'store.sqlite3')))
+
+    cache.set('k', 1)
+
+    assert 'owned by another user' in capsys.readouterr().out
+    assert os.listdir(directory) == []
+    assert cache.get('k') == 1  # still served from memory
+
+
+def test_disk_tier_is_opt_in_without_a_default_path(tmp_path, monkeypatch):
+    monkeypatch.delenv('TEST_CACHE_PATH', raising=False)
+    assert tiered_cache_from_env('TEST_CACHE', None).disk is None
+
+    monkeypatch.setenv('TEST_CACHE_PATH', str(tmp_path / 'store.sqlite3'))
+    assert tiered_cache_from_env('TEST_CACHE', None).disk.path == str(tmp_path / 'store.sqlite3')
+
+    monkeypatch.setenv('TEST_CACHE_PATH', '')
+    assert tiered_cache_from_env('TEST_CACHE', str(tmp_path / 'default.sqlite3')).disk is None
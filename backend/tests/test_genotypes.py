@@ -0,0 +1,29 @@
+import pytest
+
+from pharmacogenomics.genotypes import FIRST, MISSING, PHASED, SECOND, decode_genotypes, gt_dosage, gt_haplotypes
+
+
+@pytest.mark.parametrize('gt, alt_index, dosage', [
+    (b'0/1', None, 1), (b'1/1', 1, 2), (b'0/1', 1, 1),
+    (b'0/2', None, 1), (b'0/2', 1, 0), (b'0/2', 2, 1),
+    (b'1/2', 1, 1), (b'2/2', 2, 2), (b'2/2', 1, 0),
+    (b'./.', 2, MISSING), (b'2', 2, 1),
+])
+def test_dosage_counts_only_the_matched_alt(gt, alt_index, dosage):
+    assert gt_dosage(gt, alt_index) == dosage
+
+
+@pytest.mark.parametrize('gt, alt_index, code', [
+    (b'0|2', None, SECOND | PHASED), (b'0|2', 1, PHASED), (b'0|2', 2, SECOND | PHASED),
+    (b'1|2', 2, SECOND | PHASED), (b'2/1', 2, FIRST), (b'1|0', 1, FIRST | PHASED),
+])
+def test_haplotypes_mark_only_the_matched_alt(gt, alt_index, code):
+    assert gt_haplotypes(gt, alt_index) == code
+
+
+def test_decode_genotypes_uses_each_rows_alt_index():
+    columns = [b'GT\t0/2\t0/1\t2|2', b'GT\t0/2\t0/1\t2|2', None]
+    dosages, haplotypes, _ = decode_genotypes(columns, 3, [2, 1, None])
+
+    assert dosages.tolist() == [[1, 0, 2], [0, 1, 0], [MISSING] * 3]
+    assert haplotypes.tolist() == [[SECOND, 0, FIRST | SECOND | PHASED], [0, SECOND, PHASED], [MISSING] * 3]
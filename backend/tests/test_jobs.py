@@ -0,0 +1,74 @@
+import os
+import threading
+
+import pytest
+
+from pharmacogenomics.jobs import JobManager, JobQueueFull
+
+SAMPLE_VCF = os.path.join(os.path.dirname(__file__), '..', '..', 'sample_vcfs', 'sample1.vcf')
+
+
+def _blocking(release):
+    def fn(job):
+        release.wait(5)
+        return {'ok': True}
+    return fn
+
+
+def _wait_done(job):
+    while not job.closed:
+        job.wait_events(len(job.events), timeout=5)
+
+
+def test_submit_refuses_beyond_max_pending():
+    manager = JobManager(max_workers=1, max_pending=2)
+    release = threading.Event()
+    running = manager.submit(_blocking(release))
+    queued = manager.submit(_blocking(release))
+    with pytest.raises(JobQueueFull) as excinfo:
+        manager.submit(_blocking(release))
+    assert excinfo.value.retry_after > 0
+
+    release.set()
+    _wait_done(running)
+    _wait_done(queued)
+    # Finished jobs stay pollable but no longer count against the bound
+    job = manager.submit(lambda job: 'again')
+    _wait_done(job)
+    assert job.result == 'again'
+    assert manager.get(running.id).status == 'completed'
+
+
+def test_failed_jobs_release_their_slot():
+    manager = JobManager(max_workers=1, max_pending=1)
+
+    def boom(job):
+        raise ValueError('boom')
+
+    job = manager.submit(boom)
+    _wait_done(job)
+    assert job.status == 'failed'
+    job = manager.submit(lambda job: 'ok')
+    _wait_done(job)
+    assert job.status == 'completed'
+
+
+def test_post_jobs_returns_503_when_full(monkeypatch):
+    pytest.importorskip('flask')
+    import app as flask_app
+    manager = JobManager(max_workers=1, max_pending=1)
+    monkeypatch.setattr(flask_app, 'JOBS', manager)
+    release = threading.Event()
+    blocker = manager.submit(_blocking(release))
+    try:
+        with open(SAMPLE_VCF, 'rb') as vcf:
+            response = flask_app.app.test_client().post('/jobs', data={
+                'vcf': (vcf, 'sample1.vcf'),
+                'drugs': 'CODEINE'
+            })
+        assert response.status_code == 503
+        assert int(response.headers['Retry-After']) > 0
+        assert 'error' in response.get_json()
+    finally:
+        release.set()
+        _wait_done(blocker)
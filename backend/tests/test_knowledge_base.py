@@ -0,0 +1,151 @@
+import json
+import mmap
+import os
+import shutil
+import tempfile
+
+import pytest
+
+from pharmacogenomics import knowledge_base
+from pharmacogenomics.knowledge_base import (DATA_DIR, KnowledgeBaseError, compile_knowledge_base, load_knowledge_base,
+                                             read_cache, write_cache)
+
+
+@pytest.fixture
+def kb_dir(tmp_path):
+    directory = tmp_path / 'kb'
+    shutil.copytree(DATA_DIR, directory)
+    return directory
+
+
+def _edit(path, old, new):
+    text = path.read_text(encoding='utf-8')
+    assert old in text
+    path.write_text(text.replace(old, new, 1), encoding='utf-8')
+
+
+def _edit_json(path, change):
+    data = json.loads(path.read_text(encoding='utf-8'))
+    change(data)
+    path.write_text(json.dumps(data), encoding='utf-8')
+
+
+def test_bundled_tables_compile():
+    kb = compile_knowledge_base()
+
+    assert 'CODEINE' in kb.drugs
+    assert kb.diplotype('CYP2D6', '*4', '*4')[1] == 'PM'
+
+
+@pytest.mark.parametrize('edit, message', [
+    (lambda d: _edit(d / 'allele_functions.tsv', 'CYP2D6\t*4\t0\t', 'CYP2D6\t*4\tzero\t'), 'is not a number'),
+    (lambda d: _edit(d / 'allele_functions.tsv', 'CYP2D6\t*4\t0\t', 'CYP2D6\t*4\t-1\t'), 'must not be negative'),
+    (lambda d: _edit(d / 'allele_functions.tsv', '\tNo function', '\tBroken'), 'unknown function'),
+    (lambda d: _edit(d / 'allele_functions.tsv', 'CYP2D6\t*4\t0\t', 'CYP2D6\t*2\t0\t'), 'duplicate allele'),
+    (lambda d: _edit(d / 'allele_functions.tsv', 'CYP2D6\t*4\t0\t', 'CYP2D6\t*4\t'), 'expected 4 fields'),
+    (lambda d: _edit(d / 'allele_functions.tsv', '\tactivity_score\t', '\tscore\t'), 'missing column'),
+    (lambda d: _edit(d / 'phenotype_thresholds.tsv', '*\tPM\t', '*\tXM\t'), 'unknown phenotype'),
+    (lambda d: _edit(d / 'phenotype_thresholds.tsv', '*\tIM\t<\t', '*\tIM\t>\t'), 'comparison must be one of'),
+    (lambda d: _edit(d / 'phenotype_thresholds.tsv', '*\tIM\t<\t2', '*\tIM\t<\t-1'), 'must not decrease'),
+    (lambda d: _edit(d / 'phenotype_thresholds.tsv', '*\tPM\t', 'NOTAGENE\tPM\t<=\t0\nNOTAGENE\tNM\t*\t\n*\tPM\t'),
+     'unknown gene'),
+    (lambda d: _edit(d / 'recommendations.json', '"drugs"', '"drugs" "'), 'invalid JSON'),
+    (lambda d: _edit_json(d / 'recommendations.json', lambda data: data['drugs']['CODEINE'].update(gene='XYZ')),
+     'has no allele functions'),
+    (lambda d: _edit_json(d / 'recommendations.json', lambda data: data['drugs']['CODEINE']['phenotypes'].pop('PM')),
+     'missing phenotype'),
+    (lambda d: _edit_json(d / 'recommendations.json',
+                          lambda data: data['drugs']['CODEINE']['phenotypes']['PM'].update(risk='Fatal')),
+     'has no severity'),
+    (lambda d: _edit_json(d / 'cpic.json', lambda data: data.pop('recommendations')), "missing 'recommendations'"),
+])
+def test_malformed_tables_are_rejected(kb_dir, edit, message):
+    edit(kb_dir)
+
+    with pytest.raises(KnowledgeBaseError, match=message):
+        compile_knowledge_base(str(kb_dir))
+
+
+def test_cache_round_trip(tmp_path):
+    kb = compile_knowledge_base()
+    path = str(tmp_path / 'kb.bin')
+    write_cache(kb, path)
+
+    cached = read_cache(path, kb.digest)
+
+    assert cached is not None
+    assert isinstance(cached.score_tables['CYP2D6'], memoryview)
+    assert {gene: list(table) for gene, table in cached.score_tables.items()} == \
+        {gene: list(table) for gene, table in kb.score_tables.items()}
+    assert cached.drugs == kb.drugs
+    for gene in kb.genes:
+        assert cached.diplotype(gene, '*1', '*1') == kb.diplotype(gene, '*1', '*1')
+
+
+class _TrackedMmap(mmap.mmap):
+    opened = []
+
+    def __new__(cls, *args, **kwargs):
+        mapped = super().__new__(cls, *args, **kwargs)
+        cls.opened.append(mapped)
+        return mapped
+
+
+@pytest.fixture
+def tracked_mmap(monkeypatch):
+    _TrackedMmap.opened = []
+    monkeypatch.setattr(knowledge_base.mmap, 'mmap', _TrackedMmap)
+    return _TrackedMmap.opened
+
+
+def _rename_meta_key(key):
+    def damage(path):
+        data = open(path, 'rb').read()
+        assert data.count(key) == 1
+        with open(path, 'wb') as f:
+            f.write(data.replace(key, b'"' + b'x' * (len(key) - 2) + b'"'))
+    return damage
+
+
+@pytest.mark.parametrize('damage, digest', [
+    (None, '0' * 64),  # stale: tables changed since the cache was written
+    (_rename_meta_key(b'"kb"'), None),
+    (_rename_meta_key(b'"drugs"'), None),  # fails after the score views are taken
+    (lambda path: open(path, 'r+b').truncate(10), None),
+])
+def test_rejected_cache_is_unmapped(tmp_path, tracked_mmap, capsys, damage, digest):
+    kb = compile_knowledge_base()
+    path = str(tmp_path / 'kb.bin')
+    write_cache(kb, path)
+    if damage:
+        damage(path)
+
+    assert read_cache(path, digest or kb.digest) is None
+    assert len(tracked_mmap) == 1 and tracked_mmap[0].closed
+
+
+def test_accepted_cache_stays_mapped(tmp_path, tracked_mmap):
+    kb = compile_knowledge_base()
+    path = str(tmp_path / 'kb.bin')
+    write_cache(kb, path)
+
+    cached = read_cache(path, kb.digest)
+
+    assert not tracked_mmap[0].closed
+    assert cached.score_tables['CYP2D6'][0] == kb.score_tables['CYP2D6'][0]
+
+
+def test_cache_is_written_only_when_configured(tmp_path, monkeypatch):
+    monkeypatch.delenv('PHARMAGUARD_KB_CACHE', raising=False)
+    monkeypatch.setattr(tempfile, 'tempdir', str(tmp_path))
+
+    load_knowledge_base()
+    assert os.listdir(tmp_path) == []
+
+    cache_dir = tmp_path / 'kb-cache'
+    monkeypatch.setenv('PHARMAGUARD_KB_CACHE', str(cache_dir))
+    first = load_knowledge_base()
+    assert [name[:5] for name in os.listdir(cache_dir)] == ['cpic-']
+    second = load_knowledge_base()
+    assert isinstance(second.score_tables['CYP2D6'], memoryview)
+    assert second.fingerprint == first.fingerprint
@@ -0,0 +1,280 @@
+import asyncio
+import contextvars
+import types
+
+import pytest
+
+from pharmacogenomics import llm_client
+from pharmacogenomics.llm_client import CircuitBreaker, LLMClient, LLMUnavailable, TokenBucket
+
+
+class Clock:
+    """Stands in for the ``time`` module: monotonic() is fake and sleep() just advances it."""
+
+    def __init__(self):
+        self.now = 1000.0
+        self.sleeps = []
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+def _fake_errors():
+    """A stand-in for ``openai.error`` with the same class hierarchy (openai 0.28)."""
+    error = types.ModuleType('openai.error')
+
+    class OpenAIError(Exception):
+        def __init__(self, message=None, http_status=None, headers=None):
+            super().__init__(message)
+            self.http_status = http_status
+            self.headers = headers or {}
+
+    error.OpenAIError = OpenAIError
+    for name in ('APIError', 'TryAgain', 'Timeout', 'APIConnectionError', 'InvalidRequestError',
+                 'AuthenticationError', 'PermissionError', 'RateLimitError', 'ServiceUnavailableError'):
+        setattr(error, name, type(name, (OpenAIError,), {}))
+    return error
+
+
+class FakeOpenAI:
+    """The parts of the openai module LLMClient uses; ``outcomes`` are raised or returned in turn."""
+
+    def __init__(self):
+        self.error = _fake_errors()
+        self.outcomes = []
+        self.calls = []
+        self.aiosession = contextvars.ContextVar('aiohttp-session', default=None)
+        self.ChatCompletion = types.SimpleNamespace(create=self._create, acreate=self._acreate)
+
+    def _next(self, request):
+        self.calls.append(request)
+        outcome = self.outcomes.pop(0) if self.outcomes else {'choices': []}
+        if isinstance(outcome, BaseException):
+            raise outcome
+        return outcome
+
+    def _create(self, **request):
+        return self._next(request)
+
+    async def _acreate(self, **request):
+        outcome = self._next(request)
+        if isinstance(outcome, asyncio.Event):
+            await outcome.wait()
+        return outcome
+
+
+REQUEST = {'model': 'gpt-test', 'messages': [{'role': 'user', 'content': 'x' * 400}], 'max_tokens': 100}
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(llm_client, 'time', clock)
+    return clock
+
+
+@pytest.fixture
+def client(clock, monkeypatch):
+    monkeypatch.setattr(llm_client, 'LLM_BACKOFF_BASE', 0.5)
+    monkeypatch.setattr(llm_client, 'LLM_BACKOFF_MAX', 8)
+    # Always take the longest jittered backoff, so delays are predictable
+    monkeypatch.setattr(llm_client, 'random', types.SimpleNamespace(uniform=lambda low, high: high))
+    client = LLMClient('sk-test', rpm=60, tpm=6000, budget=20, max_retries=3)
+    client.breaker = CircuitBreaker(2, 30)
+    client._openai = FakeOpenAI()
+    client._aiohttp_session = lambda: None
+    return client
+
+
+# TokenBucket
+
+def test_bucket_waits_for_refill_and_refuses_past_max_wait(clock):
+    bucket = TokenBucket(60)  # one unit per second
+
+    assert bucket.reserve(60, max_wait=0) == 0
+    assert bucket.reserve(1, max_wait=0) is None
+    assert bucket.reserve(2, max_wait=5) == pytest.approx(2)
+    clock.now += 2
+    assert bucket.reserve(1, max_wait=0.5) is None  # the refill went to the earlier reservation
+    clock.now += 1
+    assert bucket.reserve(1, max_wait=0) == 0
+
+
+def test_bucket_refund_and_disabled_bucket(clock):
+    bucket = TokenBucket(60)
+    bucket.reserve(60, max_wait=0)
+    bucket.refund(1)
+    assert bucket.reserve(1, max_wait=0) == 0
+
+    assert TokenBucket(0).reserve(10 ** 9, max_wait=0) == 0
+
+
+# CircuitBreaker
+
+def test_breaker_opens_then_half_opens_then_closes(clock):
+    breaker = CircuitBreaker(2, 30)
+    breaker.failure()
+    assert breaker.allow() == 'closed'
+    breaker.failure()
+    assert breaker.state == 'open'
+    assert breaker.allow() is None
+
+    clock.now += 30
+    assert breaker.state == 'half-open'
+    assert breaker.allow() == 'probe'
+    assert breaker.allow() is None  # only one probe at a time
+    breaker.success()
+    assert breaker.state == 'closed'
+    assert breaker.allow() == 'closed'
+
+
+def test_failed_probe_reopens_breaker(clock):
+    breaker = CircuitBreaker(2, 30)
+    breaker.failure()
+    breaker.failure()
+    clock.now += 30
+    assert breaker.allow() == 'probe'
+    breaker.failure()
+    assert breaker.state == 'open'
+    clock.now += 29
+    assert breaker.allow() is None
+    clock.now += 1
+    assert breaker.allow() == 'probe'
+
+
+# LLMClient
+
+def _open_breaker(client, clock):
+    client.breaker.failure()
+    client.breaker.failure()
+    clock.now += client.breaker.cooldown
+    assert client.breaker.state == 'half-open'
+
+
+def test_retryable_status_is_retried_with_backoff(client, clock):
+    errors = client.openai.error
+    client.openai.outcomes = [errors.APIError('bad gateway', http_status=502), errors.RateLimitError('slow down'),
+                              {'choices': ['ok']}]
+
+    assert client.complete(REQUEST) == {'choices': ['ok']}
+    assert len(client.openai.calls) == 3
+    assert clock.sleeps == [0, 0.5, 1.0]  # admission, then backoff for attempts 0 and 1
+    assert client.breaker.failures == 0
+    # Each attempt's timeout is what is left of the budget
+    assert client.openai.calls[-1]['request_timeout'] == pytest.approx(20 - 1.5)
+
+
+def test_non_retryable_status_is_raised_at_once(client, clock):
+    errors = client.openai.error
+    client.openai.outcomes = [errors.APIError('bad request', http_status=400)]
+
+    with pytest.raises(errors.APIError):
+        client.complete(REQUEST)
+    assert len(client.openai.calls) == 1
+    assert client.breaker.failures == 1
+
+
+def test_exhausted_retries_trip_the_breaker(client, clock):
+    errors = client.openai.error
+    client.openai.outcomes = [errors.Timeout('timed out')] * 8
+
+    for _ in range(2):
+        with pytest.raises(errors.Timeout):
+            client.complete(REQUEST)
+    assert len(client.openai.calls) == 8  # max_retries=3, so four attempts each
+    assert client.breaker.state == 'open'
+
+    with pytest.raises(LLMUnavailable):
+        client.complete(REQUEST)
+    assert len(client.openai.calls) == 8
+
+
+@pytest.mark.parametrize('name', ['AuthenticationError', 'PermissionError', 'InvalidRequestError'])
+def test_request_errors_do_not_trip_the_breaker(client, clock, name):
+    error = getattr(client.openai.error, name)
+    client.openai.outcomes = [error('no')] * 3
+
+    for _ in range(3):
+        with pytest.raises(error):
+            client.complete(REQUEST)
+    assert len(client.openai.calls) == 3
+    assert client.breaker.state == 'closed'
+    assert client.breaker.failures == 0
+
+
+def test_retry_after_sets_a_floor_on_the_backoff(client, clock, monkeypatch):
+    monkeypatch.setattr(llm_client, 'random', types.SimpleNamespace(uniform=lambda low, high: low))
+    errors = client.openai.error
+    deadline = clock.now + 20
+
+    assert client._retry_delay(errors.RateLimitError('slow', headers={'retry-after': '5'}), 0, deadline) == 5
+    assert client._retry_delay(errors.RateLimitError('slow', headers={'retry-after': 'soon'}), 0, deadline) == 0
+    assert client._retry_delay(errors.RateLimitError('slow', headers={'retry-after': '20'}), 0, deadline) is None
+    assert client._retry_delay(errors.RateLimitError('slow'), 3, deadline) is None  # out of retries
+
+
+def test_throttle_beyond_the_budget_is_unavailable(client, clock):
+    client.requests_bucket.reserve(60, max_wait=0)  # the next request slot is a second away
+
+    client.budget = 0.5
+    with pytest.raises(LLMUnavailable):
+        client.complete(REQUEST)
+    assert client.openai.calls == []
+
+    client.budget = 20
+    client.complete(REQUEST)
+    assert clock.sleeps == [pytest.approx(1)]
+
+
+def test_tpm_rejection_refunds_the_request_slot(client, clock):
+    client.tokens_bucket.reserve(6000, max_wait=0)  # REQUEST's 200 tokens are two seconds away
+    client.budget = 1
+    level = client.requests_bucket.level
+
+    with pytest.raises(LLMUnavailable):
+        client.complete(REQUEST)
+    assert client.requests_bucket.level == level
+    assert client.openai.calls == []
+
+
+def test_throttled_probe_is_released(client, clock):
+    _open_breaker(client, clock)
+    client.tokens_bucket.reserve(6000, max_wait=0)
+    client.budget = 1
+
+    with pytest.raises(LLMUnavailable):
+        client.complete(REQUEST)
+    assert client.openai.calls == []
+    # The next caller may probe instead of waiting out another cooldown
+    assert client.breaker.allow() == 'probe'
+
+
+def test_cancelled_probe_is_released(client, clock):
+    _open_breaker(client, clock)
+
+    async def cancel_probe():
+        client.openai.outcomes = [asyncio.Event()]  # never set, so the request hangs
+        task = asyncio.ensure_future(client.acomplete(REQUEST))
+        while not client.openai.calls:
+            await asyncio.sleep(0)
+        assert client.breaker.allow() is None  # the probe is in flight
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(cancel_probe())
+    assert client.breaker.allow() == 'probe'
+
+
+def test_successful_probe_closes_the_breaker(client, clock):
+    _open_breaker(client, clock)
+
+    async def probe():
+        return await client.acomplete(REQUEST)
+
+    assert asyncio.run(probe()) == {'choices': []}
+    assert client.breaker.state == 'closed'
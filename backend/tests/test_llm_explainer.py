@@ -0,0 +1,142 @@
+import asyncio
+import json
+import threading
+import time
+
+import pytest
+
+from pharmacogenomics import llm_explainer
+from pharmacogenomics.llm_explainer import (EXPLANATION_CACHE, EXPLANATION_FLIGHTS, agenerate_explanation,
+                                            explanation_cache_key, generate_batch_explanations, generate_explanation)
+
+VARIANTS = [{'rsid': 'rs3892097', 'gene': 'CYP2D6', 'star_allele': '*4', 'quality': 99.0}]
+ARGS = ('PATIENT_TEST', 'CODEINE', 'Ineffective', 'PM', VARIANTS, 'CYP2D6')
+
+
+def _answer(drugs=None):
+    fields = {'summary': 'LLM summary', 'mechanism': 'LLM mechanism', 'variant_impact': 'LLM impact'}
+    return json.dumps({drug: fields for drug in drugs} if drugs else fields)
+
+
+@pytest.fixture
+def completions(monkeypatch):
+    """Count completions; each takes a moment so concurrent callers overlap."""
+    calls = []
+    lock = threading.Lock()
+
+    def complete(prompt, max_tokens):
+        with lock:
+            calls.append(prompt)
+        time.sleep(0.2)
+        return _answer(['CODEINE', 'CLOPIDOGREL'] if 'for EACH drug' in prompt else None)
+
+    async def acomplete(prompt, max_tokens):
+        await asyncio.sleep(0)
+        with lock:
+            calls.append(prompt)
+        await asyncio.sleep(0.2)
+        return _answer()
+
+    monkeypatch.setattr(llm_explainer, 'OPENAI_API_KEY', 'sk-test')
+    monkeypatch.setattr(llm_explainer, '_chat_completion', complete)
+    monkeypatch.setattr(llm_explainer, '_achat_completion', acomplete)
+    EXPLANATION_CACHE.memory.clear()
+    yield calls
+    EXPLANATION_CACHE.memory.clear()
+    assert len(EXPLANATION_FLIGHTS) == 0
+
+
+def test_concurrent_callers_share_one_completion(completions):
+    results = [None] * 8
+
+    def run(n):
+        results[n] = generate_explanation(*ARGS)
+
+    threads = [threading.Thread(target=run, args=(n,)) for n in range(len(results))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(completions) == 1
+    assert all(result['summary'] == 'LLM summary' for result in results)
+
+
+def test_concurrent_coroutines_share_one_completion(completions):
+    async def run():
+        return await asyncio.gather(*(agenerate_explanation(*ARGS) for _ in range(8)))
+
+    results = asyncio.run(run())
+
+    assert len(completions) == 1
+    assert all(result['summary'] == 'LLM summary' for result in results)
+
+
+def test_key_released_between_lookup_and_claim_is_not_explained_again(completions, monkeypatch):
+    # Another caller explains, caches and releases the key after this caller's
+    # cache lookup missed but before it claims the key
+    plan_batch = llm_explainer._plan_batch
+    state = {'raced': False}
+
+    def racing_plan(calls):
+        planned = plan_batch(calls)
+        if not state['raced']:
+            state['raced'] = True
+            generate_explanation(*ARGS)
+        return planned
+
+    monkeypatch.setattr(llm_explainer, '_plan_batch', racing_plan)
+
+    result = generate_explanation(*ARGS)
+
+    assert len(completions) == 1
+    assert result['summary'] == 'LLM summary'
+
+
+def test_cached_explanation_skips_the_llm(completions):
+    first = generate_explanation(*ARGS)
+    second = generate_explanation(*ARGS)
+
+    assert len(completions) == 1
+    assert second == first and second is not first
+
+
+def test_overlapping_batches_explain_each_drug_once(completions):
+    clopidogrel = ('PATIENT_TEST', 'CLOPIDOGREL', 'Ineffective', 'PM',
+                   [{'rsid': 'rs4244285', 'gene': 'CYP2C19', 'star_allele': '*2', 'quality': 99.0}], 'CYP2C19')
+    results = {}
+
+    def run(name, calls):
+        results[name] = generate_batch_explanations(calls)
+
+    threads = [threading.Thread(target=run, args=('single', [ARGS])),
+               threading.Thread(target=run, args=('batch', [ARGS, clopidogrel]))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(completions) <= 2
+    assert sum(prompt.count('CODEINE') > 0 for prompt in completions) == 1
+    assert results['single'][0]['summary'] == results['batch'][0]['summary'] == 'LLM summary'
+    assert results['batch'][1]['summary'] == 'LLM summary'
+
+
+def test_cache_key_ignores_quality_and_position():
+    other_run = [dict(VARIANTS[0], quality=37.5, chrom='22', pos=42524947)]
+
+    assert explanation_cache_key('CODEINE', 'Ineffective', 'PM', other_run, 'CYP2D6') == \
+        explanation_cache_key('CODEINE', 'Ineffective', 'PM', VARIANTS, 'CYP2D6')
+    assert explanation_cache_key('CODEINE', 'Ineffective', 'PM', [dict(VARIANTS[0], star_allele='*10')], 'CYP2D6') != \
+        explanation_cache_key('CODEINE', 'Ineffective', 'PM', VARIANTS, 'CYP2D6')
+
+
+def test_patients_with_the_same_alleles_share_a_completion(completions):
+    other_patient = ('PATIENT_OTHER', 'CODEINE', 'Ineffective', 'PM', [dict(VARIANTS[0], quality=41.0)], 'CYP2D6')
+
+    generate_explanation(*ARGS)
+    result = generate_explanation(*other_patient)
+
+    assert len(completions) == 1
+    assert 'quality' not in completions[0]
+    assert result['summary'] == 'LLM summary'
@@ -0,0 +1,46 @@
+import os
+import pstats
+import stat
+
+import pytest
+
+from pharmacogenomics import metrics
+from pharmacogenomics.metrics import profiled
+
+
+def _work():
+    return sum(i * i for i in range(1000))
+
+
+def test_profile_dump_is_private(monkeypatch, tmp_path):
+    profile_dir = tmp_path / 'profiles'
+    monkeypatch.setattr(metrics, 'PROFILE_DIR', str(profile_dir))
+
+    with profiled('test') as profile:
+        _work()
+
+    assert os.path.dirname(profile['path']) == str(profile_dir)
+    assert '_work' in profile['summary']
+    pstats.Stats(profile['path'])
+    if hasattr(os, 'getuid'):
+        assert stat.S_IMODE(profile_dir.stat().st_mode) == 0o700
+        assert stat.S_IMODE(os.stat(profile['path']).st_mode) == 0o600
+
+
+def test_unwritable_profile_dir_leaves_path_unset(monkeypatch, tmp_path):
+    blocker = tmp_path / 'not-a-directory'
+    blocker.write_text('')
+    monkeypatch.setattr(metrics, 'PROFILE_DIR', str(blocker / 'profiles'))
+
+    with profiled('test') as profile:
+        _work()
+
+    assert 'path' not in profile
+    assert '_work' in profile['summary']
+
+
+def test_block_errors_still_propagate(monkeypatch, tmp_path):
+    monkeypatch.setattr(metrics, 'PROFILE_DIR', str(tmp_path))
+    with pytest.raises(ValueError):
+        with profiled('test'):
+            raise ValueError('boom')
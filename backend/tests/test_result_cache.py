@@ -0,0 +1,169 @@
+import json
+import os
+
+import pytest
+
+from pharmacogenomics import llm_explainer, result_cache
+from pharmacogenomics.llm_explainer import EXPLANATION_CACHE, generate_explanation, generate_fallback_explanation
+from pharmacogenomics.result_cache import RESULT_CACHE, cached_analysis, restore_result, result_cache_key
+from pharmacogenomics.vcf_parser import parse_vcf
+
+SAMPLE_VCF = os.path.join(os.path.dirname(__file__), '..', '..', 'sample_vcfs', 'sample1.vcf')
+# Neither a target gene nor on a pharmacogene chromosome, so the parser drops them
+OFF_TARGET_LINES = [
+    '1\t12345\trs1000\tA\tG\t50\tPASS\tGENE=BRCA1;RS=rs1000',
+    '2\t67890\t.\tC\tT\t12\tLowQual\tAF=0.5',
+]
+
+
+@pytest.fixture(autouse=True)
+def empty_result_cache():
+    RESULT_CACHE.memory.clear()
+    yield
+    RESULT_CACHE.memory.clear()
+
+
+class FlaskClient:
+    def __init__(self):
+        pytest.importorskip('flask')
+        import app
+        self.client = app.app.test_client()
+
+    def analyze(self, vcf_path, drugs):
+        with open(vcf_path, 'rb') as vcf:
+            return self.client.post('/analyze', data={'vcf': (vcf, os.path.basename(vcf_path)), 'drugs': drugs})
+
+    def get(self, path, **headers):
+        return self.client.get(path, headers=headers)
+
+
+class ASGIClient:
+    def __init__(self):
+        testclient = pytest.importorskip('starlette.testclient')
+        import asgi
+        self.client = testclient.TestClient(asgi.app)
+
+    def analyze(self, vcf_path, drugs):
+        with open(vcf_path, 'rb') as vcf:
+            return self.client.post('/analyze', data={'drugs': drugs}, files={'vcf': (os.path.basename(vcf_path), vcf)})
+
+    def get(self, path, **headers):
+        return self.client.get(path, headers=headers)
+
+
+@pytest.fixture(params=[FlaskClient, ASGIClient], ids=['flask', 'asgi'])
+def client(request):
+    return request.param()
+
+
+def test_revalidating_a_cached_result(client):
+    analyzed = client.analyze(SAMPLE_VCF, 'CODEINE')
+    assert analyzed.status_code == 200
+    location, etag = analyzed.headers['Content-Location'], analyzed.headers['ETag']
+
+    fetched = client.get(location)
+    assert fetched.status_code == 200
+    assert fetched.headers['X-Cache'] == 'HIT'
+    assert client.get(location, **{'If-None-Match': etag}).status_code == 304
+    assert client.get(location, **{'If-None-Match': '*'}).status_code == 304
+    assert client.get(location, **{'If-None-Match': 'W/"other"'}).status_code == 200
+
+
+@pytest.mark.parametrize('if_none_match', [None, 'W/"{key}"', '"{key}"', '*'])
+def test_missing_result_is_404_whatever_the_validator(client, if_none_match):
+    analyzed = client.analyze(SAMPLE_VCF, 'CODEINE')
+    key = analyzed.headers['ETag'][3:-1]
+    RESULT_CACHE.memory.clear()  # as if evicted
+
+    headers = {} if if_none_match is None else {'If-None-Match': if_none_match.format(key=key)}
+    assert client.get(analyzed.headers['Content-Location'], **headers).status_code == 404
+    assert client.get('/results/unknown', **{'If-None-Match': '*'}).status_code == 404
+
+
+def _sample_lines():
+    with open(SAMPLE_VCF, encoding='utf-8') as vcf:
+        return vcf.read().splitlines()
+
+
+def _parse(lines):
+    return parse_vcf(('\n'.join(lines) + '\n').encode())
+
+
+def _results(body):
+    """Per-drug results of a single-sample body: a list, or one object for a single drug."""
+    results = json.loads(body)
+    return results if isinstance(results, list) else [results]
+
+
+def _without_volatile_fields(body):
+    results = _results(body)
+    for result in results:
+        del result['patient_id'], result['timestamp']
+    return results
+
+
+def test_key_ignores_off_target_lines():
+    lines = _sample_lines()
+    noisy = lines[:8] + OFF_TARGET_LINES[:1] + lines[8:] + OFF_TARGET_LINES[1:]
+
+    assert (result_cache_key(_parse(lines), ['CODEINE', 'WARFARIN'], generate_fallback_explanation)
+            == result_cache_key(_parse(noisy), ['CODEINE', 'WARFARIN'], generate_fallback_explanation))
+
+
+def test_key_depends_on_drug_order_and_knowledge_base(monkeypatch):
+    parse_result = _parse(_sample_lines())
+    key = result_cache_key(parse_result, ['CODEINE', 'WARFARIN'], generate_fallback_explanation)
+
+    assert result_cache_key(parse_result, ['WARFARIN', 'CODEINE'], generate_fallback_explanation) != key
+
+    class OtherKB:
+        fingerprint = 'other+000000000000'
+
+    monkeypatch.setattr(result_cache, 'KB', OtherKB)
+    assert result_cache_key(parse_result, ['CODEINE', 'WARFARIN'], generate_fallback_explanation) != key
+
+
+def test_hit_returns_same_body_with_new_patient_id_and_timestamp():
+    parse_result = _parse(_sample_lines())
+    body, key, hit = cached_analysis(parse_result, ['CODEINE', 'WARFARIN'], generate_fallback_explanation)
+    assert not hit
+
+    cached, cached_key, hit = cached_analysis(parse_result, ['CODEINE', 'WARFARIN'], generate_fallback_explanation)
+    assert hit and cached_key == key
+    assert _without_volatile_fields(cached) == _without_volatile_fields(body)
+    first, again = _results(body), _results(cached)
+    assert again[0]['patient_id'] != first[0]['patient_id']
+    assert {result['patient_id'] for result in again} == {again[0]['patient_id']}
+    assert _without_volatile_fields(restore_result(RESULT_CACHE.get(key))) == _without_volatile_fields(body)
+
+
+@pytest.fixture
+def llm_mode(monkeypatch):
+    """Enable LLM explanations; the completion is whatever the test sets in ``answer``."""
+    answer = {}
+
+    def complete(prompt, max_tokens):
+        if 'error' in answer:
+            raise answer['error']
+        return json.dumps({'summary': 'LLM summary', 'mechanism': 'LLM mechanism', 'variant_impact': 'LLM impact'})
+
+    monkeypatch.setattr(llm_explainer, 'OPENAI_API_KEY', 'sk-test')
+    monkeypatch.setattr(llm_explainer, '_chat_completion', complete)
+    EXPLANATION_CACHE.memory.clear()
+    yield answer
+    EXPLANATION_CACHE.memory.clear()
+
+
+def test_llm_result_that_fell_back_is_not_stored(llm_mode):
+    parse_result = _parse(_sample_lines())
+    llm_mode['error'] = RuntimeError('rate limited')
+
+    body, key, hit = cached_analysis(parse_result, ['CODEINE'], generate_explanation)
+    assert not hit
+    assert _results(body)[0]['llm_generated_explanation']['summary'] != 'LLM summary'
+    assert RESULT_CACHE.get(key) is None
+
+    del llm_mode['error']
+    body, key, hit = cached_analysis(parse_result, ['CODEINE'], generate_explanation)
+    assert _results(body)[0]['llm_generated_explanation']['summary'] == 'LLM summary'
+    assert RESULT_CACHE.get(key) is not None
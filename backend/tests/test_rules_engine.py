@@ -0,0 +1,83 @@
+import itertools
+
+import pytest
+
+from pharmacogenomics.knowledge_base import KB, PHENOTYPES
+from pharmacogenomics.rules_engine import (ACTIVITY_SCORES, determine_phenotype, determine_phenotypes_batch,
+                                           encode_alleles, lookup_diplotype)
+
+UNLISTED = '*99'  # not in allele_functions.tsv, so scored as normal function
+
+
+@pytest.mark.parametrize('score, phenotype', [
+    (0, 'PM'),
+    (0.5, 'IM'),
+    (1, 'IM'),
+    (1.5, 'IM'),
+    (2, 'NM'),
+    (2.5, 'RM'),
+    (3, 'RM'),
+    (4, 'UM'),
+    (6, 'UM'),
+])
+def test_default_thresholds(score, phenotype):
+    assert KB.phenotype_for_score('CYP2D6', score) == phenotype
+
+
+@pytest.mark.parametrize('gene, allele_a, allele_b, score, phenotype', [
+    ('CYP2D6', '*4', '*5', 0, 'PM'),
+    ('CYP2D6', '*1', '*4', 1, 'IM'),
+    ('CYP2D6', '*1', '*10', 1.5, 'IM'),
+    ('CYP2D6', '*1', '*2', 2, 'NM'),
+    ('CYP2D6', '*1xN', '*1', 3, 'RM'),
+    ('CYP2D6', '*1xN', '*2xN', 4, 'UM'),
+    ('CYP2D6', '*1xN', '*4', 2, 'NM'),
+    ('CYP2D6', UNLISTED, '*4', 1, 'IM'),
+    ('CYP2C19', '*2', '*3', 0, 'PM'),
+    ('CYP2C19', '*1', '*2', 1, 'IM'),
+    ('CYP2C19', '*17', '*2', 1.5, 'IM'),
+    ('CYP2C19', '*1', '*1', 2, 'NM'),
+    ('CYP2C19', '*17', '*1', 2.5, 'RM'),
+    ('CYP2C19', '*17', '*17', 3, 'RM'),
+    ('CYP2C19', UNLISTED, '*2', 1, 'IM'),
+    ('CYP2C9', '*2', '*3', 1, 'IM'),
+    ('CYP2C9', '*1', '*3', 1.5, 'IM'),
+    ('CYP2C9', '*1', '*1', 2, 'NM'),
+    ('CYP2C9', UNLISTED, UNLISTED, 2, 'NM'),
+    ('SLCO1B1', '*5', '*15', 1, 'IM'),
+    ('SLCO1B1', '*1', '*17', 1.5, 'IM'),
+    ('SLCO1B1', '*1', '*1', 2, 'NM'),
+    ('TPMT', '*2', '*3A', 0, 'PM'),
+    ('TPMT', '*1', '*3C', 1, 'IM'),
+    ('TPMT', '*1', '*1', 2, 'NM'),
+    ('TPMT', UNLISTED, '*3B', 1, 'IM'),
+    ('DPYD', '*2A', '*2A', 0, 'PM'),
+    ('DPYD', '*1', '*2A', 1, 'IM'),
+    ('DPYD', 'c.1679T>G', 'c.2846A>T', 1, 'IM'),
+    ('DPYD', '*1', 'c.1679T>G', 1.5, 'IM'),
+    ('DPYD', '*1', '*1', 2, 'NM'),
+    ('UNLISTED_GENE', '*1', '*2', 2, 'NM'),
+])
+def test_diplotype_boundaries(gene, allele_a, allele_b, score, phenotype):
+    assert lookup_diplotype(gene, allele_a, allele_b) == (score, phenotype)
+    assert lookup_diplotype(gene, allele_b, allele_a) == (score, phenotype)
+    assert determine_phenotype(gene, [allele_a, allele_b]) == phenotype
+
+
+def test_single_allele_pairs_with_wild_type():
+    assert determine_phenotype('CYP2D6', ['*4']) == 'IM'
+    assert determine_phenotype('CYP2D6', ['*1xN']) == 'RM'
+    assert determine_phenotype('CYP2D6', []) == 'Unknown'
+
+
+@pytest.mark.parametrize('gene', sorted(ACTIVITY_SCORES) + ['UNLISTED_GENE'])
+def test_batch_matches_scalar(gene):
+    alleles = sorted(ACTIVITY_SCORES.get(gene, {'*1': 1})) + [UNLISTED]
+    allele_lists = [[]] + [[allele] for allele in alleles]
+    allele_lists += [list(pair) for pair in itertools.product(alleles, repeat=2)]
+    allele_lists += [[alleles[0], alleles[-1], alleles[1]], [UNLISTED, alleles[0], alleles[-1]]]
+
+    batch = determine_phenotypes_batch(gene, encode_alleles(gene, allele_lists))
+
+    expected = [PHENOTYPES.index(determine_phenotype(gene, called)) for called in allele_lists]
+    assert batch.tolist() == expected
@@ -0,0 +1,62 @@
+import io
+
+import pytest
+
+from pharmacogenomics.analysis import sample_diplotypes
+from pharmacogenomics.genotypes import FIRST, PHASED, SECOND, sample_variants
+from pharmacogenomics.star_caller import call_diplotype
+from pharmacogenomics.vcf_parser import parse_vcf
+
+HET_FIRST, HET_SECOND, HOM = FIRST, SECOND, FIRST | SECOND
+
+
+def _variant(star, code=None, phase_set=0):
+    variant = {'star_allele': star}
+    if code is not None:
+        variant.update(haplotypes=code, phase_set=phase_set)
+    return variant
+
+
+@pytest.mark.parametrize('variants, diplotype', [
+    # *3B and *3C in cis make *3A; in trans they are two alleles
+    ([_variant('*3B', FIRST | PHASED), _variant('*3C', FIRST | PHASED)], ('*3A', '*1')),
+    ([_variant('*3B', FIRST | PHASED), _variant('*3C', SECOND | PHASED)], ('*3B', '*3C')),
+    # Different phase sets are not phased relative to each other, so the cis reading wins
+    ([_variant('*3B', FIRST | PHASED, 100), _variant('*3C', SECOND | PHASED, 200)], ('*3A', '*1')),
+    # Unphased: fewest non-reference haplotypes
+    ([_variant('*3B', HET_SECOND), _variant('*3C', HET_FIRST)], ('*3A', '*1')),
+    ([_variant('*3B'), _variant('*3C')], ('*3A', '*1')),
+    ([_variant('*3B', HOM), _variant('*3C', HOM)], ('*3A', '*3A')),
+])
+def test_phase_orientation(variants, diplotype):
+    assert call_diplotype('TPMT', variants) == diplotype
+
+
+@pytest.mark.parametrize('variants, diplotype', [
+    # Regression: a *4 carrier that is homozygous for the *2 SNV was called *2/*2 (normal metabolizer)
+    ([_variant('*2', HOM), _variant('*4', HET_SECOND)], ('*4', '*2')),
+    ([_variant('*2', HOM), _variant('*4', HET_FIRST | PHASED)], ('*4', '*2')),
+    # Three unphased hets: every orientation explains two, the no-function *4 is kept
+    ([_variant('*2'), _variant('*4'), _variant('*10')], ('*4', '*10')),
+    ([_variant('*2'), _variant('*4')], ('*2', '*4')),
+])
+def test_ties_keep_the_lower_function_allele(variants, diplotype):
+    assert call_diplotype('CYP2D6', variants) == diplotype
+
+
+def test_phased_vcf_calls_per_sample():
+    # S1: *3B|*3C in cis; S2: in trans; S3: unphased; S4: *2 homozygous with a *4 on one haplotype
+    text = ('##fileformat=VCFv4.2\n##reference=GRCh38\n'
+            '#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\tFORMAT\tS1\tS2\tS3\tS4\n'
+            '6\t18130687\t.\tT\tC\t99\tPASS\t.\tGT:PS\t1|0:7\t0|1:7\t0/1:.\t0|0:7\n'
+            '6\t18138997\t.\tC\tT\t99\tPASS\t.\tGT:PS\t1|0:7\t1|0:7\t1/0:.\t0|0:7\n'
+            '22\t42127941\t.\tG\tA\t99\tPASS\t.\tGT:PS\t0|0:9\t0|0:9\t0/0:.\t1|1:9\n'
+            '22\t42128945\t.\tC\tT\t99\tPASS\t.\tGT:PS\t0|0:9\t0|0:9\t0/0:.\t0|1:9\n')
+    result = parse_vcf(io.BytesIO(text.encode()))
+
+    calls = [sample_diplotypes(sample_variants(result['variants'], result['genotypes'], j, result['haplotypes'],
+                                               result['phase_sets']))
+             for j in range(len(result['samples']))]
+
+    assert calls == [{'TPMT': ('*3A', '*1')}, {'TPMT': ('*3B', '*3C')}, {'TPMT': ('*3A', '*1')},
+                     {'CYP2D6': ('*2', '*4')}]
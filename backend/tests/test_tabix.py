@@ -0,0 +1,89 @@
+import io
+
+import numpy as np
+import pytest
+
+from benchmarks.synth_vcf import generate_vcf
+from bgzf import BGZF_EOF, bgzf_block, bgzf_compress, sorted_vcf_lines, tabix_index
+from pharmacogenomics.vcf_parser import VCFSizeLimitError, parse_indexed_vcf, parse_vcf
+
+
+def _indexed(text, lines_per_block=16):
+    lines = sorted_vcf_lines(text)
+    data, offsets, end = bgzf_compress(lines, lines_per_block)
+    return lines, data, tabix_index(lines, offsets, end)
+
+
+def _assert_same_parse(result, expected):
+    assert result.keys() == expected.keys()
+    for key, value in expected.items():
+        if isinstance(value, np.ndarray):
+            np.testing.assert_array_equal(result[key], value)
+        else:
+            assert result[key] == value, key
+
+
+@pytest.mark.parametrize('annotated', [False, True])
+@pytest.mark.parametrize('assembly', ['GRCh37', 'GRCh38'])
+def test_indexed_fetch_matches_full_parse(annotated, assembly):
+    text = generate_vcf(records=3000, samples=4, density=0.05, seed=3, annotated=annotated, phased=True,
+                        assembly=assembly)
+    lines, data, index = _indexed(text)
+
+    expected = parse_vcf(io.BytesIO(('\n'.join(lines) + '\n').encode()))
+    result = parse_indexed_vcf(io.BytesIO(data), io.BytesIO(index))
+
+    assert expected['variants']
+    _assert_same_parse(result, expected)
+
+
+def test_indexed_fetch_reads_paths_and_finds_index(tmp_path):
+    lines, data, index = _indexed(generate_vcf(records=500, density=0.1, seed=1))
+    (tmp_path / 'in.vcf.gz').write_bytes(data)
+    (tmp_path / 'in.vcf.gz.tbi').write_bytes(index)
+
+    result = parse_indexed_vcf(str(tmp_path / 'in.vcf.gz'))
+
+    _assert_same_parse(result, parse_indexed_vcf(io.BytesIO(data), io.BytesIO(index)))
+    assert result['total_variants'] > 0
+
+
+def test_stream_without_index_is_rejected():
+    with pytest.raises(ValueError, match='index file is required'):
+        parse_indexed_vcf(io.BytesIO(b''))
+
+
+def test_indexed_compressed_size_cap():
+    # Wide genotype rows make the fetched blocks outweigh the index
+    _, data, index = _indexed(generate_vcf(records=1000, samples=100, density=0.2, seed=2), lines_per_block=4)
+    assert len(index) < 8192
+
+    with pytest.raises(VCFSizeLimitError, match='VCF file exceeds'):
+        parse_indexed_vcf(io.BytesIO(data), io.BytesIO(index), max_size=8192)
+
+
+def test_indexed_uncompressed_size_cap():
+    # Highly compressible padding in the header inflates far beyond its compressed size
+    lines, _, _ = _indexed(generate_vcf(records=200, density=0.1, seed=4))
+    lines[1:1] = ['##padding=' + 'A' * 60000] * 40
+    data, offsets, end = bgzf_compress(lines, lines_per_block=1)
+    index = tabix_index(lines, offsets, end)
+    assert len(data) < 1024 * 1024
+
+    with pytest.raises(VCFSizeLimitError, match='Uncompressed VCF exceeds'):
+        parse_indexed_vcf(io.BytesIO(data), io.BytesIO(index), max_size=1024 * 1024,
+                          max_uncompressed_size=1024 * 1024)
+
+
+def test_index_size_caps():
+    _, data, index = _indexed(generate_vcf(records=3000, density=0.05, seed=2))
+
+    with pytest.raises(VCFSizeLimitError, match='Index file exceeds'):
+        parse_indexed_vcf(io.BytesIO(data), io.BytesIO(index + b'\0' * 1024 * 1024), max_size=1024 * 1024)
+
+
+def test_oversized_bgzf_block_is_rejected():
+    block = bgzf_block(b'#' * (64 * 1024 + 1))
+
+    with pytest.raises(ValueError):
+        parse_indexed_vcf(io.BytesIO(block + BGZF_EOF), io.BytesIO(tabix_index([], [], 0)))
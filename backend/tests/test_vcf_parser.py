@@ -0,0 +1,71 @@
+import io
+import os
+
+import pytest
+
+from pharmacogenomics.vcf_parser import VariantRecord, iter_variant_records, parse_vcf
+
+SAMPLE_VCFS = os.path.join(os.path.dirname(__file__), '..', '..', 'sample_vcfs')
+
+HEADER = '##fileformat=VCFv4.2\n##reference=GRCh38\n#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\n'
+
+
+def _records(text):
+    return list(iter_variant_records(text.encode().splitlines(True)))
+
+
+@pytest.mark.parametrize('name', ['sample1', 'sample2', 'comprehensive'])
+def test_gene_tags_are_read_without_a_header_declaration(name):
+    with open(os.path.join(SAMPLE_VCFS, name + '.vcf'), 'rb') as f:
+        text = f.read()
+    undeclared = b''.join(line for line in text.splitlines(True) if not line.startswith(b'##INFO=<ID=GENE,'))
+
+    assert parse_vcf(io.BytesIO(undeclared)) == parse_vcf(io.BytesIO(text))
+
+
+def test_tagged_star_allele_is_not_replaced_by_the_definition_table():
+    # rs1142345 alone defines *3C, but the record's STAR tag says *3A
+    records = _records(HEADER + '6\t18130687\trs1142345\tT\tC\t99\tPASS\tGENE=TPMT;STAR=*3A\n')
+
+    assert [(r.gene, r.star_allele) for r in records] == [('TPMT', '*3A')]
+
+
+def test_untagged_records_are_matched_by_position_alongside_tagged_ones():
+    records = _records(HEADER + '6\t18130687\trs1142345\tT\tC\t99\tPASS\tGENE=TPMT;STAR=*3A\n'
+                                '22\t42128945\t.\tC\tT\t99\tPASS\tAF=0.1\n')
+
+    assert [(r.gene, r.star_allele, r.rsid) for r in records] == [('TPMT', '*3A', 'rs1142345'),
+                                                                  ('CYP2D6', '*4', 'rs3892097')]
+
+
+@pytest.mark.parametrize('alt, alt_index', [('T', 1), ('A,T', 2), ('T,A', 1)])
+def test_position_match_reports_the_defining_alt_index(alt, alt_index):
+    records = _records(HEADER + f'22\t42128945\t.\tC\t{alt}\t99\tPASS\tAF=0.1\n')
+
+    assert [(r.star_allele, r.alt_index) for r in records] == [('*4', alt_index)]
+
+
+def test_record_without_the_defining_alt_is_skipped():
+    assert _records(HEADER + '22\t42128945\t.\tC\tA\t99\tPASS\tAF=0.1\n') == []
+
+
+def test_parse_keeps_records_that_read_like_variant_dicts():
+    variants = parse_vcf(io.BytesIO((HEADER + '22\t42128945\trs3892097\tC\tT\t60\tPASS\tAF=0.1\n').encode()))['variants']
+    record = variants[0]
+
+    assert isinstance(record, VariantRecord)
+    assert record['star_allele'] == record.get('star_allele') == '*4'
+    assert record.get('dosage', 1) == 1
+    assert dict(record, dosage=2) == dict(record.as_dict(), dosage=2)
+    with pytest.raises(KeyError):
+        record['genotypes']
+
+
+def test_multiallelic_genotypes_count_the_defining_alt():
+    # rs3892097 (*4) is C>T; the sample carrying only the A allele is not a *4 carrier
+    text = (HEADER.replace('INFO\n', 'INFO\tFORMAT\tS1\tS2\tS3\n')
+            + '22\t42128945\t.\tC\tA,T\t99\tPASS\tAF=0.1\tGT\t0/1\t0/2\t1/2\n')
+
+    result = parse_vcf(io.BytesIO(text.encode()))
+
+    assert result['genotypes'].tolist() == [[0, 1, 1]]